@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟nuclei命令行的测试程序，供基准测试使用
+
+读取 -l 指定的目标文件，按环境变量配置输出JSONL结果和 -stats -sj 格式的统计信息:
+    FAKE_FINDINGS       每个目标输出的结果数（默认1）
+    FAKE_DELAY          每条结果之间的间隔秒数（默认0）
+    FAKE_RATE           每秒输出的结果数，设置后代替FAKE_DELAY（默认不限制）
+    FAKE_STARTUP        输出第一条结果前的启动耗时（秒，默认0）
+    FAKE_PAYLOAD        每条结果附加的响应内容字节数，用于模拟较大的结果（默认0）
+    FAKE_EXIT_CODE      退出码（默认0）
+    FAKE_FAILURE        失败方式（默认不失败）:
+                        exit     输出全部结果后以FAKE_EXIT_CODE（为0时使用1）退出
+                        crash    输出一半结果后进程被强制结束
+                        hang     输出一半结果后不再输出，直到被结束（用于测试超时）
+                        garbage  结果之间混入无法解析的行，正常退出
+    FAKE_FAILURE_RATIO  设置FAKE_FAILURE时失败的进程比例（默认1）
+"""
+import json
+import os
+import random
+import signal
+import sys
+import time
+
+SEVERITIES = ["info", "low", "medium", "high", "critical"]
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    targets = []
+    if "-l" in args:
+        with open(args[args.index("-l") + 1], 'r', encoding='utf-8') as f:
+            targets = [line.strip() for line in f if line.strip()]
+
+    per_target = int(os.environ.get("FAKE_FINDINGS", "1"))
+    delay = float(os.environ.get("FAKE_DELAY", "0"))
+    rate = float(os.environ.get("FAKE_RATE", "0"))
+    if rate > 0:
+        delay = 1 / rate
+    payload = "x" * int(os.environ.get("FAKE_PAYLOAD", "0"))
+    exit_code = int(os.environ.get("FAKE_EXIT_CODE", "0"))
+    failure = os.environ.get("FAKE_FAILURE", "")
+    if failure and random.random() >= float(os.environ.get("FAKE_FAILURE_RATIO", "1")):
+        failure = ""
+    total = len(targets) * per_target
+
+    time.sleep(float(os.environ.get("FAKE_STARTUP", "0")))
+
+    count = 0
+    for target in targets:
+        for i in range(per_target):
+            if failure in ("crash", "hang") and count >= total // 2:
+                sys.stdout.flush()
+                if failure == "hang":
+                    while True:
+                        time.sleep(3600)
+                if hasattr(signal, "SIGKILL"):
+                    os.kill(os.getpid(), signal.SIGKILL)
+                os._exit(137)
+            severity = SEVERITIES[count % len(SEVERITIES)]
+            finding = {
+                "template-id": f"fake-template-{count % 16}",
+                "type": "http",
+                "host": target,
+                "matched-at": f"{target}/path-{i}",
+                "severity": severity,
+                "info": {"name": "fake finding", "severity": severity, "description": "benchmark"}
+            }
+            if payload:
+                finding["response"] = payload
+            sys.stdout.write(json.dumps(finding) + "\n")
+            if failure == "garbage":
+                sys.stdout.write("[WRN] not a json line {\n")
+            count += 1
+            if delay:
+                sys.stdout.flush()
+                time.sleep(delay)
+        sys.stderr.write(json.dumps({"percent": str(int(count * 100 / max(total, 1)))}) + "\n")
+    sys.stdout.flush()
+    if failure == "exit":
+        return exit_code or 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
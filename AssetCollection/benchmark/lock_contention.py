@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+锁竞争基准测试：测量并发导出时查询扫描状态的延迟
+
+先完成一个结果较多的扫描作为导出对象，再启动若干持续产生结果的扫描，
+分别在无导出和多个线程反复导出（每次清空导出缓存，强制重新生成）时轮询扫描状态，
+输出状态查询延迟的p50/p99/最大值。
+
+用法（在AssetCollection目录下运行）:
+    python benchmark/lock_contention.py --exporters 4 --duration 3
+"""
+import argparse
+import glob
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from config import current_config
+
+
+def configure(work_dir: str) -> None:
+    """将扫描器的存储目录指向临时目录，并使用模拟的nuclei"""
+    current_config.NUCLEI_PATH = os.path.join(BENCHMARK_DIR, "fake_nuclei.py")
+    current_config.RESULTS_DIR = os.path.join(work_dir, "results")
+    current_config.TEMP_DIR = os.path.join(work_dir, "temp")
+    current_config.JOB_STORE_PATH = os.path.join(current_config.RESULTS_DIR, "jobs.db")
+    current_config.SCAN_CACHE_PATH = os.path.join(current_config.RESULTS_DIR, "scan_cache.db")
+    current_config.EXPORT_CACHE_DIR = os.path.join(current_config.RESULTS_DIR, "exports")
+    current_config.TEMPLATE_INDEX_PATH = os.path.join(current_config.RESULTS_DIR, "template_index.bin")
+    current_config.QUEUE_PATH = os.path.join(current_config.RESULTS_DIR, "queue.db")
+
+
+def percentile(samples, q: float) -> float:
+    """计算百分位数（毫秒）"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+
+
+def wait_for(scanner, scan_id: str, statuses, timeout: float = 300) -> None:
+    """等待扫描进入指定状态"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if scanner.get_scan_status(scan_id).status in statuses:
+            return
+        time.sleep(0.05)
+    raise TimeoutError(f"扫描 {scan_id} 未在 {timeout} 秒内结束")
+
+
+def poll_status(scanner, scan_ids, duration: float):
+    """在指定时长内轮流查询扫描状态，返回每次查询的耗时"""
+    samples = []
+    deadline = time.monotonic() + duration
+    i = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        scanner.get_scan_status(scan_ids[i % len(scan_ids)])
+        samples.append(time.perf_counter() - start)
+        i += 1
+        time.sleep(0.001)
+    return samples
+
+
+def export_loop(scanner, scan_id: str, stop: threading.Event, counter: list) -> None:
+    """反复导出，每次导出前删除已缓存的导出文件"""
+    formats = ["csv", "jsonl", "excel", "json"]
+    i = 0
+    while not stop.is_set():
+        for path in glob.glob(os.path.join(current_config.EXPORT_CACHE_DIR, f"{scan_id}.*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        artifact = scanner.export_results(scan_id, formats[i % len(formats)])
+        if artifact.stream is not None:
+            for _ in artifact.stream:
+                pass
+        counter[0] += 1
+        i += 1
+
+
+def report(name: str, samples) -> None:
+    print(f"{name:<16} n={len(samples):<6} p50={percentile(samples, 0.5):.3f}ms "
+          f"p99={percentile(samples, 0.99):.3f}ms max={max(samples) * 1000:.3f}ms "
+          f"mean={statistics.mean(samples) * 1000:.3f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="并发导出时的扫描状态查询延迟")
+    parser.add_argument("--export-findings", type=int, default=20000, help="被导出扫描的结果数")
+    parser.add_argument("--running-scans", type=int, default=4, help="持续产生结果的扫描数")
+    parser.add_argument("--exporters", type=int, default=4, help="并发导出线程数")
+    parser.add_argument("--duration", type=float, default=3.0, help="每个阶段的测量时长（秒）")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="easm-bench-")
+    configure(work_dir)
+    # 扫描器实例在导入时创建，需在配置完成后导入
+    from model.asset_model import Target
+    from service.nuclei_scanner import nuclei_scanner as scanner
+
+    try:
+        # 准备导出对象
+        os.environ.update(FAKE_FINDINGS="100", FAKE_DELAY="0")
+        targets = [Target(domain=f"export-{i}.example.com") for i in range(max(1, args.export_findings // 100))]
+        export_id = scanner.start_scan(targets)
+        wait_for(scanner, export_id, ("completed",))
+        print(f"导出对象: {scanner.get_scan_status(export_id).completed} 条结果")
+
+        # 启动持续产生结果的扫描，运行时间覆盖两个测量阶段
+        findings = 200
+        os.environ.update(FAKE_FINDINGS=str(findings), FAKE_DELAY=str(args.duration * 2.5 / (findings * 10)))
+        running = [
+            scanner.start_scan([Target(domain=f"run-{n}-{i}.example.com") for i in range(10)])
+            for n in range(args.running_scans)
+        ]
+        for scan_id in running:
+            wait_for(scanner, scan_id, ("running",))
+
+        report("无导出", poll_status(scanner, running, args.duration))
+
+        stop = threading.Event()
+        counter = [0]
+        threads = [
+            threading.Thread(target=export_loop, args=(scanner, export_id, stop, counter), daemon=True)
+            for _ in range(args.exporters)
+        ]
+        for thread in threads:
+            thread.start()
+        samples = poll_status(scanner, running, args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        report(f"{args.exporters}个线程导出", samples)
+        print(f"测量期间完成导出 {counter[0]} 次")
+
+        for scan_id in running:
+            wait_for(scanner, scan_id, ("completed", "failed"))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+扫描负载基准测试：通过FastAPI应用驱动扫描的完整流程
+
+使用模拟的nuclei（fake_nuclei.py）按场景提交扫描，扫描进行中由多个线程持续查询状态和结果，
+扫描结束后导出结果，输出：
+    - 分发延迟：扫描从提交到开始执行的等待时长（状态中的queue_wait）
+    - 写入吞吐：从第一个扫描开始到最后一个扫描结束，每秒写入的结果数
+    - 各API的p50/p99延迟
+    - 场景运行期间进程的峰值内存（RSS）
+
+--output 将各场景的指标保存为JSON，--baseline 与保存的指标比较，
+任一指标退化超过 --tolerance 时返回非0，可用于在修改NucleiScanner后离线发现性能退化。
+
+用法（在AssetCollection目录下运行）:
+    python benchmark/scan_load.py --scenario burst
+    python benchmark/scan_load.py --scenario all --output baseline.json
+    python benchmark/scan_load.py --scenario all --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import psutil
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from config import current_config
+from lock_contention import configure, percentile, report
+
+# 场景：扫描数、每个扫描的目标数、每个目标的结果数、分片数，以及传给模拟nuclei的环境变量
+SCENARIOS = {
+    # 大量小扫描同时提交，测量排队和分发
+    "burst": {"scans": 50, "targets": 2, "findings": 5, "shards": 1, "env": {}},
+    # 少量扫描输出大量较大的结果，测量结果写入吞吐
+    "bulk": {"scans": 4, "targets": 50, "findings": 200, "shards": 2, "env": {"FAKE_PAYLOAD": "512"}},
+    # 结果以固定速率持续输出，测量扫描进行中的API延迟
+    "stream": {"scans": 5, "targets": 10, "findings": 50, "shards": 1,
+               "env": {"FAKE_RATE": "200", "FAKE_STARTUP": "0.2"}},
+    # 部分nuclei进程中途崩溃或输出无法解析的行，失败的扫描同样应按时结束
+    "failure": {"scans": 20, "targets": 5, "findings": 20, "shards": 1,
+                "env": {"FAKE_FAILURE": "crash", "FAKE_FAILURE_RATIO": "0.3"}},
+}
+
+# 越小越好的指标，其余指标（吞吐）越大越好
+LOWER_IS_BETTER = ("p50", "p99", "peak_rss_mb")
+
+FINISHED = ("completed", "failed")
+
+
+class LatencyRecorder:
+    """按API记录请求耗时，供多个轮询线程同时使用"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def timed(self, name: str, func, *args, **kwargs):
+        start = time.perf_counter()
+        response = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.samples.setdefault(name, []).append(elapsed)
+        return response
+
+
+class RssSampler(threading.Thread):
+    """周期性采样本进程的RSS，记录峰值"""
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak = self.process.memory_info().rss
+        self.stop = threading.Event()
+
+    def run(self) -> None:
+        while not self.stop.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def poll_loop(client, recorder: LatencyRecorder, scan_ids, statuses, stop: threading.Event) -> None:
+    """随机选择未结束的扫描，查询状态并翻阅已写入的结果"""
+    cursors = {}
+    while not stop.is_set():
+        pending = [scan_id for scan_id in scan_ids if statuses.get(scan_id) not in FINISHED]
+        if not pending:
+            return
+        scan_id = random.choice(pending)
+        status = recorder.timed("status", client.get, f"{current_config.API_PREFIX}/scan/{scan_id}/status").json()
+        statuses[scan_id] = status.get("status")
+        page = recorder.timed(
+            "results", client.get, f"{current_config.API_PREFIX}/scan/{scan_id}/results",
+            params={"cursor": cursors.get(scan_id) or 0, "limit": 100}
+        ).json()
+        cursors[scan_id] = page.get("next_cursor") or cursors.get(scan_id)
+        time.sleep(0.002)
+
+
+def run_scenario(client, name: str, spec: dict, pollers: int, exports: int, timeout: float) -> dict:
+    """运行一个场景，返回指标"""
+    for key in [key for key in os.environ if key.startswith("FAKE_")]:
+        del os.environ[key]
+    os.environ["FAKE_FINDINGS"] = str(spec["findings"])
+    os.environ.update(spec["env"])
+
+    recorder = LatencyRecorder()
+    sampler = RssSampler()
+    sampler.start()
+
+    scan_ids = []
+    for n in range(spec["scans"]):
+        body = {
+            "targets": [{"domain": f"{name}-{n}-{i}.example.com"} for i in range(spec["targets"])],
+            "shards": spec["shards"]
+        }
+        response = recorder.timed("start_scan", client.post, f"{current_config.API_PREFIX}/scan", json=body)
+        scan_ids.append(response.json()["scan_id"])
+
+    statuses = {}
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=poll_loop, args=(client, recorder, scan_ids, statuses, stop), daemon=True)
+        for _ in range(pollers)
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    stop.set()
+
+    # 以最终状态计算分发延迟和写入吞吐
+    final = [client.get(f"{current_config.API_PREFIX}/scan/{scan_id}/status").json() for scan_id in scan_ids]
+    unfinished = sum(1 for status in final if status["status"] not in FINISHED)
+    findings = sum(status["completed"] for status in final)
+    starts = [status["start_time"] for status in final if status.get("start_time")]
+    ends = [status["end_time"] for status in final if status.get("end_time")]
+    elapsed = 0.0
+    if starts and ends:
+        elapsed = (datetime.fromisoformat(max(ends)) - datetime.fromisoformat(min(starts))).total_seconds()
+    dispatch = [status["queue_wait"] for status in final if status.get("queue_wait") is not None]
+
+    completed = [scan_id for scan_id, status in zip(scan_ids, final) if status["status"] == "completed"]
+    for scan_id in completed[:exports]:
+        for export_format in ("jsonl", "csv"):
+            recorder.timed(
+                "export", lambda: client.post(
+                    f"{current_config.API_PREFIX}/scan/export", json={"scan_id": scan_id, "format": export_format}
+                ).content
+            )
+
+    sampler.stop.set()
+    sampler.join()
+
+    print(f"\n== {name}: {spec['scans']}个扫描，{findings}条结果，"
+          f"失败{sum(1 for status in final if status['status'] == 'failed')}个，未结束{unfinished}个")
+    metrics = {
+        "findings": findings,
+        "unfinished": unfinished,
+        "throughput": findings / elapsed if elapsed > 0 else 0.0,
+        "peak_rss_mb": sampler.peak / 1024 / 1024,
+    }
+    if dispatch:
+        report("分发延迟", dispatch)
+        metrics["dispatch"] = {"p50": percentile(dispatch, 0.5), "p99": percentile(dispatch, 0.99)}
+    for api, samples in sorted(recorder.samples.items()):
+        report(api, samples)
+        metrics[api] = {"p50": percentile(samples, 0.5), "p99": percentile(samples, 0.99)}
+    print(f"写入吞吐: {metrics['throughput']:.0f} 条/秒，峰值RSS: {metrics['peak_rss_mb']:.1f}MB")
+    return metrics
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """与基线比较，返回退化的指标"""
+    regressions = []
+
+    def walk(path: str, current, base) -> None:
+        if isinstance(base, dict):
+            for key, value in base.items():
+                if isinstance(current, dict) and key in current:
+                    walk(f"{path}.{key}" if path else key, current[key], value)
+            return
+        if not isinstance(base, (int, float)) or base <= 0:
+            return
+        metric = path.rsplit(".", 1)[-1]
+        if metric in LOWER_IS_BETTER and current > base * (1 + tolerance):
+            regressions.append(f"{path}: {base:.3f} -> {current:.3f}")
+        elif metric == "throughput" and current < base * (1 - tolerance):
+            regressions.append(f"{path}: {base:.3f} -> {current:.3f}")
+
+    walk("", results, baseline)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="通过API驱动模拟扫描的负载基准测试")
+    parser.add_argument("--scenario", default="all", choices=["all"] + list(SCENARIOS), help="运行的场景")
+    parser.add_argument("--scans", type=int, help="覆盖场景的扫描数")
+    parser.add_argument("--findings", type=int, help="覆盖场景中每个目标的结果数")
+    parser.add_argument("--pollers", type=int, default=4, help="并发查询状态和结果的线程数")
+    parser.add_argument("--exports", type=int, default=3, help="每个场景导出的扫描数")
+    parser.add_argument("--concurrency", type=int, help="MAX_CONCURRENT_SCANS")
+    parser.add_argument("--engine", choices=["thread", "asyncio"], help="SCAN_ENGINE")
+    parser.add_argument("--store", choices=["sqlite", "memory"], help="JOB_STORE")
+    parser.add_argument("--timeout", type=float, default=300, help="每个场景的最长运行时间（秒）")
+    parser.add_argument("--output", help="将指标保存到JSON文件")
+    parser.add_argument("--baseline", help="与之比较的基线指标JSON文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="easm-bench-")
+    configure(work_dir)
+    if args.concurrency:
+        current_config.MAX_CONCURRENT_SCANS = args.concurrency
+    if args.engine:
+        current_config.SCAN_ENGINE = args.engine
+    if args.store:
+        current_config.JOB_STORE = args.store
+    # 应用和扫描器在导入时创建，需在配置完成后导入
+    from fastapi.testclient import TestClient
+    from main import app
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = {}
+    try:
+        with TestClient(app) as client:
+            for name in names:
+                spec = dict(SCENARIOS[name])
+                if args.scans:
+                    spec["scans"] = args.scans
+                if args.findings:
+                    spec["findings"] = args.findings
+                results[name] = run_scenario(client, name, spec, args.pollers, args.exports, args.timeout)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n指标已保存到 {args.output}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n以下指标退化超过 {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\n与基线相比没有超过 {args.tolerance:.0%} 的退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@
 """
 配置文件，存储项目的配置信息
 """
+import os
 
 # 项目基础配置
 class Config:
@@ -23,16 +24,107 @@ class Config:
     NUCLEI_TEMPLATE_DIR = None
     # 扫描超时时间（秒）
     SCAN_TIMEOUT = 3600
+    # nuclei统计信息输出间隔（秒），用于更新扫描进度
+    STATS_INTERVAL = 5
+    # 扫描执行引擎：thread（每个分片一个线程）或 asyncio（在应用的事件循环中以协程监督nuclei进程）
+    SCAN_ENGINE = "thread"
     
     # 结果存储配置
     # 结果存储目录
     RESULTS_DIR = "results"
     # 临时文件目录
     TEMP_DIR = "temp"
+    # 任务存储类型（sqlite: 持久化存储，memory: 仅保存在内存中）
+    JOB_STORE = "sqlite"
+    # SQLite任务存储文件路径
+    JOB_STORE_PATH = os.path.join(RESULTS_DIR, "jobs.db")
+    # 任务存储批量写入的最大条数
+    JOB_STORE_BATCH_SIZE = 500
+    # 任务存储批量写入的最长等待时间（秒）
+    JOB_STORE_FLUSH_INTERVAL = 0.5
+    # 任务存储写队列的最大长度，写入跟不上时写结果的扫描等待（背压），不再无限占用内存
+    JOB_STORE_QUEUE_SIZE = 10000
+    # 批量写入失败后的重试次数，仍失败时相关扫描标记为失败
+    JOB_STORE_WRITE_RETRIES = 3
+    # 增量扫描缓存文件路径
+    SCAN_CACHE_PATH = os.path.join(RESULTS_DIR, "scan_cache.db")
+    # 增量扫描缓存有效期（秒）
+    SCAN_CACHE_TTL = 86400
+    # 导出文件缓存目录
+    EXPORT_CACHE_DIR = os.path.join(RESULTS_DIR, "exports")
+    # 模板索引缓存文件路径
+    TEMPLATE_INDEX_PATH = os.path.join(RESULTS_DIR, "template_index.bin")
+    # 后台线程检查模板目录是否更新的间隔（秒，最短1秒）
+    TEMPLATE_INDEX_CHECK_INTERVAL = 30
+    # 结果查询默认每页条数
+    RESULTS_PAGE_SIZE = 100
+    # 结果查询最大每页条数
+    RESULTS_MAX_PAGE_SIZE = 1000
+    # 最近读取的结果块和结果索引的缓存大小（字节）
+    RESULT_CACHE_BYTES = 64 * 1024 * 1024
     
     # 并发配置
     # 最大并发扫描数
     MAX_CONCURRENT_SCANS = 5
+    # 单个扫描任务展开CIDR和端口范围后的最大目标数
+    MAX_SCAN_TARGETS = 1000000
+    # 单个扫描任务的最大分片数
+    MAX_SCAN_SHARDS = 32
+    
+    # 指纹预选配置
+    # 指纹识别阶段使用的模板标签
+    FINGERPRINT_TAGS = ["tech"]
+    # 未识别出可用标签的目标使用的模板风险等级
+    FINGERPRINT_FALLBACK_SEVERITY = ["critical", "high"]
+    # 每个分片按标签扫描的最大nuclei执行次数，超出时目标数最少的几组合并执行
+    FINGERPRINT_MAX_PASSES = 8
+    
+    # nuclei资源调控配置
+    # 是否按全局预算为每个nuclei进程分配 -c、-bs、-rl 参数（关闭时使用nuclei默认值）
+    # 参数在进程启动时按当时运行和排队的进程数平分，nuclei不支持运行中调整，先启动的进程保持原有份额，
+    # 扫描陆续启动时所有进程的份额之和可能暂时超过预算，直到先启动的进程结束
+    NUCLEI_GOVERNOR = True
+    # 所有nuclei进程每秒请求数之和的上限（按份额分配为各进程的 -rl）
+    NUCLEI_RATE_LIMIT_TOTAL = 500
+    # 所有nuclei进程并行模板数之和（按份额分配为各进程的 -c）
+    NUCLEI_CONCURRENCY_TOTAL = 100
+    # 所有nuclei进程每个模板并行主机数之和（按份额分配为各进程的 -bs）
+    NUCLEI_BULK_SIZE_TOTAL = 100
+    # 主机CPU使用率目标（百分比），超过时缩减之后启动的进程的份额
+    GOVERNOR_CPU_TARGET = 80
+    # CPU使用率采样间隔（秒）
+    GOVERNOR_INTERVAL = 5
+    
+    # 分布式扫描配置
+    # 扫描模式（local: API进程内执行扫描，distributed: API进程只提交任务，由worker.py启动的工作进程执行）
+    SCAN_MODE = "local"
+    # 任务队列类型（sqlite: 单机或共享文件系统，redis: 多主机）
+    QUEUE_BACKEND = "sqlite"
+    # SQLite任务队列文件路径
+    QUEUE_PATH = os.path.join(RESULTS_DIR, "queue.db")
+    # Redis任务队列地址
+    REDIS_URL = "redis://localhost:6379/0"
+    # 任务租约时长（秒），工作进程超过该时长未续租时任务重新可被租用
+    LEASE_TIMEOUT = 60
+    # 工作进程续租间隔（秒）
+    HEARTBEAT_INTERVAL = 10
+    # 每个工作进程同时执行的任务数
+    WORKER_CONCURRENCY = 5
+    # 队列为空时工作进程租用任务、API进程读取回传事件的轮询间隔（秒）
+    WORKER_POLL_INTERVAL = 0.5
+    # 工作进程回传事件、API进程消费事件的批量大小
+    WORKER_EVENT_BATCH_SIZE = 500
+    # API节点ID，工作进程按提交任务的节点ID回传事件；为空时使用"主机名-进程号"，
+    # 每个API进程（包括同一主机上的多个进程）的ID必须不同
+    API_NODE_ID = ""
+    # 回传事件的保留时长（秒），API节点下线后其事件通道中未消费的事件超过该时长后删除
+    WORKER_EVENT_TTL = 86400
+    
+    # 事件推送配置
+    # 每个订阅者的事件队列长度，消费过慢的订阅者超出部分将被丢弃
+    EVENT_QUEUE_SIZE = 1000
+    # 无事件时发送心跳的间隔（秒）
+    EVENT_KEEPALIVE_INTERVAL = 15
 
 # 开发环境配置
 class DevelopmentConfig(Config):
@@ -2,12 +2,17 @@
 """
 资产控制器，实现资产发现和枚举的RESTful API接口
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Response
-from fastapi.responses import FileResponse
-from typing import List, Optional
+import asyncio
+import json
 
-from model.asset_model import ScanRequest, ScanResponse, ScanStatus, ExportRequest
+from fastapi import APIRouter, HTTPException, Response, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+
+from model.asset_model import ScanRequest, ScanResponse, ScanStatus, ExportRequest, ResultPage
 from service.nuclei_scanner import nuclei_scanner
+from service.event_broker import event_broker
 from config import current_config
 
 # 创建路由
@@ -18,10 +23,13 @@ async def start_scan(scan_request: ScanRequest):
     """
     启动资产扫描任务
     
-    - **targets**: 扫描目标列表，可以包含IP、域名、端口或URL
-    - **templates**: 可选，指定使用的nuclei模板
+    - **targets**: 扫描目标列表，可以包含IP（支持CIDR）、域名、端口（支持范围）或URL，重复目标会被合并
+    - **templates**: 可选，指定使用的nuclei模板（模板ID、相对模板目录的路径或绝对路径），不存在的模板返回400
     - **timeout**: 可选，扫描超时时间（秒）
     - **verbose**: 是否输出详细结果
+    - **shards**: 可选，分片数，大于1时目标被拆分给多个nuclei进程并行扫描
+    - **incremental**: 是否增量扫描，缓存有效期内已扫描过的目标直接返回缓存结果（结果中cached为true）
+    - **fingerprint**: 是否指纹预选，未指定templates时先识别目标指纹，再只使用指纹对应标签的模板扫描，未识别出标签的目标使用高风险等级的模板
     
     返回扫描ID，可用于查询扫描状态和结果
     """
@@ -30,12 +38,16 @@ async def start_scan(scan_request: ScanRequest):
         if not scan_request.targets:
             raise HTTPException(status_code=400, detail="扫描目标不能为空")
         
-        # 启动扫描任务
-        scan_id = nuclei_scanner.start_scan(
+        # 启动扫描任务，目标展开和写入任务存储在线程池中执行，避免阻塞事件循环
+        scan_id = await run_in_threadpool(
+            nuclei_scanner.start_scan,
             targets=scan_request.targets,
             templates=scan_request.templates,
             verbose=scan_request.verbose,
-            timeout=scan_request.timeout
+            timeout=scan_request.timeout,
+            shards=scan_request.shards,
+            incremental=scan_request.incremental,
+            fingerprint=scan_request.fingerprint
         )
         
         # 返回扫描响应
@@ -44,6 +56,11 @@ async def start_scan(scan_request: ScanRequest):
             status="pending",
             message="扫描任务已提交，请使用扫描ID查询状态和结果"
         )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # 目标无效、超出限制或模板不存在
+        raise HTTPException(status_code=400, detail=f"扫描请求无效: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"启动扫描失败: {str(e)}")
 
@@ -58,7 +75,7 @@ async def get_scan_status(scan_id: str):
     """
     try:
         # 获取扫描状态
-        status = nuclei_scanner.get_scan_status(scan_id)
+        status = await run_in_threadpool(nuclei_scanner.get_scan_status, scan_id)
         
         # 检查扫描任务是否存在
         if status is None:
@@ -70,30 +87,110 @@ async def get_scan_status(scan_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询扫描状态失败: {str(e)}")
 
-@router.get("/scan/{scan_id}/results", tags=["扫描结果查询"])
-async def get_scan_results(scan_id: str):
+def _format_sse(event: str, data, event_id: Optional[int] = None) -> str:
+    """将事件格式化为SSE消息"""
+    message = ""
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"event: {event}\n"
+    message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message
+
+@router.get("/scan/{scan_id}/events", tags=["扫描状态查询"])
+async def scan_events(scan_id: str):
     """
-    获取扫描结果
+    订阅扫描事件（Server-Sent Events）
     
     - **scan_id**: 扫描任务ID
     
-    返回扫描结果的原始JSON数据
+    连接建立后先推送一次当前状态，之后实时推送状态变化（status）和新发现的结果（finding），
+    扫描结束（completed/failed）后关闭连接。客户端消费过慢导致事件被丢弃时推送lagged事件，
+    可通过结果查询接口补齐。
     """
+    # 先订阅再读取状态，避免错过两者之间发生的状态变化
+    subscription = event_broker.subscribe(scan_id)
     try:
-        # 获取扫描结果
-        results = nuclei_scanner.get_scan_results(scan_id)
+        status = await run_in_threadpool(nuclei_scanner.get_scan_status, scan_id)
+    except BaseException:
+        event_broker.unsubscribe(subscription)
+        raise
+    if status is None:
+        event_broker.unsubscribe(subscription)
+        raise HTTPException(status_code=404, detail=f"未找到扫描任务: {scan_id}")
+    
+    async def event_stream():
+        try:
+            yield _format_sse("status", status.model_dump(mode="json"))
+            if status.status in ("completed", "failed"):
+                return
+            
+            while True:
+                try:
+                    event = await subscription.get(timeout=current_config.EVENT_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    # 发送心跳注释，保持连接不被代理断开
+                    yield ": keepalive\n\n"
+                    continue
+                
+                if subscription.dropped:
+                    yield _format_sse("lagged", {"dropped": subscription.dropped})
+                    subscription.dropped = 0
+                
+                yield _format_sse(event["event"], event["data"], event["id"])
+                if event["event"] == "status" and event["data"]["status"] in ("completed", "failed"):
+                    break
+        finally:
+            event_broker.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/scan/{scan_id}/results", response_model=ResultPage, tags=["扫描结果查询"])
+async def get_scan_results(
+    scan_id: str,
+    cursor: Optional[str] = Query(None, description="分页游标，取上一页返回的next_cursor"),
+    limit: int = Query(current_config.RESULTS_PAGE_SIZE, ge=1, le=current_config.RESULTS_MAX_PAGE_SIZE),
+    severity: Optional[str] = Query(None, description="按风险等级过滤"),
+    template_id: Optional[str] = Query(None, description="按模板ID过滤"),
+    host: Optional[str] = Query(None, description="按主机过滤"),
+    type: Optional[str] = Query(None, description="按结果类型过滤")
+):
+    """
+    分页获取扫描结果
+    
+    - **scan_id**: 扫描任务ID
+    - **cursor**: 可选，分页游标，首页不传
+    - **limit**: 每页条数
+    - **severity / template_id / host / type**: 可选，过滤条件
+    
+    返回一页扫描结果的原始JSON数据和下一页游标。扫描进行中可查询已写入的结果
+    """
+    try:
+        # 解析游标
+        try:
+            start = int(cursor) if cursor else 0
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"无效的分页游标: {cursor}")
+        if start < 0:
+            raise HTTPException(status_code=400, detail=f"无效的分页游标: {cursor}")
+        
+        # 获取扫描结果，读取和解压结果块在线程池中执行
+        page = await run_in_threadpool(
+            nuclei_scanner.query_scan_results,
+            scan_id,
+            cursor=start,
+            limit=limit,
+            filters={"severity": severity, "template_id": template_id, "host": host, "type": type}
+        )
         
         # 检查扫描任务是否存在
-        if results is None:
-            # 检查扫描任务是否存在
-            status = nuclei_scanner.get_scan_status(scan_id)
-            if status is None:
-                raise HTTPException(status_code=404, detail=f"未找到扫描任务: {scan_id}")
-            else:
-                # 扫描任务存在但未完成
-                raise HTTPException(status_code=400, detail=f"扫描任务尚未完成，当前状态: {status.status}")
+        if page is None:
+            raise HTTPException(status_code=404, detail=f"未找到扫描任务: {scan_id}")
         
-        return results
+        return page
     except HTTPException:
         raise
     except Exception as e:
@@ -105,48 +202,42 @@ async def export_scan_results(export_request: ExportRequest, response: Response)
     导出扫描结果
     
     - **scan_id**: 扫描任务ID
-    - **format**: 导出格式，支持excel、json、csv
+    - **format**: 导出格式，支持excel、json、jsonl、csv
     
     返回导出的文件
     """
     try:
-        # 导出扫描结果
-        file_path = nuclei_scanner.export_results(
+        # 导出扫描结果，Excel在线程池中生成，避免阻塞事件循环
+        artifact = await run_in_threadpool(
+            nuclei_scanner.export_results,
             scan_id=export_request.scan_id,
             export_format=export_request.format
         )
         
         # 检查导出是否成功
-        if file_path is None:
+        if artifact is None:
             # 检查扫描任务是否存在
-            status = nuclei_scanner.get_scan_status(export_request.scan_id)
+            status = await run_in_threadpool(nuclei_scanner.get_scan_status, export_request.scan_id)
             if status is None:
                 raise HTTPException(status_code=404, detail=f"未找到扫描任务: {export_request.scan_id}")
             elif status.status != "completed":
                 raise HTTPException(status_code=400, detail=f"扫描任务尚未完成，当前状态: {status.status}")
             else:
-                raise HTTPException(status_code=500, detail="导出扫描结果失败")
+                raise HTTPException(status_code=400, detail="不支持的导出格式")
         
-        # 设置响应头
-        if export_request.format == "excel":
-            media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            filename = f"{export_request.scan_id}.xlsx"
-        elif export_request.format == "json":
-            media_type = "application/json"
-            filename = f"{export_request.scan_id}.json"
-        elif export_request.format == "csv":
-            media_type = "text/csv"
-            filename = f"{export_request.scan_id}.csv"
-        else:
-            raise HTTPException(status_code=400, detail="不支持的导出格式")
+        headers = {"Content-Disposition": f"attachment; filename={artifact.filename}"}
         
-        # 返回文件
-        return FileResponse(
-            path=file_path,
-            media_type=media_type,
-            filename=filename,
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        # 已缓存的导出文件直接返回
+        if artifact.path is not None:
+            return FileResponse(
+                path=artifact.path,
+                media_type=artifact.media_type,
+                filename=artifact.filename,
+                headers=headers
+            )
+        
+        # 逐行生成并以流的方式返回
+        return StreamingResponse(artifact.stream, media_type=artifact.media_type, headers=headers)
     except HTTPException:
         raise
     except Exception as e:
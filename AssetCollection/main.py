@@ -2,21 +2,40 @@
 """
 主程序文件，初始化FastAPI应用并启动HTTP服务器
 """
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 
 from controller.asset_controller import router
+from service.nuclei_scanner import nuclei_scanner
+from service.template_index import template_index
+from service.metrics import MetricsMiddleware, render_metrics
 from config import current_config
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期：启动时将事件循环交给扫描器（asyncio引擎）并预先加载模板索引，
+    关闭时取消未结束的扫描
+    """
+    nuclei_scanner.attach_loop(asyncio.get_running_loop())
+    # 首次构建模板索引需要遍历模板目录，在线程中完成，避免第一个扫描请求等待
+    await asyncio.to_thread(template_index.available)
+    yield
+    await nuclei_scanner.cancel_running_scans()
+
 # 创建FastAPI应用
 app = FastAPI(
     title=current_config.PROJECT_NAME,
     description="资产收集微服务 - 使用nuclei进行资产发现和枚举",
     version=current_config.PROJECT_VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 添加CORS中间件
@@ -28,6 +47,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录API请求时长
+app.add_middleware(MetricsMiddleware, prefix=current_config.API_PREFIX)
+
 # 自定义OpenAPI文档
 @app.get("/openapi.json", include_in_schema=False)
 async def get_openapi_json():
@@ -41,6 +63,12 @@ async def get_openapi_json():
 # 注册路由
 app.include_router(router)
 
+# Prometheus监控指标
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
+
 # 根路径
 @app.get("/")
 async def root():
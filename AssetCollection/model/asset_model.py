@@ -8,12 +8,14 @@ from datetime import datetime
 
 class Target(BaseModel):
     """扫描目标模型"""
-    # IP地址
+    # IP地址（支持CIDR网段，例如 192.168.1.0/24）
     ip: Optional[str] = Field(None, example="192.168.1.1")
     # 域名
     domain: Optional[str] = Field(None, example="example.com")
     # 端口
     port: Optional[int] = Field(None, example=80)
+    # 端口列表或范围（可选），例如 "80,443,8000-8100"
+    ports: Optional[str] = Field(None, example="80,443,8000-8100")
     # URL
     url: Optional[HttpUrl] = Field(None, example="http://example.com")
 
@@ -22,11 +24,17 @@ class ScanRequest(BaseModel):
     # 扫描目标列表
     targets: List[Target] = Field(..., example=[{"domain": "example.com"}])
     # nuclei模板列表（可选）
-    templates: Optional[List[str]] = Field(None, example=["http/tech-detect"])
+    templates: Optional[List[str]] = Field(None, example=["tech-detect"])
     # 扫描超时时间（秒，可选）
     timeout: Optional[int] = Field(None, example=3600)
     # 是否输出详细结果
     verbose: bool = Field(False, example=False)
+    # 分片数（可选），大于1时将目标拆分给多个nuclei进程并行扫描
+    shards: Optional[int] = Field(None, ge=1, example=4)
+    # 增量扫描，缓存有效期内已扫描过的目标直接返回缓存结果
+    incremental: bool = Field(False, example=False)
+    # 指纹预选，未指定templates时先识别目标指纹，再按指纹对应的标签选择模板
+    fingerprint: bool = Field(False, example=False)
 
 class ScanResult(BaseModel):
     """扫描结果模型"""
@@ -43,6 +51,23 @@ class ScanResult(BaseModel):
     # 扫描状态
     status: str  # "success", "failed", "running"
 
+class ShardStatus(BaseModel):
+    """扫描分片状态模型"""
+    # 分片序号
+    index: int
+    # 分片状态
+    status: str  # "pending", "running", "completed", "failed"
+    # 进度百分比
+    progress: int
+    # 已发现结果数
+    completed: int
+    # 分片目标数
+    total: int
+    # 排队等待时长（秒）
+    queue_wait: Optional[float] = None
+    # 错误信息（如果有）
+    error: Optional[str] = None
+
 class ScanStatus(BaseModel):
     """扫描状态模型"""
     # 扫描ID
@@ -57,10 +82,35 @@ class ScanStatus(BaseModel):
     total: int
     # 错误信息（如果有）
     error: Optional[str] = None
+    # 是否存在部分结果（扫描超时或失败前已写入的结果）
+    partial: bool = False
+    # 入队时间
+    queued_at: Optional[datetime] = None
+    # 排队等待时长（秒，任务被分发执行前为空）
+    queue_wait: Optional[float] = None
     # 开始时间
     start_time: Optional[datetime] = None
     # 结束时间
     end_time: Optional[datetime] = None
+    # 规范化去重时合并掉的目标数
+    collapsed: int = 0
+    # 增量扫描时命中缓存、未重新扫描的目标数
+    cached_targets: int = 0
+    # 分片状态（仅分片扫描时返回）
+    shards: Optional[List[ShardStatus]] = None
+
+class ResultPage(BaseModel):
+    """扫描结果分页模型"""
+    # 扫描ID
+    scan_id: str
+    # 本页结果
+    items: List[dict]
+    # 本页结果数
+    count: int
+    # 下一页游标（扫描进行中读到当前末尾时为继续轮询的起始位置，扫描结束且没有更多结果时为空）
+    next_cursor: Optional[str] = None
+    # 是否已读取全部结果（扫描已结束且没有更多结果）
+    complete: bool = False
 
 class ScanResponse(BaseModel):
     """扫描响应模型"""
@@ -77,5 +127,5 @@ class ExportRequest(BaseModel):
     """导出请求模型"""
     # 扫描ID
     scan_id: str
-    # 导出格式（支持excel, json, csv）
-    format: str = Field(..., example="excel", pattern="^(excel|json|csv)$")
\ No newline at end of file
+    # 导出格式（支持excel, json, jsonl, csv）
+    format: str = Field(..., example="excel", pattern="^(excel|json|jsonl|csv)$")
\ No newline at end of file
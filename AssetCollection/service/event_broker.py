@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+扫描事件分发服务，将扫描线程产生的状态变化和新结果推送给订阅的客户端
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Optional, Set
+
+from config import current_config
+
+
+class Subscription:
+    """单个客户端的订阅，事件存放在所属事件循环的有界队列中"""
+
+    def __init__(self, scan_id: str, loop: asyncio.AbstractEventLoop, max_size: int):
+        self.scan_id = scan_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_size)
+        # 因客户端消费过慢而丢弃的事件数
+        self.dropped = 0
+
+    def put(self, event: Dict[str, Any]) -> None:
+        """在事件循环线程中放入事件，队列已满时丢弃并计数"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """等待下一个事件，超时抛出asyncio.TimeoutError"""
+        return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+
+
+class EventBroker:
+    """
+    事件分发器
+
+    订阅者都是事件循环中的协程，不为每个客户端占用线程。
+    扫描线程发布事件时，每个事件循环只调度一次回调，再由回调分发给该循环中的全部订阅者。
+    """
+
+    def __init__(self, max_queue_size: int = 1000):
+        self.max_queue_size = max_queue_size
+        self.subscribers: Dict[str, Set[Subscription]] = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, scan_id: str) -> Subscription:
+        """订阅扫描事件，需要在事件循环中调用"""
+        subscription = Subscription(scan_id, asyncio.get_running_loop(), self.max_queue_size)
+        with self.lock:
+            self.subscribers.setdefault(scan_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """取消订阅"""
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.scan_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscribers[subscription.scan_id]
+
+    def subscriber_count(self, scan_id: Optional[str] = None) -> int:
+        """返回订阅者数量"""
+        with self.lock:
+            if scan_id is not None:
+                return len(self.subscribers.get(scan_id, ()))
+            return sum(len(subscriptions) for subscriptions in self.subscribers.values())
+
+    def publish(self, scan_id: str, event_type: str, data: Any, event_id: Optional[int] = None) -> None:
+        """发布事件，可在任意线程中调用"""
+        with self.lock:
+            subscriptions = self.subscribers.get(scan_id)
+            if not subscriptions:
+                return
+            loops = {subscription.loop for subscription in subscriptions}
+
+        event = {"event": event_type, "data": data, "id": event_id}
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fanout, scan_id, loop, event)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _fanout(self, scan_id: str, loop: asyncio.AbstractEventLoop, event: Dict[str, Any]) -> None:
+        """在事件循环线程中将事件分发给该循环的订阅者"""
+        with self.lock:
+            subscriptions = [s for s in self.subscribers.get(scan_id, ()) if s.loop is loop]
+        for subscription in subscriptions:
+            subscription.put(event)
+
+
+# 创建全局事件分发实例
+event_broker = EventBroker(current_config.EVENT_QUEUE_SIZE)
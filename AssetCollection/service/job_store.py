@@ -0,0 +1,756 @@
+# -*- coding: utf-8 -*-
+"""
+扫描任务存储服务，持久化扫描任务状态和扫描结果
+"""
+import json
+import logging
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from config import current_config
+from service.result_blocks import (
+    BLOCK_RECORDS, block_of, block_size, decode_block, encode_block, result_cache
+)
+from service.result_index import INDEX_FIELDS, ResultIndex, extract_fields
+
+logger = logging.getLogger(__name__)
+
+# 任务表字段及类型，新增字段时在此追加，启动时自动补齐缺失的列
+JOB_COLUMNS = {
+    "status": "TEXT",
+    "progress": "INTEGER",
+    "completed": "INTEGER",
+    "total": "INTEGER",
+    "error": "TEXT",
+    "partial": "INTEGER",
+    "queued_at": "TEXT",
+    "queue_wait": "REAL",
+    "start_time": "TEXT",
+    "end_time": "TEXT",
+    "shards": "TEXT",
+    "collapsed": "INTEGER",
+    "cached_targets": "INTEGER",
+}
+
+# 以datetime存储的字段
+DATETIME_FIELDS = ("queued_at", "start_time", "end_time")
+
+# 以JSON存储的字段
+JSON_FIELDS = ("shards",)
+
+# 视为未结束的任务状态
+ACTIVE_STATUSES = ("pending", "running")
+
+
+class JobStore:
+    """
+    任务存储接口
+
+    扫描器通过该接口读写任务状态和结果，具体实现可以是内存或SQLite
+    """
+
+    def create_job(self, scan_id: str, fields: Dict) -> None:
+        """创建任务记录"""
+        raise NotImplementedError
+
+    def update_job(self, scan_id: str, fields: Dict) -> None:
+        """更新任务字段，允许异步批量写入"""
+        raise NotImplementedError
+
+    def finalize_job(self, scan_id: str, fields: Dict) -> Optional[str]:
+        """
+        写入任务终态，返回前确保任务状态及其结果均已持久化
+
+        扫描的结果或状态未能写入时，任务以失败状态保存，返回错误信息；否则返回None
+        """
+        raise NotImplementedError
+
+    def get_job(self, scan_id: str) -> Optional[Dict]:
+        """读取任务记录，不存在时返回None"""
+        raise NotImplementedError
+
+    def add_finding(self, scan_id: str, seq: int, result: Dict, raw: Optional[str] = None) -> None:
+        """追加一条扫描结果，seq为结果在本次扫描中的序号（从0开始）"""
+        raise NotImplementedError
+
+    def query_findings(self, scan_id: str, filters: Dict[str, str], cursor: int,
+                       limit: int, live: bool = False) -> Tuple[List[Dict], Optional[int]]:
+        """
+        按过滤条件分页查询结果，返回(本页结果, 下一页游标)
+
+        没有更多结果时下一页游标为None；live为True（扫描仍在进行）时读到当前末尾仍返回游标，
+        之后写入的结果从该游标开始读取
+        """
+        raise NotImplementedError
+
+    def iter_findings(self, scan_id: str) -> Iterator[Dict]:
+        """按序号顺序遍历扫描的全部结果"""
+        raise NotImplementedError
+
+    def recover_interrupted(self) -> int:
+        """将上次运行时未结束的任务标记为失败，返回处理的任务数"""
+        raise NotImplementedError
+
+
+class ActiveResults:
+    """
+    未结束扫描的结果写入状态
+
+    结果先加入内存中的当前块，满 BLOCK_RECORDS 条后压缩追加到结果文件，
+    offsets[i] 和 offsets[i + 1] 为第i个块在文件中的起止偏移
+    """
+
+    def __init__(self, result_file: str):
+        self.result_file = result_file
+        self.file: Optional[IO] = None
+        self.offsets = array('q', [0])
+        self.pending: List[str] = []
+        self.index = ResultIndex()
+        self.lock = threading.Lock()
+
+    def append(self, line: str, result: Dict) -> None:
+        with self.lock:
+            self.index.add(result)
+            self.pending.append(line)
+            if len(self.pending) >= BLOCK_RECORDS:
+                self._flush_block()
+
+    def _flush_block(self) -> None:
+        """压缩当前块并追加到结果文件"""
+        if self.file is None:
+            self.file = open(self.result_file, 'wb')
+        data = encode_block(self.pending)
+        self.file.write(data)
+        self.file.flush()
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.pending = []
+
+    def close(self) -> None:
+        """写入最后一个不满的块并关闭结果文件"""
+        with self.lock:
+            if self.pending:
+                self._flush_block()
+            if self.file is not None:
+                self.file.close()
+
+
+class MemoryJobStore(JobStore):
+    """
+    内存任务存储
+
+    任务状态保存在内存字典中，结果按块压缩写入 RESULTS_DIR 下的结果文件（格式见result_blocks），
+    扫描结束时将块偏移和结果索引写入索引文件，并从内存中移除；之后查询时按需读入结果缓存，
+    内存占用与保留的扫描数量无关。服务重启后任务记录丢失
+    """
+
+    def __init__(self, results_dir: str):
+        self.results_dir = results_dir
+        self.jobs: Dict[str, Dict] = {}
+        # 未结束扫描的结果写入状态
+        self.active: Dict[str, ActiveResults] = {}
+        self.lock = threading.Lock()
+
+    def _result_file(self, scan_id: str) -> str:
+        """获取扫描结果文件路径（压缩块，每块 BLOCK_RECORDS 条结果）"""
+        return os.path.join(self.results_dir, f"{scan_id}.blocks")
+
+    def _index_file(self, scan_id: str) -> str:
+        """获取已结束扫描的索引文件路径（块偏移和结果索引）"""
+        return os.path.join(self.results_dir, f"{scan_id}.idx")
+
+    def create_job(self, scan_id: str, fields: Dict) -> None:
+        with self.lock:
+            self.jobs[scan_id] = dict(fields)
+            self.active[scan_id] = ActiveResults(self._result_file(scan_id))
+
+    def update_job(self, scan_id: str, fields: Dict) -> None:
+        with self.lock:
+            self.jobs[scan_id].update(fields)
+
+    def finalize_job(self, scan_id: str, fields: Dict) -> Optional[str]:
+        with self.lock:
+            self.jobs[scan_id].update(fields)
+            active = self.active.get(scan_id)
+        if active is None:
+            return None
+        active.close()
+        if len(active.index):
+            index_file = self._index_file(scan_id)
+            with open(index_file + ".part", 'wb') as f:
+                pickle.dump((active.offsets, active.index.dump()), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(index_file + ".part", index_file)
+        # 索引文件写入后再移除，查询不会找不到结果
+        with self.lock:
+            self.active.pop(scan_id, None)
+        return None
+
+    def get_job(self, scan_id: str) -> Optional[Dict]:
+        with self.lock:
+            job = self.jobs.get(scan_id)
+            return dict(job) if job is not None else None
+
+    def add_finding(self, scan_id: str, seq: int, result: Dict, raw: Optional[str] = None) -> None:
+        line = raw if raw is not None else json.dumps(result, ensure_ascii=False)
+        with self.lock:
+            active = self.active[scan_id]
+        active.append(line, result)
+
+    def _load(self, scan_id: str) -> Optional[Tuple[ResultIndex, int, array, List[str]]]:
+        """
+        获取扫描的结果索引、结果数、块偏移和未压缩的结果
+
+        未结束的扫描使用内存中状态的快照，已结束的扫描从索引文件读入结果缓存
+        """
+        with self.lock:
+            active = self.active.get(scan_id)
+        if active is not None:
+            with active.lock:
+                return active.index, len(active.index), active.offsets[:], list(active.pending)
+
+        cached = result_cache.get((scan_id, "index"))
+        if cached is not None:
+            return cached
+        try:
+            with open(self._index_file(scan_id), 'rb') as f:
+                offsets, data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        index = ResultIndex.load(data)
+        loaded = (index, len(index), offsets, [])
+        result_cache.put((scan_id, "index"), loaded, index.nbytes() + offsets.itemsize * len(offsets))
+        return loaded
+
+    def _read_block(self, scan_id: str, offsets: array, block: int, f: IO) -> List[str]:
+        """读取并解压一个块，最近读取的块从结果缓存中获取"""
+        key = (scan_id, block)
+        lines = result_cache.get(key)
+        if lines is None:
+            f.seek(offsets[block])
+            lines = decode_block(f.read(offsets[block + 1] - offsets[block]))
+            result_cache.put(key, lines, block_size(lines))
+        return lines
+
+    def query_findings(self, scan_id: str, filters: Dict[str, str], cursor: int,
+                       limit: int, live: bool = False) -> Tuple[List[Dict], Optional[int]]:
+        loaded = self._load(scan_id)
+        if loaded is None:
+            return [], cursor if live else None
+        index, count, offsets, pending = loaded
+        blocks = len(offsets) - 1
+
+        ordinals, next_cursor = index.query(filters, cursor, limit, live)
+        if ordinals and ordinals[-1] >= count:
+            # 快照之后新写入的结果留到下一页
+            ordinals = [ordinal for ordinal in ordinals if ordinal < count]
+            next_cursor = count
+        elif next_cursor is not None and next_cursor > count:
+            next_cursor = max(cursor, count)
+
+        # 按序号所在的块读取本页结果，同一块只解压一次
+        items = []
+        if ordinals:
+            f = open(self._result_file(scan_id), 'rb') if blocks else None
+            try:
+                for ordinal in ordinals:
+                    block = block_of(ordinal)
+                    if block < blocks:
+                        line = self._read_block(scan_id, offsets, block, f)[ordinal - block * BLOCK_RECORDS]
+                    else:
+                        line = pending[ordinal - blocks * BLOCK_RECORDS]
+                    items.append(json.loads(line))
+            finally:
+                if f is not None:
+                    f.close()
+        return items, next_cursor
+
+    def iter_findings(self, scan_id: str) -> Iterator[Dict]:
+        loaded = self._load(scan_id)
+        if loaded is None:
+            return
+        _, _, offsets, pending = loaded
+        # 顺序读取全部块，不占用结果缓存
+        if len(offsets) > 1:
+            with open(self._result_file(scan_id), 'rb') as f:
+                for block in range(len(offsets) - 1):
+                    for line in decode_block(f.read(offsets[block + 1] - offsets[block])):
+                        yield json.loads(line)
+        for line in pending:
+            yield json.loads(line)
+
+    def recover_interrupted(self) -> int:
+        # 内存存储不跨进程保留任务
+        return 0
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite任务存储（WAL模式）
+
+    写操作由单独的写线程合并后批量提交，读操作使用各线程自己的连接，
+    WAL模式下读写互不阻塞。结果按scan_id、风险等级、主机等字段建立索引。
+
+    结果先以原文写入findings表，同一块的 BLOCK_RECORDS 条结果写齐（或扫描结束）后，
+    压缩为一个块写入finding_blocks表，并清空findings表中这些结果的原文（raw为空字符串）。
+    写线程只在内存中保留每个扫描未写齐的块，扫描结束后全部释放。
+
+    扫描结束时，由findings表中的字段生成结果索引（ResultIndex）写入finding_indexes表，
+    并删除该扫描在findings表中的全部记录，已结束扫描的结果只保存为压缩块和一个索引，
+    findings表只保存进行中的扫描。删除释放的页面通过增量清理（auto_vacuum=INCREMENTAL）
+    归还给文件系统；该设置只对新建的数据库生效，已有数据库中释放的页面由之后写入的结果复用。
+    序号不连续的扫描（例如服务重启时中断的扫描）保留在findings表中。
+
+    写队列有长度上限，写入跟不上时调用方阻塞等待。一批写操作提交失败时回滚后重试，
+    重试 write_retries 次仍失败则丢弃该批操作，并记录涉及的扫描，这些扫描结束时以失败状态保存。
+    """
+
+    # 第一次重试前的等待时间（秒），之后每次加倍
+    RETRY_INTERVAL = 0.5
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 0.5,
+                 queue_size: int = 10000, write_retries: int = 3):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_retries = write_retries
+        self.local = threading.local()
+        self.write_queue = queue.Queue(maxsize=queue_size)
+        # 写线程中未写齐的块：scan_id -> 块号 -> {序号: 原文}
+        self.open_blocks: Dict[str, Dict[int, Dict[int, str]]] = {}
+        # 有写操作最终失败的扫描：scan_id -> 错误信息
+        self.write_errors: Dict[str, str] = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.write_conn = self._connect()
+        self._init_schema()
+
+        # 启动写线程
+        self.writer_thread = threading.Thread(target=self._writer, daemon=True)
+        self.writer_thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建数据库连接"""
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """获取当前线程的只读连接"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self._connect()
+        return conn
+
+    def _init_schema(self) -> None:
+        """创建表和索引，并补齐新增的任务字段"""
+        conn = self.write_conn
+        # 只能在创建第一张表之前设置
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (scan_id TEXT PRIMARY KEY)")
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in JOB_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS findings ("
+                " id INTEGER PRIMARY KEY,"
+                " scan_id TEXT NOT NULL,"
+                " seq INTEGER NOT NULL,"
+                " severity TEXT,"
+                " template_id TEXT,"
+                " host TEXT,"
+                " type TEXT,"
+                " raw TEXT NOT NULL)"
+            )
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_findings_scan ON findings (scan_id, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_findings_severity ON findings (scan_id, severity, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_findings_host ON findings (scan_id, host, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_findings_template ON findings (scan_id, template_id, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_findings_type ON findings (scan_id, type, seq)")
+
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS finding_blocks ("
+                " scan_id TEXT NOT NULL,"
+                " block INTEGER NOT NULL,"
+                " data BLOB NOT NULL,"
+                " PRIMARY KEY (scan_id, block))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS finding_indexes ("
+                " scan_id TEXT PRIMARY KEY,"
+                " data BLOB NOT NULL)"
+            )
+
+    @staticmethod
+    def _encode(fields: Dict) -> Dict:
+        """将任务字段转换为数据库存储格式"""
+        encoded = {}
+        for key, value in fields.items():
+            if key not in JOB_COLUMNS:
+                continue
+            if key in JSON_FIELDS:
+                value = json.dumps(value, ensure_ascii=False) if value is not None else None
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, bool):
+                value = int(value)
+            encoded[key] = value
+        return encoded
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict:
+        """将数据库记录转换为任务字段"""
+        job = dict(row)
+        for key in DATETIME_FIELDS:
+            if job.get(key):
+                job[key] = datetime.fromisoformat(job[key])
+        for key in JSON_FIELDS:
+            if job.get(key):
+                job[key] = json.loads(job[key])
+        job["partial"] = bool(job.get("partial"))
+        return job
+
+    def create_job(self, scan_id: str, fields: Dict) -> None:
+        self.write_queue.put(("create", scan_id, self._encode(fields)))
+
+    def update_job(self, scan_id: str, fields: Dict) -> None:
+        self.write_queue.put(("update", scan_id, self._encode(fields)))
+
+    def finalize_job(self, scan_id: str, fields: Dict) -> Optional[str]:
+        # 压缩扫描最后一个不满的块并生成结果索引，在更新任务状态之前提交，
+        # 读到已结束状态的查询总能找到结果索引
+        self.write_queue.put(("seal", scan_id, None))
+        self.update_job(scan_id, fields)
+        self.flush()
+        error = self.write_errors.pop(scan_id, None)
+        if error is None:
+            return None
+        # 部分结果或状态未写入，以失败状态保存
+        error = f"写入任务存储失败: {error}"
+        self.update_job(scan_id, {"status": "failed", "error": error, "partial": True})
+        self.flush()
+        return error
+
+    def flush(self) -> None:
+        """等待此前提交的写操作全部落盘"""
+        done = threading.Event()
+        self.write_queue.put(("flush", None, done))
+        done.wait()
+
+    def add_finding(self, scan_id: str, seq: int, result: Dict, raw: Optional[str] = None) -> None:
+        fields = extract_fields(result)
+        row = (
+            scan_id, seq, fields["severity"], fields["template_id"], fields["host"], fields["type"],
+            raw if raw is not None else json.dumps(result, ensure_ascii=False)
+        )
+        self.write_queue.put(("finding", scan_id, row))
+
+    def _writer(self) -> None:
+        """写线程，合并队列中的写操作后批量提交"""
+        while True:
+            batch = [self.write_queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1][0] != "flush":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._apply_with_retry(batch)
+            finally:
+                for op, _, payload in batch:
+                    if op == "flush":
+                        payload.set()
+
+    def _apply_with_retry(self, batch: List[Tuple]) -> None:
+        """写入一批操作，失败时恢复内存中未写齐的块后重试，最终失败时记录涉及的扫描"""
+        touched = {scan_id for op, scan_id, _ in batch if op in ("finding", "seal")}
+        error = None
+        for attempt in range(self.write_retries + 1):
+            if attempt:
+                time.sleep(self.RETRY_INTERVAL * 2 ** (attempt - 1))
+            saved = {
+                scan_id: {block: dict(lines) for block, lines in self.open_blocks[scan_id].items()}
+                for scan_id in touched if scan_id in self.open_blocks
+            }
+            try:
+                self._apply(batch)
+                return
+            except Exception as e:
+                # 事务已回滚，内存中的块也恢复到写入前
+                for scan_id in touched:
+                    self.open_blocks.pop(scan_id, None)
+                self.open_blocks.update(saved)
+                error = e
+                logger.warning("写入任务存储失败（第%d次）: %s", attempt + 1, e)
+        scan_ids = {scan_id for _, scan_id, _ in batch if scan_id is not None}
+        logger.error("写入任务存储重试后仍失败，丢弃%d个写操作，涉及的扫描将以失败状态结束: %s",
+                     len(batch), ", ".join(sorted(scan_ids)))
+        for scan_id in scan_ids:
+            self.write_errors.setdefault(scan_id, str(error))
+
+    def _apply(self, batch: List[Tuple]) -> None:
+        """在一个事务中写入一批操作，同一任务的多次更新合并为一次"""
+        updates: Dict[str, Dict] = {}
+        findings = []
+        sealed = []
+        packed = False
+        with self.write_conn as conn:
+            for op, scan_id, payload in batch:
+                if op == "create":
+                    columns = ["scan_id"] + list(payload.keys())
+                    placeholders = ",".join("?" for _ in columns)
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO jobs ({','.join(columns)}) VALUES ({placeholders})",
+                        [scan_id] + list(payload.values())
+                    )
+                elif op == "update":
+                    updates.setdefault(scan_id, {}).update(payload)
+                elif op == "finding":
+                    findings.append(payload)
+                elif op == "seal":
+                    sealed.append(scan_id)
+
+            if findings:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO findings (scan_id, seq, severity, template_id, host, type, raw)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    findings
+                )
+                full = set()
+                for scan_id, seq, *_, raw in findings:
+                    block = block_of(seq)
+                    lines = self.open_blocks.setdefault(scan_id, {}).setdefault(block, {})
+                    lines[seq] = raw
+                    if len(lines) >= BLOCK_RECORDS:
+                        full.add((scan_id, block))
+                for scan_id, block in full:
+                    self._seal_block(conn, scan_id, block)
+            for scan_id in sealed:
+                for block in list(self.open_blocks.get(scan_id, {})):
+                    self._seal_block(conn, scan_id, block)
+                self.open_blocks.pop(scan_id, None)
+                packed = self._pack(conn, scan_id) or packed
+            for scan_id, fields in updates.items():
+                if not fields:
+                    continue
+                assignments = ",".join(f"{column} = ?" for column in fields)
+                conn.execute(
+                    f"UPDATE jobs SET {assignments} WHERE scan_id = ?",
+                    list(fields.values()) + [scan_id]
+                )
+        if packed:
+            # 将删除记录释放的页面归还给文件系统
+            self.write_conn.execute("PRAGMA incremental_vacuum")
+
+    def _seal_block(self, conn: sqlite3.Connection, scan_id: str, block: int) -> None:
+        """将一个块的结果压缩写入finding_blocks表，并清空这些结果的原文"""
+        blocks = self.open_blocks.get(scan_id, {})
+        lines = blocks.pop(block, None)
+        if not lines:
+            return
+        start = block * BLOCK_RECORDS
+        seqs = sorted(lines)
+        if seqs != list(range(start, start + len(seqs))):
+            # 序号不连续时无法按位置定位，保留原文
+            return
+        conn.execute(
+            "INSERT OR REPLACE INTO finding_blocks (scan_id, block, data) VALUES (?, ?, ?)",
+            (scan_id, block, encode_block([lines[seq] for seq in seqs]))
+        )
+        conn.execute(
+            "UPDATE findings SET raw = '' WHERE scan_id = ? AND seq >= ? AND seq < ?",
+            (scan_id, start, start + len(seqs))
+        )
+
+    def _pack(self, conn: sqlite3.Connection, scan_id: str) -> bool:
+        """
+        为已结束的扫描生成结果索引，并删除其在findings表中的记录
+
+        只有全部结果都已压缩为块、且序号从0开始连续（序号即索引中的编号）时才处理，
+        返回是否已处理
+        """
+        index = ResultIndex()
+        rows = conn.execute(
+            "SELECT seq, raw = '' AS sealed, severity, template_id, host, type FROM findings"
+            " WHERE scan_id = ? ORDER BY seq",
+            (scan_id,)
+        )
+        for row in rows:
+            if not row["sealed"] or row["seq"] != len(index):
+                return False
+            index.add_fields({field: row[field] for field in INDEX_FIELDS})
+        if not len(index):
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO finding_indexes (scan_id, data) VALUES (?, ?)", (scan_id, index.dump())
+        )
+        conn.execute("DELETE FROM findings WHERE scan_id = ?", (scan_id,))
+        return True
+
+    def _load_index(self, scan_id: str) -> Optional[ResultIndex]:
+        """获取已结束扫描的结果索引，最近读取的索引从结果缓存中获取；扫描未结束时返回None"""
+        index = result_cache.get((scan_id, "index"))
+        if index is None:
+            row = self._reader().execute(
+                "SELECT data FROM finding_indexes WHERE scan_id = ?", (scan_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            index = ResultIndex.load(row["data"])
+            result_cache.put((scan_id, "index"), index, index.nbytes())
+        return index
+
+    @contextmanager
+    def _snapshot(self) -> Iterator[sqlite3.Connection]:
+        """在一个读事务中执行多条查询，期间提交的写操作（例如删除已结束扫描的记录）不可见"""
+        conn = self._reader()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.commit()
+
+    def _read_block(self, scan_id: str, block: int, cache: bool = True) -> List[str]:
+        """读取并解压一个块，cache为True时最近读取的块从结果缓存中获取"""
+        key = (scan_id, block)
+        lines = result_cache.get(key) if cache else None
+        if lines is None:
+            row = self._reader().execute(
+                "SELECT data FROM finding_blocks WHERE scan_id = ? AND block = ?", (scan_id, block)
+            ).fetchone()
+            lines = decode_block(row["data"])
+            if cache:
+                result_cache.put(key, lines, block_size(lines))
+        return lines
+
+    def _read_lines(self, scan_id: str, seqs: List[int], cache: bool = True) -> List[str]:
+        """按序号从块中读取一批结果的原文，序号递增时同一块只解压一次"""
+        raws = []
+        lines, current = None, None
+        for seq in seqs:
+            block = block_of(seq)
+            if block != current:
+                lines, current = self._read_block(scan_id, block, cache), block
+            raws.append(lines[seq - block * BLOCK_RECORDS])
+        return raws
+
+    def _decode_rows(self, scan_id: str, rows: List[sqlite3.Row], cache: bool = True) -> List[str]:
+        """获取一批结果的原文，原文已压缩的结果从所在的块中读取"""
+        sealed = iter(self._read_lines(scan_id, [row["seq"] for row in rows if row["raw"] == ""], cache))
+        return [row["raw"] if row["raw"] != "" else next(sealed) for row in rows]
+
+    def get_job(self, scan_id: str) -> Optional[Dict]:
+        row = self._reader().execute("SELECT * FROM jobs WHERE scan_id = ?", (scan_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def query_findings(self, scan_id: str, filters: Dict[str, str], cursor: int,
+                       limit: int, live: bool = False) -> Tuple[List[Dict], Optional[int]]:
+        # 扫描可能在两次查询之间结束并删除findings表中的记录，在同一个读事务中查询
+        with self._snapshot():
+            index = self._load_index(scan_id)
+            if index is not None:
+                ordinals, next_cursor = index.query(filters, cursor, limit, live)
+                return [json.loads(raw) for raw in self._read_lines(scan_id, ordinals)], next_cursor
+            return self._query_rows(scan_id, filters, cursor, limit, live)
+
+    def _query_rows(self, scan_id: str, filters: Dict[str, str], cursor: int,
+                    limit: int, live: bool) -> Tuple[List[Dict], Optional[int]]:
+        """从findings表中分页查询进行中（或未生成结果索引）的扫描的结果"""
+        conn = self._reader()
+        conditions = ["scan_id = ?", "seq >= ?"]
+        params: List = [scan_id, cursor]
+        end_cursor = None
+        if live:
+            # 结果按序号顺序提交，已提交的结果总是序号连续的前缀；
+            # 先确定当前末尾并只查询末尾之前的结果，之后提交的结果从末尾开始读取
+            end = conn.execute("SELECT MAX(seq) FROM findings WHERE scan_id = ?", (scan_id,)).fetchone()[0]
+            end_cursor = max(cursor, end + 1 if end is not None else 0)
+            conditions.append("seq < ?")
+            params.append(end_cursor)
+        for field, value in filters.items():
+            conditions.append(f"{field} = ?")
+            params.append(value)
+        # 多取一条用于判断是否还有下一页
+        params.append(limit + 1)
+
+        rows = conn.execute(
+            f"SELECT seq, raw FROM findings WHERE {' AND '.join(conditions)} ORDER BY seq LIMIT ?",
+            params
+        ).fetchall()
+
+        items = [json.loads(raw) for raw in self._decode_rows(scan_id, rows[:limit])]
+        next_cursor = rows[limit - 1]["seq"] + 1 if len(rows) > limit else end_cursor
+        return items, next_cursor
+
+    def iter_findings(self, scan_id: str) -> Iterator[Dict]:
+        index = self._load_index(scan_id)
+        if index is not None:
+            # 顺序读取全部块，不占用结果缓存
+            for block in range(block_of(len(index) - 1) + 1):
+                for raw in self._read_block(scan_id, block, cache=False):
+                    yield json.loads(raw)
+            return
+
+        # 分批读取，避免一次性载入全部结果
+        cursor = 0
+        while True:
+            items, next_cursor = self._query_raw(scan_id, cursor, self.batch_size)
+            for raw in items:
+                yield json.loads(raw)
+            if next_cursor is None:
+                return
+            cursor = next_cursor
+
+    def _query_raw(self, scan_id: str, cursor: int, limit: int) -> Tuple[List[str], Optional[int]]:
+        """按序号读取一批原始结果"""
+        rows = self._reader().execute(
+            "SELECT seq, raw FROM findings WHERE scan_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (scan_id, cursor, limit)
+        ).fetchall()
+        next_cursor = rows[-1]["seq"] + 1 if len(rows) == limit else None
+        # 导出时顺序读取全部块，不占用结果缓存
+        return self._decode_rows(scan_id, rows, cache=False), next_cursor
+
+    def recover_interrupted(self) -> int:
+        placeholders = ",".join("?" for _ in ACTIVE_STATUSES)
+        with self.write_conn as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = 'failed', error = ?, partial = (completed > 0), end_time = ?"
+                f" WHERE status IN ({placeholders})",
+                ["服务重启，扫描任务已中断", datetime.now().isoformat()] + list(ACTIVE_STATUSES)
+            )
+        return cursor.rowcount
+
+
+def create_job_store() -> JobStore:
+    """根据配置创建任务存储"""
+    if current_config.JOB_STORE == "memory":
+        return MemoryJobStore(current_config.RESULTS_DIR)
+    if current_config.JOB_STORE == "sqlite":
+        return SQLiteJobStore(
+            current_config.JOB_STORE_PATH,
+            batch_size=current_config.JOB_STORE_BATCH_SIZE,
+            flush_interval=current_config.JOB_STORE_FLUSH_INTERVAL,
+            queue_size=current_config.JOB_STORE_QUEUE_SIZE,
+            write_retries=current_config.JOB_STORE_WRITE_RETRIES
+        )
+    raise ValueError(f"不支持的任务存储类型: {current_config.JOB_STORE}")
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus监控指标，覆盖扫描流水线的各个阶段和API请求
+"""
+import threading
+import time
+from typing import Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# 扫描调度
+QUEUE_DEPTH = Gauge("easm_scan_queue_depth", "等待执行的扫描分片数")
+ACTIVE_SCANS = Gauge("easm_active_scans", "正在执行的扫描分片数")
+DISPATCH_WAIT = Histogram(
+    "easm_scan_dispatch_wait_seconds", "扫描分片从提交到开始执行的等待时长",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+)
+SCAN_DURATION = Histogram(
+    "easm_scan_duration_seconds", "扫描任务从开始执行到结束的时长", ["status"],
+    buckets=(1, 5, 15, 60, 300, 900, 1800, 3600, 7200, 14400)
+)
+
+# nuclei资源调控
+GOVERNOR_ALLOCATED = Gauge("easm_governor_allocated_share", "已分配给运行中nuclei进程的预算比例")
+GOVERNOR_SCALE = Gauge("easm_governor_scale", "按主机CPU负载调整后可分配的预算比例")
+
+# 结果处理，每秒结果数使用 rate(easm_findings_ingested_total[1m]) 计算
+FINDINGS_INGESTED = Counter("easm_findings_ingested_total", "写入任务存储的扫描结果数", ["source"])
+BYTES_PARSED = Counter("easm_nuclei_output_bytes_total", "解析的nuclei输出字节数", ["stream"])
+RESULT_CACHE_SIZE = Gauge("easm_result_cache_bytes", "结果块缓存占用的字节数")
+
+# API请求
+REQUEST_LATENCY = Histogram(
+    "easm_http_request_duration_seconds", "API请求从收到到开始返回响应的时长", ["method", "route", "status"]
+)
+
+# 锁等待
+LOCK_WAIT = Histogram(
+    "easm_lock_wait_seconds", "获取锁的等待时长", ["lock"],
+    buckets=(0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1, 1)
+)
+
+
+class InstrumentedLock:
+    """记录获取等待时长的互斥锁，用法与 threading.Lock 相同"""
+
+    def __init__(self, name: str):
+        self._lock = threading.Lock()
+        self._wait = LOCK_WAIT.labels(name)
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        self._wait.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+
+class NucleiProcessCollector:
+    """
+    nuclei子进程的CPU和内存指标，在抓取时通过psutil采集
+
+    CPU使用率为两次抓取之间的平均值，首次采集的进程记为0
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # pid -> psutil.Process
+        self.processes: Dict[int, object] = {}
+
+    def track(self, pid: int) -> None:
+        """开始采集nuclei进程"""
+        try:
+            import psutil
+        except ImportError:
+            return
+        try:
+            process = psutil.Process(pid)
+            process.cpu_percent(None)
+        except psutil.Error:
+            return
+        with self.lock:
+            self.processes[pid] = process
+
+    def untrack(self, pid: int) -> None:
+        """停止采集nuclei进程"""
+        with self.lock:
+            self.processes.pop(pid, None)
+
+    def collect(self):
+        cpu = GaugeMetricFamily("easm_nuclei_cpu_percent", "运行中nuclei进程的CPU使用率之和")
+        rss = GaugeMetricFamily("easm_nuclei_rss_bytes", "运行中nuclei进程的常驻内存之和")
+        count = GaugeMetricFamily("easm_nuclei_processes", "运行中的nuclei进程数")
+
+        with self.lock:
+            processes = list(self.processes.values())
+        total_cpu = 0.0
+        total_rss = 0
+        running = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    total_cpu += process.cpu_percent(None)
+                    total_rss += process.memory_info().rss
+                running += 1
+            except Exception:
+                # 进程已退出
+                continue
+
+        cpu.add_metric([], total_cpu)
+        rss.add_metric([], total_rss)
+        count.add_metric([], running)
+        return [cpu, rss, count]
+
+
+nuclei_processes = NucleiProcessCollector()
+REGISTRY.register(nuclei_processes)
+
+
+class MetricsMiddleware:
+    """
+    记录每个路由的请求时长（ASGI中间件）
+
+    时长截止到响应开始返回，流式响应（事件推送、导出）不计入传输时间；
+    路由使用路径模板（如 /api/v1/scan/{scan_id}/status），避免按扫描ID产生大量时间序列
+    """
+
+    def __init__(self, app, prefix: str = ""):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        observed = False
+
+        def observe(status: int) -> None:
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], path, str(status)).observe(time.perf_counter() - start)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            observe(500)
+            raise
+
+
+def render_metrics():
+    """生成Prometheus文本格式的指标，返回(内容, 媒体类型)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+nuclei进程的启动和监督，供API节点的扫描器和独立的扫描工作进程共用
+"""
+import asyncio
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from collections import deque
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+from config import current_config
+from service.metrics import BYTES_PARSED, nuclei_processes
+from service.resource_governor import Allocation
+
+# 保留的stderr末尾行数，用于生成错误信息
+STDERR_TAIL_LINES = 50
+
+# asyncio引擎读取nuclei输出时单行的最大字节数，超长的行被丢弃
+STREAM_LIMIT = 16 * 1024 * 1024
+
+# asyncio引擎中已读取、等待回调处理的最多行数，超过时暂停读取
+LINE_QUEUE_SIZE = 1024
+
+# asyncio引擎一次交给线程池处理的最多行数
+LINE_BATCH_SIZE = 256
+
+NUCLEI_NOT_FOUND_ERROR = (
+    "找不到nuclei可执行文件。请确保nuclei已安装并添加到系统PATH中，"
+    "或在config.py中正确配置NUCLEI_PATH。当前配置的路径: {path}"
+)
+
+# 输出行回调（参数为stdout的一行）和进度回调（参数为0-99的百分比）
+OutputHandler = Callable[[str], None]
+ProgressHandler = Callable[[int], None]
+
+
+class NucleiRun(NamedTuple):
+    """nuclei进程的结束情况"""
+    returncode: Optional[int]
+    timed_out: bool
+    stderr_tail: deque
+
+
+def write_target_file(targets: Iterable[str]) -> str:
+    """将目标逐行写入临时文件，返回文件路径"""
+    fd, path = tempfile.mkstemp(dir=current_config.TEMP_DIR, suffix=".txt")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for target in targets:
+            f.write(target + '\n')
+    return path
+
+
+def build_command(target_file: str, templates: Optional[List[str]], verbose: bool,
+                  allocation: Optional[Allocation] = None, tags: Optional[List[str]] = None,
+                  severity: Optional[List[str]] = None) -> List[str]:
+    """
+    构建nuclei命令
+
+    allocation 为资源调控器分配的并发和速率参数（为None时使用nuclei默认值），
+    tags 和 severity 按标签和风险等级筛选模板
+    """
+    # 移除Windows不支持的/dev/stdout参数
+    cmd = [current_config.NUCLEI_PATH, "-l", target_file, "-json"]
+
+    # 以JSON格式周期性输出统计信息到stderr，用于计算扫描进度
+    cmd.extend(["-stats", "-sj", "-si", str(current_config.STATS_INTERVAL)])
+
+    # 添加模板参数，配置了模板目录时相对路径按模板目录解析，未指定模板时使用整个模板目录
+    template_dir = current_config.NUCLEI_TEMPLATE_DIR
+    if templates:
+        if template_dir:
+            templates = [os.path.join(template_dir, template) for template in templates]
+        cmd.extend(["-t", ",".join(templates)])
+    elif template_dir:
+        cmd.extend(["-t", template_dir])
+    if tags:
+        cmd.extend(["-tags", ",".join(tags)])
+    if severity:
+        cmd.extend(["-severity", ",".join(severity)])
+
+    # 添加并发和速率限制参数
+    if allocation is not None:
+        cmd.extend([
+            "-c", str(allocation.concurrency),
+            "-bs", str(allocation.bulk_size),
+            "-rl", str(allocation.rate_limit)
+        ])
+
+    # 添加详细参数
+    if verbose:
+        cmd.append("-v")
+    return cmd
+
+
+def parse_stats_percent(line: str) -> Optional[int]:
+    """解析 -stats -sj 输出的统计信息，返回进度百分比，不是统计信息时返回None"""
+    if not line.startswith("{"):
+        return None
+    try:
+        stats = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(stats, dict) or "percent" not in stats:
+        return None
+    try:
+        return max(0, min(99, int(float(stats["percent"]))))
+    except (TypeError, ValueError):
+        return None
+
+
+def failure_message(run: NucleiRun, timeout: int) -> Optional[str]:
+    """根据nuclei进程的结束情况生成错误信息，扫描成功时返回None"""
+    if run.timed_out:
+        return f"扫描超时，已超过{timeout}秒"
+    if run.returncode != 0:
+        # 确保错误信息不为空
+        error_output = "\n".join(run.stderr_tail) if run.stderr_tail else "(无错误输出)"
+        return f"nuclei扫描失败，返回码: {run.returncode}。错误信息: {error_output}"
+    return None
+
+
+def _handle_stderr_line(line: str, on_progress: ProgressHandler, stderr_tail: deque) -> None:
+    """统计信息用于更新进度，其余内容保留在末尾缓冲中"""
+    BYTES_PARSED.labels("stderr").inc(len(line.encode('utf-8')))
+    line = line.strip()
+    if not line:
+        return
+    percent = parse_stats_percent(line)
+    if percent is not None:
+        on_progress(percent)
+    else:
+        stderr_tail.append(line)
+
+
+def start_nuclei(cmd: List[str]) -> subprocess.Popen:
+    """启动nuclei进程，找不到可执行文件时抛出FileNotFoundError"""
+    return subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        bufsize=1
+    )
+
+
+def run_nuclei(process: subprocess.Popen, timeout: int, on_output: OutputHandler,
+               on_progress: ProgressHandler) -> NucleiRun:
+    """
+    监督nuclei进程直到结束
+
+    stdout在当前线程逐行读取，stderr由单独的线程读取，超时后由定时器结束进程，
+    使逐行读取的循环自然退出
+    """
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    stdout_bytes = BYTES_PARSED.labels("stdout")
+    nuclei_processes.track(process.pid)
+
+    def drain_stderr() -> None:
+        for line in process.stderr:
+            _handle_stderr_line(line, on_progress, stderr_tail)
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    timed_out = threading.Event()
+
+    def kill_on_timeout() -> None:
+        if process.poll() is None:
+            timed_out.set()
+            process.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.daemon = True
+    timer.start()
+
+    try:
+        for line in process.stdout:
+            stdout_bytes.inc(len(line.encode('utf-8')))
+            on_output(line)
+        process.wait()
+        stderr_thread.join()
+        return NucleiRun(process.returncode, timed_out.is_set(), stderr_tail)
+    finally:
+        timer.cancel()
+        nuclei_processes.untrack(process.pid)
+        if process.poll() is None:
+            process.kill()
+
+
+async def start_nuclei_async(cmd: List[str]) -> asyncio.subprocess.Process:
+    """在事件循环中启动nuclei进程，找不到可执行文件时抛出FileNotFoundError"""
+    return await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=STREAM_LIMIT
+    )
+
+
+class LineSink:
+    """
+    在线程池中按顺序处理asyncio引擎读取的输出行
+
+    输出回调会写入任务存储、更新任务状态，都是阻塞操作。读取输出的协程只把行放入有界队列，
+    处理协程每次取出一批交给线程池执行回调，事件循环不被阻塞；
+    回调跟不上时队列写满，读取随之暂停，nuclei的输出管道阻塞，形成背压。
+    """
+
+    def __init__(self, handler: Callable[[str], None]):
+        self.handler = handler
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LINE_QUEUE_SIZE)
+        self.error: Optional[BaseException] = None
+        self.task = asyncio.ensure_future(self._run())
+
+    async def put(self, line: str) -> None:
+        """放入一行，回调已经出错时抛出该异常，停止读取"""
+        if self.error is not None:
+            raise self.error
+        await self.queue.put(line)
+
+    async def close(self) -> None:
+        """等待已放入的行全部处理完，回调出错时抛出该异常"""
+        await self.queue.put(None)
+        await self.task
+        if self.error is not None:
+            raise self.error
+
+    def _handle(self, lines: List[str]) -> None:
+        for line in lines:
+            self.handler(line)
+
+    async def _run(self) -> None:
+        while True:
+            lines = [await self.queue.get()]
+            while len(lines) < LINE_BATCH_SIZE and not self.queue.empty():
+                lines.append(self.queue.get_nowait())
+            # None为结束标记，总是最后放入
+            finished = lines[-1] is None
+            if finished:
+                lines.pop()
+            # 出错后继续取出剩余的行，不让读取的协程阻塞在已满的队列上
+            if lines and self.error is None:
+                try:
+                    await asyncio.to_thread(self._handle, lines)
+                except Exception as e:
+                    self.error = e
+            if finished:
+                return
+
+
+async def _read_lines(stream: asyncio.StreamReader, sink: LineSink, counter=None) -> None:
+    """异步逐行读取输出，交给sink处理"""
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:
+            # 超过STREAM_LIMIT的行已被丢弃
+            continue
+        if not line:
+            return
+        if counter is not None:
+            counter.inc(len(line))
+        await sink.put(line.decode('utf-8', errors='replace'))
+
+
+async def run_nuclei_async(process: asyncio.subprocess.Process, timeout: int, on_output: OutputHandler,
+                           on_progress: ProgressHandler) -> NucleiRun:
+    """
+    在事件循环中监督nuclei进程直到结束
+
+    stdout和stderr异步读取，超时由 asyncio.wait 控制，超时、出错或任务被取消时结束nuclei进程。
+    on_output 和 on_progress 在线程池中按输出顺序执行（见LineSink），返回前已读取的行全部处理完
+    """
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    nuclei_processes.track(process.pid)
+    sinks = [
+        LineSink(on_output),
+        LineSink(lambda line: _handle_stderr_line(line, on_progress, stderr_tail))
+    ]
+    tasks = [
+        asyncio.ensure_future(_read_lines(process.stdout, sinks[0], BYTES_PARSED.labels("stdout"))),
+        asyncio.ensure_future(_read_lines(process.stderr, sinks[1])),
+        asyncio.ensure_future(process.wait())
+    ]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            # 读取或处理输出时出现的异常直接抛出
+            task.result()
+        timed_out = bool(pending)
+    finally:
+        nuclei_processes.untrack(process.pid)
+        if process.returncode is None:
+            process.kill()
+        # 停止读取输出，并等待进程退出
+        for task in tasks[:2]:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 处理完已读取的输出，超时或失败前写入的结果仍然保留
+        errors = await asyncio.gather(*(sink.close() for sink in sinks), return_exceptions=True)
+    for error in errors:
+        if isinstance(error, Exception):
+            raise error
+    return NucleiRun(process.returncode, timed_out, stderr_tail)
@@ -2,332 +2,877 @@
 """
 nuclei扫描器服务，负责调用nuclei命令行工具进行资产发现和枚举
 """
-import subprocess
+import asyncio
 import json
+import logging
 import os
+import socket
 import uuid
 import threading
-import queue
 import time
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from collections import Counter
+from typing import IO, Callable, List, Dict, Optional, Set, Tuple
 import tempfile
 
-from model.asset_model import Target, ScanResult, ScanStatus
+from model.asset_model import Target, ScanStatus, ShardStatus, ResultPage
 from config import current_config
+from service.scan_scheduler import ScanScheduler
+from service.scan_job import ScanJob
+from service.event_broker import event_broker
+from service.result_index import finding_key, normalize_filters
+from service.job_store import ACTIVE_STATUSES, create_job_store
+from service.target_normalizer import TargetNormalizer
+from service.scan_cache import ScanCache, template_key, finding_targets
+from service.result_exporter import ResultExporter, ExportArtifact, EXPORT_FORMATS
+from service.queue_backend import create_queue_backend
+from service.resource_governor import create_governor
+from service.template_selector import ScanPass, ScanPlan, create_plan
+from service.template_index import template_index
+from service.metrics import (
+    ACTIVE_SCANS, DISPATCH_WAIT, FINDINGS_INGESTED, QUEUE_DEPTH, SCAN_DURATION, InstrumentedLock
+)
+from service.nuclei_process import (
+    NUCLEI_NOT_FOUND_ERROR, build_command, failure_message, write_target_file,
+    start_nuclei, run_nuclei, start_nuclei_async, run_nuclei_async
+)
+
+logger = logging.getLogger(__name__)
 
 class NucleiScanner:
     """nuclei扫描器类，封装了调用nuclei命令行工具的功能"""
     
     def __init__(self):
         """初始化扫描器"""
-        self.scan_jobs = {}
-        self.scan_queue = queue.Queue()
+        # 仅保存未结束的任务（scan_id -> ScanJob），结束后的任务从任务存储中读取
+        self.scan_jobs: Dict[str, ScanJob] = {}
         self.max_concurrent_scans = current_config.MAX_CONCURRENT_SCANS
-        self.active_scans = 0
-        self.lock = threading.Lock()
+        # 只保护scan_jobs的增删，任务状态由各任务自己的锁保护
+        self.lock = InstrumentedLock("scanner")
         
         # 创建结果存储目录
         os.makedirs(current_config.RESULTS_DIR, exist_ok=True)
         os.makedirs(current_config.TEMP_DIR, exist_ok=True)
         
-        # 启动扫描工作线程
-        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
-        self.worker_thread.start()
+        # 初始化任务存储，上次运行时未结束的任务标记为失败
+        self.store = create_job_store()
+        self.store.recover_interrupted()
+        
+        # 增量扫描缓存
+        self.scan_cache = ScanCache(current_config.SCAN_CACHE_PATH, current_config.SCAN_CACHE_TTL)
+        
+        # 导出文件缓存
+        self.exporter = ResultExporter(current_config.EXPORT_CACHE_DIR)
+        
+        # asyncio引擎使用的事件循环，应用启动时挂接应用的事件循环
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_lock = threading.Lock()
+        self.scan_tasks: Set[asyncio.Task] = set()
+        
+        # 分布式模式下扫描分片提交到任务队列，由工作进程执行并回传事件
+        self.queue = None
+        self.scheduler = None
+        # 分布式模式下各分片已写入结果的标识：(scan_id, 分片序号) -> [之前的租约写入的, 当前租约写入的]，
+        # 只由消费事件的线程访问
+        self.shard_findings: Dict[Tuple[str, int], List[Counter]] = {}
+        # 分布式模式下处理失败的事件：(scan_id, 分片序号) -> 错误信息，分片结束时以失败状态保存
+        self.event_errors: Dict[Tuple[str, int], str] = {}
+        if current_config.SCAN_MODE == "distributed":
+            # 工作进程只向提交任务的API节点回传事件
+            self.node_id = current_config.API_NODE_ID or f"{socket.gethostname()}-{os.getpid()}"
+            self.queue = create_queue_backend()
+            consumer = threading.Thread(target=self._consume_worker_events, daemon=True)
+            consumer.start()
+        # 启动扫描调度器，槽位释放后立即分发排队中的任务
+        elif current_config.SCAN_ENGINE == "asyncio":
+            self.scheduler = ScanScheduler(
+                self._run_job_async, self.max_concurrent_scans, loop_getter=self._get_loop, on_error=self._fail_job
+            )
+        elif current_config.SCAN_ENGINE == "thread":
+            self.scheduler = ScanScheduler(self._run_job, self.max_concurrent_scans, on_error=self._fail_job)
+        else:
+            raise ValueError(f"不支持的扫描引擎: {current_config.SCAN_ENGINE}")
+        
+        # 为本机启动的nuclei进程分配并发和速率参数（分布式模式下由工作进程分配）
+        self.governor = create_governor(self.max_concurrent_scans) if self.scheduler is not None else None
+        
+        # 监控指标在抓取时读取
+        QUEUE_DEPTH.set_function(self.queue_depth)
+        ACTIVE_SCANS.set_function(self.active_count)
+    
+    def queue_depth(self) -> int:
+        """等待执行的扫描分片数"""
+        if self.queue is not None:
+            return self.queue.queue_depth()
+        return self.scheduler.queue_depth()
+    
+    def active_count(self) -> int:
+        """正在执行的扫描分片数"""
+        if self.queue is not None:
+            return sum(
+                1 for job in list(self.scan_jobs.values())
+                for shard in job.snapshot["shards"] if shard["status"] == "running"
+            )
+        return self.scheduler.active_count()
+    
+    def attach_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """使用应用的事件循环执行asyncio引擎的扫描"""
+        with self.loop_lock:
+            self.loop = loop
+    
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """获取asyncio引擎的事件循环，未挂接应用事件循环时（例如在脚本中直接使用）启动独立的事件循环线程"""
+        with self.loop_lock:
+            if self.loop is None or self.loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="scan-loop", daemon=True).start()
+                self.loop = loop
+            return self.loop
+    
+    async def cancel_running_scans(self) -> None:
+        """取消asyncio引擎中正在执行的扫描（应用关闭时调用），nuclei进程随之结束"""
+        tasks = list(self.scan_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _run_job(self, scan_id: str, payload: Tuple, queue_wait: float) -> None:
+        """调度器回调，记录排队等待时长后执行一个扫描分片"""
+        shard_index, shard_count, targets, templates, verbose, timeout, incremental, fingerprint = payload
+        if not self._start_shard(scan_id, shard_index, round(queue_wait, 3)):
+            return
+        
+        status, error = self._scan(
+            scan_id, shard_index, shard_count, targets, templates, verbose, timeout, incremental, fingerprint
+        )
+        self._finish_shard(scan_id, shard_index, status, error)
     
-    def _worker(self):
-        """工作线程，负责从队列中获取扫描任务并执行"""
+    def _fail_job(self, scan_id: str, payload: Tuple, error: str) -> None:
+        """调度器回调，分片未能提交或执行异常退出时，将尚未结束的分片记为失败"""
+        job = self.scan_jobs.get(scan_id)
+        shard_index = payload[0]
+        if job is None or job.snapshot["shards"][shard_index]["status"] in ("completed", "failed"):
+            return
+        self._finish_shard(scan_id, shard_index, "failed", error)
+    
+    async def _run_job_async(self, scan_id: str, payload: Tuple, queue_wait: float) -> None:
+        """asyncio引擎的调度器回调，在事件循环中执行一个扫描分片"""
+        shard_index, shard_count, targets, templates, verbose, timeout, incremental, fingerprint = payload
+        # 写入任务存储可能因写队列已满而等待，与结果处理一样在线程池中执行
+        if not await asyncio.to_thread(self._start_shard, scan_id, shard_index, round(queue_wait, 3)):
+            return
+        
+        task = asyncio.current_task()
+        self.scan_tasks.add(task)
+        try:
+            status, error = await self._scan_async(
+                scan_id, shard_index, shard_count, targets, templates, verbose, timeout, incremental, fingerprint
+            )
+        except asyncio.CancelledError:
+            self._finish_shard(scan_id, shard_index, "failed", "扫描已取消")
+            raise
+        finally:
+            self.scan_tasks.discard(task)
+        # 结束任务时需要等待任务存储落盘，在线程池中执行，避免阻塞事件循环
+        await asyncio.to_thread(self._finish_shard, scan_id, shard_index, status, error)
+    
+    def _consume_worker_events(self) -> None:
+        """
+        分布式模式下按顺序消费工作进程回传给本节点的事件
+        
+        事件通道中只有本节点提交的分片的事件，读取到的事件全部由本节点处理后确认。
+        处理失败的事件记入所属分片，分片结束时以失败状态保存
+        """
         while True:
-            if self.active_scans < self.max_concurrent_scans:
-                try:
-                    # 非阻塞方式获取队列中的任务
-                    scan_id, targets, templates, verbose, timeout = self.scan_queue.get(block=False)
-                    
-                    with self.lock:
-                        self.active_scans += 1
-                    
-                    # 启动扫描线程
-                    scan_thread = threading.Thread(
-                        target=self._scan, 
-                        args=(scan_id, targets, templates, verbose, timeout)
-                    )
-                    scan_thread.daemon = True
-                    scan_thread.start()
-                    
-                    # 标记任务为完成
-                    self.scan_queue.task_done()
-                except queue.Empty:
-                    # 队列为空，等待一段时间再尝试
-                    time.sleep(1)
+            events = []
+            try:
+                events, token = self.queue.pull_events(self.node_id, current_config.WORKER_EVENT_BATCH_SIZE)
+                for event in events:
+                    try:
+                        self._apply_worker_event(event)
+                    except Exception as e:
+                        logger.exception("处理工作进程事件失败: %s", event.get("type"))
+                        self._record_event_error(event, f"处理工作进程事件失败: {str(e)}")
+                self.queue.ack_events(self.node_id, token)
+            except Exception:
+                logger.exception("读取工作进程事件失败")
+            if not events:
+                time.sleep(current_config.WORKER_POLL_INTERVAL)
+    
+    def _record_event_error(self, event: Dict, error: str) -> None:
+        """记录分片的事件处理错误，只保留第一个错误"""
+        try:
+            shard_key = (event["scan_id"], event["shard_index"])
+        except (KeyError, TypeError):
+            return
+        if shard_key[0] in self.scan_jobs:
+            self.event_errors.setdefault(shard_key, error)
+    
+    def _apply_worker_event(self, event: Dict) -> None:
+        """
+        应用一条工作进程回传的事件
+        
+        分片被重新租用后（原工作进程崩溃或失联）以新的租用次数重新开始，
+        旧租约回传的事件被忽略；崩溃前已回传的结果保留，重新扫描时再次回传的相同结果不重复写入
+        """
+        scan_id = event["scan_id"]
+        shard_index = event["shard_index"]
+        shard_key = (scan_id, shard_index)
+        job = self.scan_jobs.get(scan_id)
+        if job is None:
+            # 任务已结束，本节点不再需要该分片的事件
+            self.shard_findings.pop(shard_key, None)
+            self.event_errors.pop(shard_key, None)
+            return
+        
+        restarted = False
+        with job.lock:
+            shard = job.state["shards"][shard_index]
+            current_attempt = shard.get("attempt", 0)
+            if event["type"] == "start" and event["attempt"] > current_attempt:
+                restarted = current_attempt > 0
+                shard["attempt"] = current_attempt = event["attempt"]
+        if event["attempt"] != current_attempt:
+            return
+        
+        if event["type"] == "start":
+            previous, current = self.shard_findings.setdefault(shard_key, [Counter(), Counter()])
+            if restarted:
+                # 之前各次租约写入的结果在本次扫描中再次出现时跳过
+                previous.update(current)
+                current.clear()
+            self._start_shard(scan_id, shard_index, event["queue_wait"])
+        elif event["type"] == "finding":
+            self._handle_worker_finding(scan_id, shard_index, event["line"])
+        elif event["type"] == "progress":
+            self._update_shard_progress(scan_id, shard_index, event["percent"])
+        elif event["type"] == "finish":
+            self.shard_findings.pop(shard_key, None)
+            error = self.event_errors.pop(shard_key, None)
+            if error is not None:
+                # 部分事件未能处理，分片结果不完整
+                self._finish_shard(scan_id, shard_index, "failed", error)
             else:
-                # 达到最大并发数，等待一段时间再尝试
-                time.sleep(1)
-    
-    def _prepare_target_file(self, targets: List[Target]) -> str:
-        """准备目标文件"""
-        target_list = []
-        for target in targets:
-            if target.url:
-                target_list.append(str(target.url))
-            elif target.domain:
-                target_list.append(target.domain)
-            elif target.ip:
-                if target.port:
-                    target_list.append(f"{target.ip}:{target.port}")
-                else:
-                    target_list.append(target.ip)
-        
-        # 创建临时文件
+                self._finish_shard(scan_id, shard_index, event["status"], event["error"])
+    
+    def _handle_worker_finding(self, scan_id: str, shard_index: int, line: str) -> None:
+        """写入工作进程回传的一条结果，分片重新扫描时跳过之前的租约已写入的相同结果"""
+        try:
+            key = finding_key(json.loads(line))
+        except (json.JSONDecodeError, AttributeError):
+            return
+        previous, current = self.shard_findings.setdefault((scan_id, shard_index), [Counter(), Counter()])
+        current[key] += 1
+        if previous[key] > 0:
+            previous[key] -= 1
+            if not previous[key]:
+                del previous[key]
+            return
+        self._handle_output_line(scan_id, shard_index, line, None)
+    
+    def _start_shard(self, scan_id: str, shard_index: int, queue_wait: float) -> bool:
+        """将分片标记为运行中，任务已不存在时返回False"""
+        job = self.scan_jobs.get(scan_id)
+        if job is None:
+            return False
+        with job.lock:
+            state = job.state
+            state["shards"][shard_index].update(status="running", queue_wait=queue_wait)
+            # 第一个分片开始执行时，任务进入运行状态
+            if state["status"] == "pending":
+                state.update(status="running", start_time=datetime.now(), queue_wait=queue_wait)
+            snapshot = job.publish()
+            self.store.update_job(scan_id, {
+                key: snapshot[key] for key in ("status", "start_time", "queue_wait", "shards")
+            })
+        DISPATCH_WAIT.observe(queue_wait)
+        self._publish_status(scan_id)
+        return True
+    
+    @staticmethod
+    def _job_progress(job: Dict) -> int:
+        """按分片目标数加权计算任务整体进度"""
+        shards = job["shards"]
+        total = sum(shard["total"] for shard in shards)
+        if total == 0:
+            return 0
+        return min(99, int(sum(shard["progress"] * shard["total"] for shard in shards) / total))
+    
+    def _update_shard_progress(self, scan_id: str, shard_index: int, percent: int) -> None:
+        """更新分片进度并重新计算任务整体进度"""
+        job = self.scan_jobs.get(scan_id)
+        if job is None:
+            return
+        with job.lock:
+            state = job.state
+            shard = state["shards"][shard_index]
+            shard["stats_seen"] = True
+            if shard["progress"] == percent:
+                return
+            shard["progress"] = percent
+            state["progress"] = self._job_progress(state)
+            snapshot = job.publish()
+            self.store.update_job(scan_id, {"progress": snapshot["progress"], "shards": snapshot["shards"]})
+        self._publish_status(scan_id)
+    
+    def _ingest_finding(self, scan_id: str, shard_index: int, result: Dict, raw: str) -> int:
+        """写入一条扫描结果并更新进度，返回结果序号"""
+        job = self.scan_jobs[scan_id]
+        FINDINGS_INGESTED.labels("cache" if result.get("cached") else "nuclei").inc()
+        with job.lock:
+            state = job.state
+            seq = state["completed"]
+            state["completed"] += 1
+            shard = state["shards"][shard_index]
+            shard["completed"] += 1
+            if not shard["stats_seen"]:
+                shard["progress"] = min(99, int(shard["completed"] / max(shard["total"], 1) * 100))
+                state["progress"] = self._job_progress(state)
+            snapshot = job.publish()
+            # 在任务锁内按序号顺序提交写入，保证结果按序号落盘，游标不会跳过未提交的结果；
+            # 该锁只在同一任务的分片之间竞争，不影响其他扫描
+            self.store.add_finding(scan_id, seq, result, raw=raw)
+            self.store.update_job(scan_id, {
+                "completed": snapshot["completed"],
+                "progress": snapshot["progress"],
+                "shards": snapshot["shards"]
+            })
+        return seq
+    
+    def _finish_shard(self, scan_id: str, shard_index: int, status: str, error: Optional[str]) -> None:
+        """记录分片结束状态，全部分片结束后写入任务终态"""
+        job = self.scan_jobs.get(scan_id)
+        if job is None:
+            return
+        with job.lock:
+            state = job.state
+            shard = state["shards"][shard_index]
+            shard.update(status=status, error=error)
+            if status == "completed":
+                shard["progress"] = 100
+            state["progress"] = self._job_progress(state)
+            snapshot = job.publish()
+        shards = snapshot["shards"]
+        completed = snapshot["completed"]
+        progress = snapshot["progress"]
+        
+        if any(s["status"] not in ("completed", "failed") for s in shards):
+            self._update_job(scan_id, progress=progress, shards=shards)
+            self._publish_status(scan_id)
+            return
+        
+        failed = [s for s in shards if s["status"] == "failed"]
+        if not failed:
+            # 扫描完成
+            self._finish_job(scan_id, status="completed", progress=100, shards=shards)
+            return
+        
+        if len(shards) == 1:
+            error = failed[0]["error"]
+        else:
+            error = "; ".join(f"分片{s['index']}: {s['error']}" for s in failed)
+        # 已写入的结果仍然可以查询
+        self._finish_job(scan_id, status="failed", error=error, partial=completed > 0, shards=shards)
+    
+    def _prepare_target_file(self, targets: TargetNormalizer, shard_index: int = 0, shard_count: int = 1) -> str:
+        """准备目标文件，逐个写入规范化后的目标，分片扫描时只写入属于该分片的目标"""
+        return write_target_file(targets.iter_shard(shard_index, shard_count))
+    
+    def _prepare_incremental_target_file(self, scan_id: str, targets: TargetNormalizer, shard_index: int,
+                                         shard_count: int, cache_key: str) -> Tuple[str, int]:
+        """
+        准备增量扫描的目标文件
+        
+        缓存中仍在有效期内的目标直接使用缓存结果（标记cached为true），
+        只有过期或新增的目标写入目标文件交给nuclei扫描
+        
+        返回:
+            (目标文件路径, 需要扫描的目标数)
+        """
+        pending = 0
+        cached_targets = 0
         fd, path = tempfile.mkstemp(dir=current_config.TEMP_DIR, suffix=".txt")
-        with os.fdopen(fd, 'w') as f:
-            f.write('\n'.join(target_list))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for target, cached in self.scan_cache.lookup(cache_key, targets.iter_shard(shard_index, shard_count)):
+                if cached is None:
+                    f.write(target + '\n')
+                    pending += 1
+                    continue
+                
+                cached_targets += 1
+                for raw in cached:
+                    result = json.loads(raw)
+                    result["cached"] = True
+                    seq = self._ingest_finding(scan_id, shard_index, result, json.dumps(result, ensure_ascii=False))
+                    event_broker.publish(scan_id, "finding", result, event_id=seq + 1)
         
-        return path
+        job = self.scan_jobs[scan_id]
+        with job.lock:
+            job.state["cached_targets"] += cached_targets
+            snapshot = job.publish()
+            self.store.update_job(scan_id, {"cached_targets": snapshot["cached_targets"]})
+        
+        return path, pending
+    
+    @staticmethod
+    def _iter_staged_findings(staging_file: str):
+        """读取增量扫描暂存的结果，生成(候选目标列表, 原始结果)"""
+        with open(staging_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                candidates, raw = json.loads(line)
+                yield candidates, raw
     
-    def _scan(self, scan_id: str, targets: List[Target], templates: Optional[List[str]], 
-              verbose: bool, timeout: Optional[int]) -> None:
-        """执行nuclei扫描"""
+    @staticmethod
+    def _iter_target_file(target_file: str):
+        """逐行读取目标文件"""
+        with open(target_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+    
+    def _publish_status(self, scan_id: str) -> None:
+        """推送当前扫描状态给订阅者"""
+        status = self.get_scan_status(scan_id)
+        if status is not None:
+            event_broker.publish(scan_id, "status", status.model_dump(mode="json"))
+    
+    def _update_job(self, scan_id: str, **fields) -> None:
+        """更新未结束任务的状态，并写入任务存储"""
+        job = self.scan_jobs.get(scan_id)
+        if job is None:
+            return
+        with job.lock:
+            job.state.update(fields)
+            job.publish()
+            self.store.update_job(scan_id, fields)
+    
+    def _finish_job(self, scan_id: str, **fields) -> None:
+        """写入任务终态，持久化后从内存中移除并推送最终状态"""
+        job = self.scan_jobs.get(scan_id)
+        if job is None:
+            return
+        with job.lock:
+            fields.setdefault("end_time", datetime.now())
+            job.state.update(fields)
+            snapshot = job.publish()
+            status = self._build_status(scan_id, snapshot)
+        if snapshot["start_time"] is not None:
+            SCAN_DURATION.labels(snapshot["status"]).observe(
+                (snapshot["end_time"] - snapshot["start_time"]).total_seconds()
+            )
+        
+        # 等待落盘，不持有任何锁
+        error = self.store.finalize_job(scan_id, fields)
+        if error is not None:
+            # 结果未能全部写入，任务存储中已保存为失败
+            with job.lock:
+                job.state.update(status="failed", error=error, partial=True)
+                status = self._build_status(scan_id, job.publish())
+        with self.lock:
+            self.scan_jobs.pop(scan_id, None)
+        event_broker.publish(scan_id, "status", status.model_dump(mode="json"))
+    
+    def _get_job(self, scan_id: str) -> Optional[Dict]:
+        """获取任务状态，未结束的任务读取其最新快照（无需加锁），其余从任务存储读取"""
+        job = self.scan_jobs.get(scan_id)
+        if job is not None:
+            return dict(job.snapshot)
+        return self.store.get_job(scan_id)
+    
+    def _prepare_shard(self, scan_id: str, targets: TargetNormalizer, shard_index: int, shard_count: int,
+                       incremental: bool, cache_key: str) -> Tuple[str, Optional[IO], bool]:
+        """
+        准备分片的目标文件，增量扫描时同时创建结果暂存文件
+        
+        返回:
+            (目标文件路径, 暂存文件, 是否需要启动nuclei)
+        """
+        if not incremental:
+            return self._prepare_target_file(targets, shard_index, shard_count), None, True
+        
+        target_file, pending = self._prepare_incremental_target_file(
+            scan_id, targets, shard_index, shard_count, cache_key
+        )
+        if pending == 0:
+            # 全部目标命中缓存，无需启动nuclei
+            return target_file, None, False
+        # 暂存本次扫描的结果，扫描成功后写入缓存
+        staging = tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', dir=current_config.TEMP_DIR, suffix=".jsonl", delete=False
+        )
+        return target_file, staging, True
+    
+    def _handle_output_line(self, scan_id: str, shard_index: int, line: str,
+                            staging: Optional[IO]) -> Optional[Dict]:
+        """解析nuclei输出的一行JSON，写入任务存储并推送给订阅者，返回解析后的结果"""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            result = json.loads(line)
+        except json.JSONDecodeError:
+            # 忽略无法解析的行
+            return None
+        
+        if staging is not None:
+            result["cached"] = False
+            line = json.dumps(result, ensure_ascii=False)
+            staging.write(json.dumps([finding_targets(result), line], ensure_ascii=False) + '\n')
+        
+        seq = self._ingest_finding(scan_id, shard_index, result, line)
+        
+        # 推送新结果给订阅者，事件ID可直接作为结果查询的游标
+        event_broker.publish(scan_id, "finding", result, event_id=seq + 1)
+        return result
+    
+    @staticmethod
+    def _cache_key(templates: Optional[List[str]], fingerprint: bool) -> str:
+        """增量扫描的缓存键，指纹预选的结果与全部模板的结果分开缓存"""
+        if fingerprint and not templates:
+            return "fingerprint"
+        return template_key(templates)
+    
+    def _pass_handlers(self, scan_id: str, shard_index: int, staging: Optional[IO], plan: ScanPlan,
+                       scan_pass: ScanPass) -> Tuple[Callable[[str], None], Callable[[int], None]]:
+        """生成一次nuclei执行的输出和进度回调，指纹识别阶段的结果同时交给执行计划用于选择模板"""
+        def on_output(line: str) -> None:
+            result = self._handle_output_line(scan_id, shard_index, line, staging)
+            if result is not None and scan_pass.fingerprint:
+                plan.observe(result)
+        
+        def on_progress(percent: int) -> None:
+            self._update_shard_progress(scan_id, shard_index, scan_pass.progress(percent))
+        
+        return on_output, on_progress
+    
+    def _record_scan(self, cache_key: str, target_file: str, staging: Optional[IO]) -> None:
+        """扫描成功，增量扫描时将本次结果写入缓存"""
+        if staging is not None:
+            staging.close()
+            self.scan_cache.record(
+                cache_key,
+                self._iter_target_file(target_file),
+                self._iter_staged_findings(staging.name)
+            )
+    
+    @staticmethod
+    def _cleanup_shard(target_file: Optional[str], staging: Optional[IO]) -> None:
+        """清理分片的临时文件"""
+        if target_file and os.path.exists(target_file):
+            os.remove(target_file)
+        if staging is not None:
+            staging.close()
+            if os.path.exists(staging.name):
+                os.remove(staging.name)
+    
+    def _scan(self, scan_id: str, shard_index: int, shard_count: int, targets: TargetNormalizer,
+              templates: Optional[List[str]], verbose: bool, timeout: Optional[int],
+              incremental: bool = False, fingerprint: bool = False) -> Tuple[str, Optional[str]]:
+        """
+        执行nuclei扫描（一个分片对应一个nuclei进程，指纹预选时依次执行识别和按标签扫描）
+        
+        增量扫描时命中缓存的目标不再交给nuclei，扫描成功后将本次结果写入缓存
+        
+        返回:
+            (分片状态 completed/failed, 错误信息)
+        """
+        target_file = None
+        staging = None
+        plan = None
+        allocation = None
+        shard_key = f"{scan_id}:{shard_index}"
+        cache_key = self._cache_key(templates, fingerprint)
         try:
-            # 更新扫描状态为运行中
-            with self.lock:
-                self.scan_jobs[scan_id] = {
-                    "status": "running",
-                    "progress": 0,
-                    "completed": 0,
-                    "total": len(targets),
-                    "start_time": datetime.now(),
-                    "results": [],
-                    "error": None
-                }
-            
             # 准备目标文件
-            target_file = self._prepare_target_file(targets)
+            target_file, staging, needs_scan = self._prepare_shard(
+                scan_id, targets, shard_index, shard_count, incremental, cache_key
+            )
+            if not needs_scan:
+                return "completed", None
             
-            # 构建nuclei命令 - 移除Windows不支持的/dev/stdout参数
-            cmd = [current_config.NUCLEI_PATH, "-l", target_file, "-json"]
+            if self.governor is not None:
+                allocation = self.governor.acquire(shard_key, self.active_count() + self.queue_depth())
             
-            # 添加模板参数
-            if templates:
-                cmd.extend(["-t", ",".join(templates)])
+            # 设置超时时间，多次执行共用
+            scan_timeout = timeout or current_config.SCAN_TIMEOUT
+            deadline = time.monotonic() + scan_timeout
             
-            # 添加详细参数
-            if verbose:
-                cmd.append("-v")
+            plan = create_plan(target_file, templates, fingerprint)
+            for scan_pass in plan:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return "failed", f"扫描超时，已超过{scan_timeout}秒"
+                cmd = build_command(
+                    scan_pass.target_file, scan_pass.templates, verbose, allocation, scan_pass.tags, scan_pass.severity
+                )
+                
+                # 启动nuclei进程
+                try:
+                    process = start_nuclei(cmd)
+                except FileNotFoundError:
+                    # 如果找不到nuclei可执行文件，提供更详细的错误信息
+                    return "failed", NUCLEI_NOT_FOUND_ERROR.format(path=current_config.NUCLEI_PATH)
+                except Exception as e:
+                    return "failed", f"启动nuclei进程失败: {str(e)}"
+                
+                # 逐行读取并解析JSON输出，每条结果立即写入任务存储；stderr中的统计信息用于更新进度
+                on_output, on_progress = self._pass_handlers(scan_id, shard_index, staging, plan, scan_pass)
+                run = run_nuclei(process, remaining, on_output, on_progress)
+                error = failure_message(run, scan_timeout)
+                if error is not None:
+                    return "failed", error
             
-            # 设置超时时间
+            self._record_scan(cache_key, target_file, staging)
+            return "completed", None
+        except Exception as e:
+            # 处理其他异常
+            return "failed", str(e)
+        finally:
+            # 释放分配的资源预算，之后启动的nuclei进程可以分得更多
+            if allocation is not None:
+                self.governor.release(shard_key)
+            # 清理临时文件
+            if plan is not None:
+                plan.cleanup()
+            self._cleanup_shard(target_file, staging)
+    
+    async def _scan_async(self, scan_id: str, shard_index: int, shard_count: int, targets: TargetNormalizer,
+                          templates: Optional[List[str]], verbose: bool, timeout: Optional[int],
+                          incremental: bool = False, fingerprint: bool = False) -> Tuple[str, Optional[str]]:
+        """
+        asyncio引擎执行nuclei扫描
+        
+        nuclei进程由 asyncio.create_subprocess_exec 启动，stdout和stderr在事件循环中异步读取，
+        超时由 asyncio.wait 控制，超时或任务被取消时结束nuclei进程。
+        目标文件的准备和缓存写入等阻塞操作在线程池中执行。
+        
+        返回:
+            (分片状态 completed/failed, 错误信息)
+        """
+        target_file = None
+        staging = None
+        plan = None
+        allocation = None
+        shard_key = f"{scan_id}:{shard_index}"
+        cache_key = self._cache_key(templates, fingerprint)
+        try:
+            # 准备目标文件
+            target_file, staging, needs_scan = await asyncio.to_thread(
+                self._prepare_shard, scan_id, targets, shard_index, shard_count, incremental, cache_key
+            )
+            if not needs_scan:
+                return "completed", None
+            
+            if self.governor is not None:
+                allocation = self.governor.acquire(shard_key, self.active_count() + self.queue_depth())
             scan_timeout = timeout or current_config.SCAN_TIMEOUT
+            deadline = time.monotonic() + scan_timeout
             
-            # 执行命令并收集结果
-            try:
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding='utf-8'
+            plan = create_plan(target_file, templates, fingerprint)
+            passes = iter(plan)
+            while True:
+                # 指纹预选的第二阶段在生成时读写目标文件，在线程池中执行
+                scan_pass = await asyncio.to_thread(next, passes, None)
+                if scan_pass is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return "failed", f"扫描超时，已超过{scan_timeout}秒"
+                cmd = build_command(
+                    scan_pass.target_file, scan_pass.templates, verbose, allocation, scan_pass.tags, scan_pass.severity
                 )
-            except FileNotFoundError:
-                # 如果找不到nuclei可执行文件，提供更详细的错误信息
-                with self.lock:
-                    self.scan_jobs[scan_id]["error"] = f"找不到nuclei可执行文件。请确保nuclei已安装并添加到系统PATH中，或在config.py中正确配置NUCLEI_PATH。当前配置的路径: {current_config.NUCLEI_PATH}"
-                    self.scan_jobs[scan_id]["status"] = "failed"
-                return
-            except Exception as e:
-                with self.lock:
-                    self.scan_jobs[scan_id]["error"] = f"启动nuclei进程失败: {str(e)}"
-                    self.scan_jobs[scan_id]["status"] = "failed"
-                return
-
-            # 读取输出
-            results = []
-            completed_count = 0
-
-            try:
-                # 使用communicate并设置超时
-                stdout, stderr = process.communicate(timeout=scan_timeout)
                 
-                # 检查是否有错误
-                if process.returncode != 0:
-                    # 确保错误信息不为空
-                    error_output = stderr if stderr else "(无错误输出)"
-                    error_msg = f"nuclei扫描失败，返回码: {process.returncode}。错误信息: {error_output}"
-                    with self.lock:
-                        self.scan_jobs[scan_id]["error"] = error_msg
-                        self.scan_jobs[scan_id]["status"] = "failed"
-                else:
-                    # 解析JSON输出
-                    for line in stdout.strip().split('\n'):
-                        if line.strip():
-                            try:
-                                result = json.loads(line)
-                                results.append(result)
-                                completed_count += 1
-                                 
-                                # 更新进度
-                                with self.lock:
-                                    self.scan_jobs[scan_id]["completed"] = completed_count
-                                    self.scan_jobs[scan_id]["progress"] = min(100, int(completed_count / len(targets) * 100))
-                                    self.scan_jobs[scan_id]["results"].append(result)
-                            except json.JSONDecodeError:
-                                # 忽略无法解析的行
-                                pass
-                     
-                    # 扫描完成
-                    with self.lock:
-                        self.scan_jobs[scan_id]["status"] = "completed"
-                        self.scan_jobs[scan_id]["progress"] = 100
-                        self.scan_jobs[scan_id]["end_time"] = datetime.now()
-                         
-                        # 保存结果到文件
-                        result_file = os.path.join(current_config.RESULTS_DIR, f"{scan_id}.json")
-                        with open(result_file, 'w', encoding='utf-8') as f:
-                            json.dump(self.scan_jobs[scan_id]["results"], f, ensure_ascii=False, indent=2)
-            except subprocess.TimeoutExpired:
-                # 超时处理
-                process.kill()
-                with self.lock:
-                    self.scan_jobs[scan_id]["error"] = f"扫描超时，已超过{scan_timeout}秒"
-                    self.scan_jobs[scan_id]["status"] = "failed"
-            finally:
-                # 清理临时文件
-                if os.path.exists(target_file):
-                    os.remove(target_file)
+                try:
+                    process = await start_nuclei_async(cmd)
+                except FileNotFoundError:
+                    return "failed", NUCLEI_NOT_FOUND_ERROR.format(path=current_config.NUCLEI_PATH)
+                except Exception as e:
+                    return "failed", f"启动nuclei进程失败: {str(e)}"
+                
+                on_output, on_progress = self._pass_handlers(scan_id, shard_index, staging, plan, scan_pass)
+                run = await run_nuclei_async(process, remaining, on_output, on_progress)
+                error = failure_message(run, scan_timeout)
+                if error is not None:
+                    return "failed", error
+            
+            await asyncio.to_thread(self._record_scan, cache_key, target_file, staging)
+            return "completed", None
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            # 处理其他异常
-            with self.lock:
-                self.scan_jobs[scan_id]["error"] = str(e)
-                self.scan_jobs[scan_id]["status"] = "failed"
+            return "failed", str(e)
         finally:
-            with self.lock:
-                self.active_scans -= 1
+            # 释放分配的资源预算，之后启动的nuclei进程可以分得更多
+            if allocation is not None:
+                self.governor.release(shard_key)
+            # 清理临时文件
+            if plan is not None:
+                plan.cleanup()
+            self._cleanup_shard(target_file, staging)
     
     def start_scan(self, targets: List[Target], templates: Optional[List[str]] = None, 
-                  verbose: bool = False, timeout: Optional[int] = None) -> str:
-        """开始扫描任务"""
+                  verbose: bool = False, timeout: Optional[int] = None,
+                  shards: Optional[int] = None, incremental: bool = False, fingerprint: bool = False) -> str:
+        """
+        开始扫描任务
+        
+        目标先经过规范化和去重，CIDR网段和端口范围按需展开，展开后的目标数超过
+        MAX_SCAN_TARGETS、目标无效或模板不存在时抛出ValueError。
+        shards大于1时将目标均分为多个分片，每个分片由独立的nuclei进程扫描，
+        分片与其他扫描共享MAX_CONCURRENT_SCANS并发槽位，结果合并到同一个扫描ID下
+        
+        incremental为True时，SCAN_CACHE_TTL内已用相同模板集合扫描过的目标直接返回缓存结果
+        
+        fingerprint为True且未指定模板时，每个分片先以技术识别模板识别目标指纹，
+        再按指纹对应的nuclei标签选择模板，没有匹配标签的目标只使用高风险等级的模板
+        
+        分布式模式下分片提交到任务队列，由工作进程执行
+        """
+        if incremental and self.queue is not None:
+            raise ValueError("分布式模式暂不支持增量扫描")
+        
+        # 规范化并去重目标，网段和端口范围在写入目标文件时才展开
+        normalized = TargetNormalizer(targets)
+        if normalized.total == 0:
+            raise ValueError("扫描目标不能为空")
+        if normalized.total > current_config.MAX_SCAN_TARGETS:
+            raise ValueError(f"展开后的目标数 {normalized.total} 超过上限 {current_config.MAX_SCAN_TARGETS}")
+        
+        # 校验模板，模板ID转换为路径，无法识别的模板在入队前拒绝
+        if templates:
+            templates = template_index.resolve(templates)
+        
         # 生成扫描ID
         scan_id = str(uuid.uuid4())
         
-        # 将扫描任务加入队列
-        self.scan_queue.put((scan_id, targets, templates, verbose, timeout))
-        
-        # 初始化扫描任务状态
-        with self.lock:
-            self.scan_jobs[scan_id] = {
+        # 计算分片数，分片数不超过目标数
+        shard_count = max(1, min(shards or 1, current_config.MAX_SCAN_SHARDS, normalized.total))
+        shard_states = []
+        for index in range(shard_count):
+            shard_states.append({
+                "index": index,
                 "status": "pending",
                 "progress": 0,
                 "completed": 0,
-                "total": len(targets),
-                "start_time": None,
-                "end_time": None,
-                "results": [],
-                "error": None
-            }
+                "total": normalized.shard_size(index, shard_count),
+                "queue_wait": None,
+                "error": None,
+                "stats_seen": False
+            })
+        
+        # 初始化扫描任务状态（需在入队前完成，避免调度线程找不到任务）
+        job = {
+            "status": "pending",
+            "progress": 0,
+            "completed": 0,
+            "total": normalized.total,
+            "collapsed": normalized.collapsed,
+            "cached_targets": 0,
+            "queued_at": datetime.now(),
+            "queue_wait": None,
+            "start_time": None,
+            "end_time": None,
+            "partial": False,
+            "error": None,
+            "shards": shard_states
+        }
+        job = ScanJob(scan_id, job)
+        self.store.create_job(scan_id, job.snapshot)
+        with self.lock:
+            self.scan_jobs[scan_id] = job
+        
+        # 将每个分片提交给调度器
+        if self.queue is not None:
+            # 工作进程根据原始目标重新规范化，规范化结果的顺序是确定的，分片内容与本地一致
+            serialized = [target.model_dump(mode="json", exclude_none=True) for target in targets]
+            for index in range(shard_count):
+                self.queue.enqueue(f"{scan_id}:{index}", {
+                    "owner": self.node_id,
+                    "scan_id": scan_id,
+                    "shard_index": index,
+                    "shard_count": shard_count,
+                    "targets": serialized,
+                    "templates": templates,
+                    "verbose": verbose,
+                    "timeout": timeout,
+                    "fingerprint": fingerprint
+                })
+            return scan_id
+        
+        for index in range(shard_count):
+            self.scheduler.submit(
+                scan_id, (index, shard_count, normalized, templates, verbose, timeout, incremental, fingerprint)
+            )
         
         return scan_id
     
+    def _build_status(self, scan_id: str, job: Dict) -> ScanStatus:
+        """根据任务记录生成扫描状态"""
+        shards = job.get("shards") or []
+        # 确保所有必要的键都存在
+        return ScanStatus(
+            scan_id=scan_id,
+            status=job.get("status") or "unknown",
+            progress=job.get("progress") or 0,
+            completed=job.get("completed") or 0,
+            total=job.get("total") or 0,
+            error=job.get("error"),
+            partial=bool(job.get("partial")),
+            queued_at=job.get("queued_at"),
+            queue_wait=job.get("queue_wait"),
+            start_time=job.get("start_time"),
+            end_time=job.get("end_time"),
+            collapsed=job.get("collapsed") or 0,
+            cached_targets=job.get("cached_targets") or 0,
+            # 只有一个分片时不单独展示分片状态
+            shards=[ShardStatus(**shard) for shard in shards] if len(shards) > 1 else None
+        )
+    
     def get_scan_status(self, scan_id: str) -> Optional[ScanStatus]:
         """获取扫描任务状态"""
-        with self.lock:
-            if scan_id not in self.scan_jobs:
-                return None
-            
-            job = self.scan_jobs[scan_id]
-            
-            # 确保所有必要的键都存在
-            return ScanStatus(
-                scan_id=scan_id,
-                status=job.get("status", "unknown"),
-                progress=job.get("progress", 0),
-                completed=job.get("completed", 0),
-                total=job.get("total", 0),
-                error=job.get("error"),
-                start_time=job.get("start_time"),
-                end_time=job.get("end_time")
-            )
+        job = self._get_job(scan_id)
+        if job is None:
+            return None
+        
+        return self._build_status(scan_id, job)
     
-    def get_scan_results(self, scan_id: str) -> Optional[List[Dict]]:
-        """获取扫描结果"""
-        with self.lock:
-            if scan_id not in self.scan_jobs:
-                return None
-            
-            job = self.scan_jobs[scan_id]
-            if job["status"] != "completed":
-                return None
-            
-            return job["results"]
+    def query_scan_results(self, scan_id: str, cursor: int = 0, limit: int = 100,
+                           filters: Optional[Dict[str, Optional[str]]] = None) -> Optional[ResultPage]:
+        """
+        分页查询扫描结果
+        
+        结果按写入顺序返回，游标为下一页的起始序号。扫描进行中也可查询已写入的结果，
+        由于结果只追加不修改，游标在扫描过程中保持有效；读到当前末尾时仍返回游标，
+        客户端从该游标继续轮询即可读到之后写入的结果。扫描结束且没有更多结果时游标为空。
+        """
+        job = self._get_job(scan_id)
+        if job is None:
+            return None
+        
+        # 从任务存储中按索引读取一页结果，不持有扫描器的锁
+        items, next_cursor = self.store.query_findings(
+            scan_id, normalize_filters(filters or {}), cursor, limit,
+            live=job["status"] in ACTIVE_STATUSES
+        )
+        
+        return ResultPage(
+            scan_id=scan_id,
+            items=items,
+            count=len(items),
+            next_cursor=str(next_cursor) if next_cursor is not None else None,
+            complete=next_cursor is None
+        )
     
-    def export_results(self, scan_id: str, export_format: str) -> Optional[str]:
-        """导出扫描结果"""
-        with self.lock:
-            if scan_id not in self.scan_jobs:
-                return None
-            
-            job = self.scan_jobs[scan_id]
-            if job["status"] != "completed":
-                return None
-            
-            # 获取结果文件路径
-            result_file = os.path.join(current_config.RESULTS_DIR, f"{scan_id}.json")
-            if not os.path.exists(result_file):
-                return None
-            
-            # 读取结果
-            with open(result_file, 'r', encoding='utf-8') as f:
-                results = json.load(f)
-            
-            # 根据格式导出
-            if export_format == "json":
-                # JSON格式直接返回原文件路径
-                return result_file
-            elif export_format == "excel":
-                # 导出为Excel文件
-                import pandas as pd
-                
-                # 准备Excel数据
-                excel_data = []
-                for result in results:
-                    excel_row = {
-                        "Target": result.get("host", ""),
-                        "Type": result.get("type", ""),
-                        "Severity": result.get("severity", ""),
-                        "Template": result.get("template-id", ""),
-                        "Description": result.get("info", {}).get("description", ""),
-                        "Match": result.get("matched-at", "")
-                    }
-                    excel_data.append(excel_row)
-                
-                # 创建DataFrame并导出
-                df = pd.DataFrame(excel_data)
-                excel_file = os.path.join(current_config.RESULTS_DIR, f"{scan_id}.xlsx")
-                df.to_excel(excel_file, index=False)
-                
-                return excel_file
-            elif export_format == "csv":
-                # 导出为CSV文件
-                import pandas as pd
-                
-                # 准备CSV数据
-                csv_data = []
-                for result in results:
-                    csv_row = {
-                        "Target": result.get("host", ""),
-                        "Type": result.get("type", ""),
-                        "Severity": result.get("severity", ""),
-                        "Template": result.get("template-id", ""),
-                        "Description": result.get("info", {}).get("description", ""),
-                        "Match": result.get("matched-at", "")
-                    }
-                    csv_data.append(csv_row)
-                
-                # 创建DataFrame并导出
-                df = pd.DataFrame(csv_data)
-                csv_file = os.path.join(current_config.RESULTS_DIR, f"{scan_id}.csv")
-                df.to_csv(csv_file, index=False, encoding='utf-8')
-                
-                return csv_file
-            else:
-                return None
+    def export_results(self, scan_id: str, export_format: str) -> Optional[ExportArtifact]:
+        """导出扫描结果，不持有扫描器锁，结果从任务存储中逐条读取"""
+        job = self._get_job(scan_id)
+        if job is None or job["status"] != "completed":
+            return None
+        if export_format not in EXPORT_FORMATS:
+            return None
+        
+        return self.exporter.export(scan_id, export_format, job, self.store.iter_findings(scan_id))
 
 # 创建全局扫描器实例
 nuclei_scanner = NucleiScanner()
\ No newline at end of file
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+分布式扫描的任务队列，API节点提交扫描分片，扫描工作进程租用分片并回传状态和结果
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from config import current_config
+
+
+class LeasedTask(NamedTuple):
+    """工作进程租用到的任务"""
+    task_id: str
+    payload: Dict
+    # 第几次被租用（从1开始），任务被重新租用后旧租约回传的事件会被忽略
+    attempt: int
+    # 入队时间（时间戳）
+    enqueued_at: float
+
+
+class QueueBackend:
+    """
+    任务队列接口
+
+    任务（扫描分片）被工作进程租用后需定期续租，租约过期（工作进程崩溃或失联）后任务重新可被租用。
+    工作进程通过事件通道回传扫描状态和结果。每个API节点有自己的事件通道（以节点ID区分），
+    任务中记录提交它的节点，事件只回传到该节点的通道，由该节点按顺序消费，
+    多个API节点共用一个队列时不会读取或确认其他节点的事件。
+    """
+
+    def enqueue(self, task_id: str, payload: Dict) -> None:
+        """提交任务"""
+        raise NotImplementedError
+
+    def lease(self, worker_id: str, lease_timeout: float) -> Optional[LeasedTask]:
+        """租用一个可执行的任务（未被租用或租约已过期），没有任务时返回None"""
+        raise NotImplementedError
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_timeout: float) -> bool:
+        """续租，租约已被其他工作进程取得或任务已不存在时返回False"""
+        raise NotImplementedError
+
+    def complete(self, task_id: str, worker_id: str) -> None:
+        """任务执行结束，从队列中删除"""
+        raise NotImplementedError
+
+    def queue_depth(self) -> int:
+        """等待租用的任务数"""
+        raise NotImplementedError
+
+    def push_events(self, channel: str, events: List[Dict]) -> None:
+        """工作进程向API节点的事件通道回传事件"""
+        raise NotImplementedError
+
+    def pull_events(self, channel: str, limit: int) -> Tuple[List[Dict], Any]:
+        """读取事件通道中最早的一批事件，返回(事件列表, 确认标记)，处理完成后用确认标记调用ack_events"""
+        raise NotImplementedError
+
+    def ack_events(self, channel: str, token: Any) -> None:
+        """确认已处理pull_events返回的事件"""
+        raise NotImplementedError
+
+
+class SQLiteQueueBackend(QueueBackend):
+    """
+    SQLite任务队列（WAL模式）
+
+    适用于单机部署和测试，API进程和同一主机（或共享文件系统）上的多个工作进程共用一个数据库文件。
+    租用任务在 BEGIN IMMEDIATE 事务中完成，保证同一任务不会被两个工作进程同时租用。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " task_id TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " enqueued_at REAL NOT NULL,"
+            " worker_id TEXT,"
+            " lease_until REAL NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_lease ON tasks (lease_until, enqueued_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " body TEXT NOT NULL)"
+        )
+        # 补齐按API节点区分事件通道后新增的列
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+        if "channel" not in existing:
+            conn.execute("ALTER TABLE events ADD COLUMN channel TEXT NOT NULL DEFAULT ''")
+        if "created_at" not in existing:
+            conn.execute("ALTER TABLE events ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_channel ON events (channel, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_created ON events (created_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """获取当前线程的连接（自动提交模式，事务显式开启）"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def enqueue(self, task_id: str, payload: Dict) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO tasks (task_id, payload, enqueued_at) VALUES (?, ?, ?)",
+            (task_id, json.dumps(payload, ensure_ascii=False), time.time())
+        )
+
+    def lease(self, worker_id: str, lease_timeout: float) -> Optional[LeasedTask]:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT task_id, payload, enqueued_at, attempts FROM tasks"
+                " WHERE lease_until < ? ORDER BY enqueued_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            task_id, payload, enqueued_at, attempts = row
+            conn.execute(
+                "UPDATE tasks SET worker_id = ?, lease_until = ?, attempts = ? WHERE task_id = ?",
+                (worker_id, now + lease_timeout, attempts + 1, task_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return LeasedTask(task_id, json.loads(payload), attempts + 1, enqueued_at)
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_timeout: float) -> bool:
+        cursor = self._conn().execute(
+            "UPDATE tasks SET lease_until = ? WHERE task_id = ? AND worker_id = ?",
+            (time.time() + lease_timeout, task_id, worker_id)
+        )
+        return cursor.rowcount > 0
+
+    def complete(self, task_id: str, worker_id: str) -> None:
+        self._conn().execute("DELETE FROM tasks WHERE task_id = ? AND worker_id = ?", (task_id, worker_id))
+
+    def queue_depth(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM tasks WHERE lease_until < ?", (time.time(),)
+        ).fetchone()[0]
+
+    def push_events(self, channel: str, events: List[Dict]) -> None:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO events (channel, created_at, body) VALUES (?, ?, ?)",
+                [(channel, now, json.dumps(event, ensure_ascii=False)) for event in events]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def pull_events(self, channel: str, limit: int) -> Tuple[List[Dict], Any]:
+        rows = self._conn().execute(
+            "SELECT id, body FROM events WHERE channel = ? ORDER BY id LIMIT ?", (channel, limit)
+        ).fetchall()
+        if not rows:
+            return [], None
+        return [json.loads(body) for _, body in rows], rows[-1][0]
+
+    def ack_events(self, channel: str, token: Any) -> None:
+        if token is None:
+            return
+        conn = self._conn()
+        conn.execute("DELETE FROM events WHERE channel = ? AND id <= ?", (channel, token))
+        # 已下线的API节点的事件无人消费，超过保留时长后删除
+        conn.execute("DELETE FROM events WHERE created_at < ?", (time.time() - current_config.WORKER_EVENT_TTL,))
+
+
+class RedisQueueBackend(QueueBackend):
+    """
+    Redis任务队列，适用于多主机部署
+
+    待执行任务保存在列表中，租约保存在以到期时间为分值的有序集合中。
+    租用由一个Lua脚本完成：先将租约已过期的任务放回队列头部，再取出任务并记录租约，
+    多个工作进程同时租用或进程在两步之间崩溃时，任务不会丢失也不会被重复租用。
+    """
+
+    # KEYS: 待执行列表, 租约有序集合, 租用者哈希；ARGV: 当前时间, 租约时长, 工作进程ID, 任务键前缀
+    LEASE_SCRIPT = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], 0, ARGV[1])
+    for _, task_id in ipairs(expired) do
+        redis.call('ZREM', KEYS[2], task_id)
+        redis.call('HDEL', KEYS[3], task_id)
+        redis.call('RPUSH', KEYS[1], task_id)
+    end
+    local task_id = redis.call('RPOP', KEYS[1])
+    if not task_id then
+        return false
+    end
+    redis.call('ZADD', KEYS[2], tonumber(ARGV[1]) + tonumber(ARGV[2]), task_id)
+    redis.call('HSET', KEYS[3], task_id, ARGV[3])
+    local task_key = ARGV[4] .. task_id
+    local attempts = redis.call('HINCRBY', task_key, 'attempts', 1)
+    local task = redis.call('HMGET', task_key, 'payload', 'enqueued_at')
+    return {task_id, attempts, task[1], task[2]}
+    """
+
+    # 续租和删除任务时检查租用者与修改在同一个脚本中完成，租约在两步之间被其他进程取得时不会误改
+    # KEYS: 租约有序集合, 租用者哈希；ARGV: 任务ID, 工作进程ID, 新的到期时间
+    HEARTBEAT_SCRIPT = """
+    if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[3], ARGV[1])
+    return 1
+    """
+
+    # KEYS: 租约有序集合, 租用者哈希, 任务键；ARGV: 任务ID, 工作进程ID
+    COMPLETE_SCRIPT = """
+    local owner = redis.call('HGET', KEYS[2], ARGV[1])
+    if owner and owner ~= ARGV[2] then
+        return 0
+    end
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('DEL', KEYS[3])
+    return 1
+    """
+
+    def __init__(self, url: str, prefix: str = "easm"):
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.pending_key = f"{prefix}:pending"
+        self.lease_key = f"{prefix}:leases"
+        self.owner_key = f"{prefix}:owners"
+        self.event_prefix = f"{prefix}:events:"
+        self.task_prefix = f"{prefix}:task:"
+        self.lease_script = self.redis.register_script(self.LEASE_SCRIPT)
+        self.heartbeat_script = self.redis.register_script(self.HEARTBEAT_SCRIPT)
+        self.complete_script = self.redis.register_script(self.COMPLETE_SCRIPT)
+
+    def enqueue(self, task_id: str, payload: Dict) -> None:
+        pipe = self.redis.pipeline()
+        pipe.hset(self.task_prefix + task_id, mapping={
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "enqueued_at": time.time(),
+            "attempts": 0
+        })
+        pipe.lpush(self.pending_key, task_id)
+        pipe.execute()
+
+    def lease(self, worker_id: str, lease_timeout: float) -> Optional[LeasedTask]:
+        leased = self.lease_script(
+            keys=[self.pending_key, self.lease_key, self.owner_key],
+            args=[time.time(), lease_timeout, worker_id, self.task_prefix]
+        )
+        if not leased:
+            return None
+        task_id, attempts, payload, enqueued_at = leased
+        if not payload:
+            # 任务已被删除
+            self.complete(task_id, worker_id)
+            return None
+        return LeasedTask(task_id, json.loads(payload), int(attempts), float(enqueued_at))
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_timeout: float) -> bool:
+        return bool(self.heartbeat_script(
+            keys=[self.lease_key, self.owner_key], args=[task_id, worker_id, time.time() + lease_timeout]
+        ))
+
+    def complete(self, task_id: str, worker_id: str) -> None:
+        self.complete_script(
+            keys=[self.lease_key, self.owner_key, self.task_prefix + task_id], args=[task_id, worker_id]
+        )
+
+    def queue_depth(self) -> int:
+        return self.redis.llen(self.pending_key)
+
+    def push_events(self, channel: str, events: List[Dict]) -> None:
+        if not events:
+            return
+        key = self.event_prefix + channel
+        pipe = self.redis.pipeline()
+        pipe.rpush(key, *[json.dumps(event, ensure_ascii=False) for event in events])
+        # 已下线的API节点的事件无人消费，超过保留时长后随列表一起删除
+        pipe.expire(key, int(current_config.WORKER_EVENT_TTL))
+        pipe.execute()
+
+    def pull_events(self, channel: str, limit: int) -> Tuple[List[Dict], Any]:
+        bodies = self.redis.lrange(self.event_prefix + channel, 0, limit - 1)
+        return [json.loads(body) for body in bodies], len(bodies)
+
+    def ack_events(self, channel: str, token: Any) -> None:
+        # 每个事件通道只由所属的API节点消费，按数量从列表头部删除
+        if token:
+            self.redis.ltrim(self.event_prefix + channel, token, -1)
+
+
+def create_queue_backend() -> QueueBackend:
+    """根据配置创建任务队列"""
+    if current_config.QUEUE_BACKEND == "sqlite":
+        return SQLiteQueueBackend(current_config.QUEUE_PATH)
+    if current_config.QUEUE_BACKEND == "redis":
+        return RedisQueueBackend(current_config.REDIS_URL)
+    raise ValueError(f"不支持的任务队列类型: {current_config.QUEUE_BACKEND}")
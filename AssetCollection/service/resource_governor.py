@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+nuclei资源调控服务，按全局请求速率和CPU预算为每个nuclei进程分配 -c、-bs、-rl 参数
+"""
+import threading
+from typing import Dict, NamedTuple, Optional
+
+from config import current_config
+from service.metrics import GOVERNOR_ALLOCATED, GOVERNOR_SCALE
+
+# CPU过载时预算的缩减比例和最低比例
+SCALE_DECREASE = 0.8
+SCALE_INCREASE = 0.1
+MIN_SCALE = 0.2
+
+
+class Allocation(NamedTuple):
+    """分配给一个nuclei进程的参数"""
+    # 并行执行的模板数（-c）
+    concurrency: int
+    # 每个模板并行扫描的主机数（-bs）
+    bulk_size: int
+    # 每秒最大请求数（-rl）
+    rate_limit: int
+    # 占全局预算的比例
+    share: float
+
+
+class ResourceGovernor:
+    """
+    资源调控器
+
+    全局预算为 NUCLEI_RATE_LIMIT_TOTAL、NUCLEI_CONCURRENCY_TOTAL、NUCLEI_BULK_SIZE_TOTAL，
+    每个nuclei进程启动时分得 预算 / n，n 为包括本进程在内的运行中进程数与当前需求
+    （运行中和排队中的进程数，不超过并发槽位数）中的较大者，同时启动或排队的进程平分预算。
+
+    nuclei不支持在运行中调整这些参数，先启动的进程保持启动时的份额：单独运行的进程分得全部预算，
+    之后启动的进程按当时的运行数平分，份额之和可能暂时超过预算，直到先启动的进程结束。
+    采样线程定期读取主机CPU使用率，超过 GOVERNOR_CPU_TARGET 时按比例缩减之后启动的进程的份额，
+    CPU空闲后逐步恢复。
+    """
+
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self.lock = threading.Lock()
+        # 进程标识 -> 份额
+        self.allocations: Dict[str, float] = {}
+        # CPU调控系数，可分配的预算为全局预算乘以该系数
+        self.scale = 1.0
+        GOVERNOR_SCALE.set(self.scale)
+
+        sampler = threading.Thread(target=self._sample_cpu, daemon=True)
+        sampler.start()
+
+    @staticmethod
+    def _limits(share: float) -> Allocation:
+        """按份额计算nuclei参数，每个参数至少为1"""
+        return Allocation(
+            concurrency=max(1, int(current_config.NUCLEI_CONCURRENCY_TOTAL * share)),
+            bulk_size=max(1, int(current_config.NUCLEI_BULK_SIZE_TOTAL * share)),
+            rate_limit=max(1, int(current_config.NUCLEI_RATE_LIMIT_TOTAL * share)),
+            share=share
+        )
+
+    def acquire(self, key: str, demand: int) -> Allocation:
+        """
+        为即将启动的nuclei进程分配参数
+
+        参数:
+            key: 进程标识
+            demand: 当前需要运行的进程数（包括本进程）
+        """
+        with self.lock:
+            self.allocations.pop(key, None)
+            running = len(self.allocations) + 1
+            share = self.scale / max(running, min(self.slots, demand))
+            self.allocations[key] = share
+            GOVERNOR_ALLOCATED.set(sum(self.allocations.values()))
+        return self._limits(share)
+
+    def release(self, key: str) -> None:
+        """nuclei进程结束，释放份额"""
+        with self.lock:
+            self.allocations.pop(key, None)
+            GOVERNOR_ALLOCATED.set(sum(self.allocations.values()))
+
+    def _sample_cpu(self) -> None:
+        """采样主机CPU使用率并调整调控系数"""
+        try:
+            import psutil
+        except ImportError:
+            return
+
+        target = current_config.GOVERNOR_CPU_TARGET
+        while True:
+            # cpu_percent按采样间隔阻塞，同时作为循环的间隔
+            cpu = psutil.cpu_percent(interval=current_config.GOVERNOR_INTERVAL)
+            with self.lock:
+                if cpu > target:
+                    self.scale = max(MIN_SCALE, self.scale * SCALE_DECREASE)
+                elif cpu < target * 0.8:
+                    self.scale = min(1.0, self.scale + SCALE_INCREASE)
+                GOVERNOR_SCALE.set(self.scale)
+
+
+def create_governor(slots: int) -> Optional[ResourceGovernor]:
+    """根据配置创建资源调控器，未启用时返回None（nuclei使用默认参数）"""
+    if not current_config.NUCLEI_GOVERNOR:
+        return None
+    return ResourceGovernor(slots)
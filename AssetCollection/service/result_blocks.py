@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+扫描结果的压缩块格式和块缓存
+
+结果按序号每 BLOCK_RECORDS 条合并为一个块，块内为JSONL文本，整体以zlib压缩。
+同一扫描的结果字段高度重复（模板信息、请求头、主机名），按块压缩的体积通常只有原文的几分之一。
+序号为seq的结果位于第 seq // BLOCK_RECORDS 个块的第 seq % BLOCK_RECORDS 行。
+
+最近读取的块和结果索引保存在按字节数限制的LRU缓存中，翻页时不重复解压，
+缓存总大小不超过 RESULT_CACHE_BYTES，与保留的扫描数量无关。
+"""
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+from config import current_config
+from service.metrics import RESULT_CACHE_SIZE
+
+# 每个块的结果数，属于存储格式的一部分，修改后已有的结果块无法读取
+BLOCK_RECORDS = 256
+
+# zlib压缩等级
+COMPRESS_LEVEL = 6
+
+
+def block_of(seq: int) -> int:
+    """结果序号所在的块号"""
+    return seq // BLOCK_RECORDS
+
+
+def encode_block(lines: List[str]) -> bytes:
+    """将一个块的结果（JSON文本）压缩为字节串"""
+    return zlib.compress('\n'.join(lines).encode('utf-8'), COMPRESS_LEVEL)
+
+
+def decode_block(data: bytes) -> List[str]:
+    """解压一个块，返回块内的结果（JSON文本）"""
+    return zlib.decompress(data).decode('utf-8').split('\n')
+
+
+def block_size(lines: List[str]) -> int:
+    """估算解压后的块占用的内存字节数"""
+    return sys.getsizeof(lines) + sum(sys.getsizeof(line) for line in lines)
+
+
+class BlockCache:
+    """
+    按字节数限制的LRU缓存
+
+    键的第一个元素为scan_id，删除扫描时可一并清除该扫描的全部缓存项。
+    单个缓存项超过容量时不缓存。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            self.items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        if size > self.capacity:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.items[key] = (value, size)
+            self.size += size
+            # 淘汰最久未使用的缓存项
+            while self.size > self.capacity:
+                _, (_, evicted) = self.items.popitem(last=False)
+                self.size -= evicted
+
+    def discard(self, scan_id: str) -> None:
+        """清除一个扫描的全部缓存项"""
+        with self.lock:
+            for key in [key for key in self.items if key[0] == scan_id]:
+                self.size -= self.items.pop(key)[1]
+
+
+# 全局结果块缓存
+result_cache = BlockCache(current_config.RESULT_CACHE_BYTES)
+RESULT_CACHE_SIZE.set_function(lambda: result_cache.size)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+扫描结果导出服务，以流的方式生成导出文件，并按(scan_id, 格式)缓存生成的文件
+"""
+import csv
+import glob
+import hashlib
+import io
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional
+
+# 导出格式 -> (文件扩展名, 媒体类型)
+EXPORT_FORMATS = {
+    "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "json": ("json", "application/json"),
+    "jsonl": ("jsonl", "application/x-ndjson"),
+    "csv": ("csv", "text/csv"),
+}
+
+# 表格导出的列
+EXPORT_COLUMNS = ["Target", "Type", "Severity", "Template", "Description", "Match"]
+
+# 流式输出时每个数据块的大致字节数
+CHUNK_SIZE = 64 * 1024
+
+
+def export_row(result: Dict) -> list:
+    """将一条nuclei结果转换为表格行"""
+    info = result.get("info") or {}
+    return [
+        result.get("host", ""),
+        result.get("type", ""),
+        result.get("severity") or info.get("severity", ""),
+        result.get("template-id", ""),
+        info.get("description", ""),
+        result.get("matched-at", ""),
+    ]
+
+
+class ExportArtifact(NamedTuple):
+    """导出结果，已缓存的文件返回path，否则返回以流方式生成的stream"""
+    filename: str
+    media_type: str
+    path: Optional[str] = None
+    stream: Optional[Iterator[bytes]] = None
+
+
+class ResultExporter:
+    """
+    结果导出器
+
+    CSV、JSON、JSONL逐行生成并以流的方式返回，同时写入缓存文件；Excel使用openpyxl的只写模式生成。
+    缓存文件名包含结果版本号，结果发生变化后版本号改变，旧文件在生成新文件时删除。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def version(job: Dict) -> str:
+        """根据任务的结果数和结束时间生成结果版本号"""
+        token = f"{job.get('completed')}|{job.get('end_time')}"
+        return hashlib.sha1(token.encode("utf-8")).hexdigest()[:12]
+
+    def _artifact_path(self, scan_id: str, export_format: str, version: str) -> str:
+        """缓存文件路径"""
+        extension = EXPORT_FORMATS[export_format][0]
+        return os.path.join(self.cache_dir, f"{scan_id}.{version}.{extension}")
+
+    def _remove_stale(self, scan_id: str, export_format: str, keep: str) -> None:
+        """删除同一扫描同一格式的旧版本缓存文件"""
+        extension = EXPORT_FORMATS[export_format][0]
+        for path in glob.glob(os.path.join(self.cache_dir, f"{glob.escape(scan_id)}.*.{extension}")):
+            if path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def export(self, scan_id: str, export_format: str, job: Dict, results: Iterable[Dict]) -> ExportArtifact:
+        """
+        导出扫描结果
+
+        参数:
+            scan_id: 扫描ID
+            export_format: 导出格式
+            job: 任务记录，用于计算结果版本号
+            results: 结果迭代器，只有在需要重新生成时才会被消费
+        """
+        extension, media_type = EXPORT_FORMATS[export_format]
+        filename = f"{scan_id}.{extension}"
+        path = self._artifact_path(scan_id, export_format, self.version(job))
+
+        # 已有当前版本的缓存文件，直接返回
+        if os.path.exists(path):
+            return ExportArtifact(filename, media_type, path=path)
+
+        if export_format == "excel":
+            self._write_excel(path, results)
+            self._remove_stale(scan_id, export_format, path)
+            return ExportArtifact(filename, media_type, path=path)
+
+        if export_format == "csv":
+            chunks = self._csv_chunks(results)
+        elif export_format == "jsonl":
+            chunks = self._jsonl_chunks(results)
+        else:
+            chunks = self._json_chunks(results)
+        return ExportArtifact(
+            filename, media_type,
+            stream=self._tee(scan_id, export_format, path, chunks)
+        )
+
+    def _tee(self, scan_id: str, export_format: str, path: str, chunks: Iterator[str]) -> Iterator[bytes]:
+        """输出数据块的同时写入临时文件，完整输出后原子替换为缓存文件"""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    data = chunk.encode("utf-8")
+                    f.write(data)
+                    yield data
+            os.replace(temp_path, path)
+            completed = True
+            self._remove_stale(scan_id, export_format, path)
+        finally:
+            # 客户端中途断开时丢弃不完整的文件
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def _csv_chunks(results: Iterable[Dict]) -> Iterator[str]:
+        """逐行生成CSV"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for result in results:
+            writer.writerow(export_row(result))
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    @staticmethod
+    def _jsonl_chunks(results: Iterable[Dict]) -> Iterator[str]:
+        """逐行生成JSONL"""
+        lines = []
+        size = 0
+        for result in results:
+            line = json.dumps(result, ensure_ascii=False) + "\n"
+            lines.append(line)
+            size += len(line)
+            if size >= CHUNK_SIZE:
+                yield "".join(lines)
+                lines, size = [], 0
+        yield "".join(lines)
+
+    @staticmethod
+    def _json_chunks(results: Iterable[Dict]) -> Iterator[str]:
+        """逐条生成JSON数组"""
+        parts = ["["]
+        size = 1
+        for i, result in enumerate(results):
+            part = (",\n" if i else "\n") + json.dumps(result, ensure_ascii=False)
+            parts.append(part)
+            size += len(part)
+            if size >= CHUNK_SIZE:
+                yield "".join(parts)
+                parts, size = [], 0
+        parts.append("\n]")
+        yield "".join(parts)
+
+    def _write_excel(self, path: str, results: Iterable[Dict]) -> None:
+        """使用openpyxl只写模式逐行生成Excel文件"""
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Sheet1")
+        sheet.append(EXPORT_COLUMNS)
+        for result in results:
+            sheet.append(export_row(result))
+
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        os.close(fd)
+        try:
+            workbook.save(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
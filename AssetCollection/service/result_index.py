@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+扫描结果索引，支持基于游标的分页和按字段过滤
+"""
+import hashlib
+import json
+import pickle
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+# 支持过滤的字段
+INDEX_FIELDS = ("severity", "template_id", "host", "type")
+
+
+def extract_fields(result: Dict) -> Dict[str, str]:
+    """从nuclei结果中提取可过滤字段的值"""
+    info = result.get("info") or {}
+    return {
+        "severity": str(info.get("severity") or result.get("severity") or "").lower(),
+        "template_id": str(result.get("template-id") or ""),
+        "host": str(result.get("host") or ""),
+        "type": str(result.get("type") or "").lower(),
+    }
+
+
+def finding_key(result: Dict) -> bytes:
+    """
+    结果的标识，同一模板在同一位置匹配到的同一结果标识相同
+
+    只使用模板、匹配位置和匹配内容，不包含时间戳、请求响应等每次扫描都会变化的字段
+    """
+    identity = [
+        result.get("template-id"), result.get("matched-at") or result.get("host"),
+        result.get("matcher-name"), result.get("extractor-name"), result.get("extracted-results")
+    ]
+    return hashlib.blake2b(json.dumps(identity, ensure_ascii=False).encode("utf-8"), digest_size=16).digest()
+
+
+def normalize_filters(filters: Dict[str, Optional[str]]) -> Dict[str, str]:
+    """去掉空过滤条件，并与索引使用相同的大小写规则"""
+    normalized = {}
+    for field, value in filters.items():
+        if field not in INDEX_FIELDS or value is None or value == "":
+            continue
+        normalized[field] = value.lower() if field in ("severity", "type") else value
+    return normalized
+
+
+class ResultIndex:
+    """
+    单个扫描的结果索引
+
+    结果按写入顺序编号（序号即游标），postings为每个字段值维护一个有序的序号列表。
+    查询只访问一页所需的条目，耗时取决于分页大小而不是结果总数。
+    """
+
+    def __init__(self, count: int = 0, postings: Optional[Dict[str, Dict[str, array]]] = None):
+        self.count = count
+        self.postings: Dict[str, Dict[str, array]] = postings or {field: {} for field in INDEX_FIELDS}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def nbytes(self) -> int:
+        """倒排表占用的字节数（近似值），用于缓存计数"""
+        with self.lock:
+            return sum(
+                len(value) + 64 + postings.itemsize * len(postings)
+                for field in self.postings.values() for value, postings in field.items()
+            )
+
+    def dump(self) -> bytes:
+        """序列化为压缩的字节串"""
+        with self.lock:
+            return zlib.compress(pickle.dumps((self.count, self.postings), protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def load(cls, data: bytes) -> "ResultIndex":
+        """从dump()的结果恢复索引"""
+        count, postings = pickle.loads(zlib.decompress(data))
+        return cls(count, postings)
+
+    def add(self, result: Dict) -> int:
+        """登记一条结果，返回其序号"""
+        return self.add_fields(extract_fields(result))
+
+    def add_fields(self, fields: Dict[str, str]) -> int:
+        """按已提取的字段值（见extract_fields）登记一条结果，返回其序号"""
+        with self.lock:
+            ordinal = self.count
+            self.count += 1
+            for field, value in fields.items():
+                postings = self.postings[field].get(value)
+                if postings is None:
+                    postings = self.postings[field][value] = array('q')
+                postings.append(ordinal)
+        return ordinal
+
+    def query(self, filters: Dict[str, str], cursor: int, limit: int,
+              live: bool = False) -> Tuple[List[int], Optional[int]]:
+        """
+        按过滤条件查询一页结果
+
+        参数:
+            filters: 已规范化的过滤条件（字段 -> 值）
+            cursor: 起始序号（包含）
+            limit: 本页最大条数
+            live: 扫描是否仍在进行。进行中的扫描读到当前末尾时仍返回游标（之后新写入的结果的起始序号），
+                  客户端可以从该游标继续轮询，不需要从头读取
+
+        返回:
+            (本页结果的序号列表, 下一页游标；扫描已结束且没有更多结果时为None)
+        """
+        with self.lock:
+            # 已读到当前末尾时的游标，之后写入的结果序号不小于count
+            end_cursor = max(cursor, self.count) if live else None
+            if not filters:
+                end = min(cursor + limit, self.count)
+                ordinals = list(range(cursor, end))
+                next_cursor = end if end < self.count else end_cursor
+                return ordinals, next_cursor
+
+            lists = []
+            for field, value in filters.items():
+                postings = self.postings[field].get(value)
+                if postings is None:
+                    return [], end_cursor
+                lists.append(postings)
+
+            # 以最短的倒排表驱动，其余倒排表用二分查找判断是否命中
+            lists.sort(key=len)
+            driver, others = lists[0], lists[1:]
+            ordinals = []
+            last = None
+            position = bisect_left(driver, cursor)
+            while position < len(driver) and len(ordinals) < limit:
+                ordinal = driver[position]
+                position += 1
+                if all(self._contains(other, ordinal) for other in others):
+                    ordinals.append(ordinal)
+                    last = ordinal
+
+            next_cursor = last + 1 if last is not None and position < len(driver) else end_cursor
+            return ordinals, next_cursor
+
+    @staticmethod
+    def _contains(postings: array, ordinal: int) -> bool:
+        """判断有序倒排表中是否包含指定序号"""
+        position = bisect_left(postings, ordinal)
+        return position < len(postings) and postings[position] == ordinal
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+增量扫描缓存服务，记录每个(目标, 模板集合)最近一次的扫描时间和扫描结果
+"""
+import os
+import sqlite3
+import threading
+import time
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from service.target_normalizer import canonicalize
+
+# 每次批量查询或写入的目标数
+BATCH_SIZE = 500
+
+
+def template_key(templates: Optional[List[str]]) -> str:
+    """生成模板集合的缓存键，未指定模板时使用全部模板"""
+    if not templates:
+        return "*"
+    return ",".join(sorted(set(templates)))
+
+
+def finding_targets(result: dict) -> List[str]:
+    """
+    推断一条nuclei结果对应的扫描目标
+
+    按可能性从高到低返回规范化后的候选目标，写入缓存时取第一个确实被扫描过的候选
+    """
+    candidates = []
+    values = [result.get("host"), result.get("matched-at"), result.get("url")]
+    if result.get("ip") and result.get("port"):
+        values.append(f"{result['ip']}:{result['port']}")
+
+    for value in values:
+        if not value:
+            continue
+        key = canonicalize(str(value))
+        if key not in candidates:
+            candidates.append(key)
+        # 网络类模板的结果带端口，目标可能是不带端口的主机
+        if "://" not in key and ":" in key:
+            host, port = key.rsplit(":", 1)
+            if port.isdigit():
+                host = canonicalize(host.strip("[]"))
+                if host not in candidates:
+                    candidates.append(host)
+    return candidates
+
+
+class ScanCache:
+    """
+    增量扫描缓存（SQLite）
+
+    cache_targets 记录每个(模板集合, 目标)最近一次成功扫描的时间，
+    cache_findings 保存该次扫描中归属于该目标的结果。
+    超过TTL的记录视为过期，需要重新扫描，并在写入时清理。
+    """
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.write_conn = self._connect()
+        with self.write_conn as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_targets ("
+                " template_key TEXT NOT NULL,"
+                " target TEXT NOT NULL,"
+                " scanned_at REAL NOT NULL,"
+                " PRIMARY KEY (template_key, target)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_targets_time ON cache_targets (scanned_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_findings ("
+                " id INTEGER PRIMARY KEY,"
+                " template_key TEXT NOT NULL,"
+                " target TEXT NOT NULL,"
+                " scanned_at REAL NOT NULL,"
+                " raw TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_findings_target ON cache_findings (template_key, target)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_findings_time ON cache_findings (scanned_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建数据库连接"""
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """获取当前线程的只读连接"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self._connect()
+        return conn
+
+    @staticmethod
+    def _batches(items: Iterable, size: int = BATCH_SIZE) -> Iterator[List]:
+        """按批次切分可迭代对象"""
+        iterator = iter(items)
+        while True:
+            batch = list(islice(iterator, size))
+            if not batch:
+                return
+            yield batch
+
+    def lookup(self, key: str, targets: Iterable[str]) -> Iterator[Tuple[str, Optional[List[str]]]]:
+        """
+        逐个判断目标是否命中缓存
+
+        返回:
+            (目标, 缓存的原始结果列表)，未命中或已过期时结果列表为None
+        """
+        conn = self._reader()
+        fresh_after = time.time() - self.ttl
+        for batch in self._batches(targets):
+            placeholders = ",".join("?" for _ in batch)
+            fresh = {
+                row[0] for row in conn.execute(
+                    f"SELECT target FROM cache_targets WHERE template_key = ? AND scanned_at >= ?"
+                    f" AND target IN ({placeholders})",
+                    [key, fresh_after] + batch
+                )
+            }
+
+            cached = {target: [] for target in fresh}
+            if fresh:
+                fresh_list = list(fresh)
+                placeholders = ",".join("?" for _ in fresh_list)
+                for target, raw in conn.execute(
+                    f"SELECT target, raw FROM cache_findings WHERE template_key = ?"
+                    f" AND target IN ({placeholders}) ORDER BY id",
+                    [key] + fresh_list
+                ):
+                    cached[target].append(raw)
+
+            for target in batch:
+                yield target, cached.get(target)
+
+    def record(self, key: str, targets: Iterable[str], findings: Iterable[Tuple[List[str], str]]) -> None:
+        """
+        记录一次成功扫描
+
+        参数:
+            key: 模板集合的缓存键
+            targets: 本次实际扫描的目标
+            findings: (候选目标列表, 原始结果)，结果归属于第一个被扫描过的候选目标
+        """
+        now = time.time()
+        with self.write_lock, self.write_conn as conn:
+            for batch in self._batches(targets):
+                placeholders = ",".join("?" for _ in batch)
+                conn.execute(
+                    f"DELETE FROM cache_findings WHERE template_key = ? AND target IN ({placeholders})",
+                    [key] + batch
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache_targets (template_key, target, scanned_at) VALUES (?, ?, ?)",
+                    [(key, target, now) for target in batch]
+                )
+
+            for candidates, raw in findings:
+                for target in candidates:
+                    row = conn.execute(
+                        "SELECT 1 FROM cache_targets WHERE template_key = ? AND target = ? AND scanned_at = ?",
+                        (key, target, now)
+                    ).fetchone()
+                    if row is not None:
+                        conn.execute(
+                            "INSERT INTO cache_findings (template_key, target, scanned_at, raw) VALUES (?, ?, ?, ?)",
+                            (key, target, now, raw)
+                        )
+                        break
+
+            # 清理过期记录
+            conn.execute("DELETE FROM cache_targets WHERE scanned_at < ?", (now - self.ttl,))
+            conn.execute("DELETE FROM cache_findings WHERE scanned_at < ?", (now - self.ttl,))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+扫描任务状态对象，每个未结束的任务持有自己的锁，并对外发布不可变的状态快照
+"""
+import threading
+from typing import Dict
+
+
+class ScanJob:
+    """
+    未结束扫描任务的状态
+
+    state 只能在持有 lock 时修改，修改完成后调用 publish() 生成新的快照并整体替换 snapshot。
+    快照发布后不再修改，读取状态时直接引用当前快照，不需要加锁，
+    因此查询状态不会等待任何扫描的结果写入或文件读写。
+    """
+
+    def __init__(self, scan_id: str, state: Dict):
+        self.scan_id = scan_id
+        # 每个任务各自的锁竞争很少，不记录等待时长，避免每次写入结果都记录一次直方图
+        self.lock = threading.Lock()
+        self.state = state
+        self.snapshot = self._freeze()
+
+    def _freeze(self) -> Dict:
+        """复制当前状态，分片状态逐个复制"""
+        snapshot = dict(self.state)
+        snapshot["shards"] = [dict(shard) for shard in self.state["shards"]]
+        return snapshot
+
+    def publish(self) -> Dict:
+        """发布新的状态快照（需持有lock），返回发布的快照"""
+        snapshot = self._freeze()
+        # 属性赋值是原子操作，读取方要么看到旧快照，要么看到完整的新快照
+        self.snapshot = snapshot
+        return snapshot
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+扫描调度器，负责将排队的扫描任务分发到有限的并发槽位中执行
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from service.metrics import InstrumentedLock
+
+logger = logging.getLogger(__name__)
+
+
+class ScanScheduler:
+    """
+    事件驱动的扫描调度器
+
+    使用阻塞队列存放待执行任务，使用信号量表示并发槽位。
+    调度线程在队列为空或槽位占满时阻塞等待，槽位释放后立即分发下一个任务，
+    不再需要轮询和固定的休眠间隔。
+
+    指定 loop_getter 时 runner 为协程函数，任务作为协程提交到事件循环中执行，
+    不再为每个任务创建线程。
+    """
+
+    def __init__(self, runner: Callable[[str, Any, float], Any], max_concurrent: int,
+                 loop_getter: Optional[Callable[[], asyncio.AbstractEventLoop]] = None,
+                 on_error: Optional[Callable[[str, Any, str], None]] = None):
+        """
+        初始化调度器
+
+        参数:
+            runner: 任务执行函数，签名为 runner(scan_id, payload, queue_wait)
+            max_concurrent: 最大并发执行数
+            loop_getter: 返回执行协程的事件循环，为None时每个任务在独立线程中执行
+            on_error: 任务无法提交或执行函数异常退出时的回调，签名为 on_error(scan_id, payload, error)
+        """
+        self.runner = runner
+        self.max_concurrent = max_concurrent
+        self.loop_getter = loop_getter
+        self.on_error = on_error
+        self.scan_queue = queue.Queue()
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.active_scans = 0
+        self.lock = InstrumentedLock("scheduler")
+
+        # 启动调度线程
+        self.dispatcher_thread = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher_thread.start()
+
+    def submit(self, scan_id: str, payload: Any) -> None:
+        """提交扫描任务，记录入队时间用于计算排队等待时长"""
+        self.scan_queue.put((scan_id, payload, time.monotonic()))
+
+    def queue_depth(self) -> int:
+        """返回当前排队中的任务数"""
+        return self.scan_queue.qsize()
+
+    def active_count(self) -> int:
+        """返回当前正在执行的任务数"""
+        with self.lock:
+            return self.active_scans
+
+    def _dispatch(self) -> None:
+        """调度线程，阻塞等待任务和空闲槽位"""
+        while True:
+            # 阻塞等待新任务
+            scan_id, payload, enqueued_at = self.scan_queue.get()
+            # 阻塞等待空闲槽位
+            self.slots.acquire()
+            queue_wait = time.monotonic() - enqueued_at
+
+            with self.lock:
+                self.active_scans += 1
+
+            if self.loop_getter is not None:
+                self._launch_coroutine(scan_id, payload, queue_wait)
+            else:
+                scan_thread = threading.Thread(
+                    target=self._run,
+                    args=(scan_id, payload, queue_wait),
+                    daemon=True
+                )
+                scan_thread.start()
+            self.scan_queue.task_done()
+
+    def _launch_coroutine(self, scan_id: str, payload: Any, queue_wait: float) -> None:
+        """将任务协程提交到事件循环，协程结束（包括被取消）后释放槽位"""
+        try:
+            loop = self.loop_getter()
+            future = asyncio.run_coroutine_threadsafe(self.runner(scan_id, payload, queue_wait), loop)
+        except Exception as e:
+            logger.exception("提交扫描任务失败: %s", scan_id)
+            self._release()
+            self._fail(scan_id, payload, f"提交扫描任务失败: {str(e)}")
+            return
+        future.add_done_callback(lambda done: self._coroutine_done(scan_id, payload, done))
+
+    def _coroutine_done(self, scan_id: str, payload: Any, future) -> None:
+        """任务协程结束，释放槽位；协程异常退出时记录任务失败"""
+        self._release()
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error("扫描任务异常结束: %s", scan_id, exc_info=error)
+            self._fail(scan_id, payload, str(error) or type(error).__name__)
+
+    def _run(self, scan_id: str, payload: Any, queue_wait: float) -> None:
+        """执行任务，结束后释放槽位；执行函数异常退出时记录任务失败"""
+        try:
+            self.runner(scan_id, payload, queue_wait)
+        except Exception as e:
+            logger.exception("扫描任务异常结束: %s", scan_id)
+            self._fail(scan_id, payload, str(e) or type(e).__name__)
+        finally:
+            self._release()
+
+    def _fail(self, scan_id: str, payload: Any, error: str) -> None:
+        """通知调用方任务未能正常执行"""
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(scan_id, payload, error)
+        except Exception:
+            logger.exception("记录扫描任务失败状态出错: %s", scan_id)
+
+    def _release(self) -> None:
+        """释放并发槽位"""
+        with self.lock:
+            self.active_scans -= 1
+        self.slots.release()
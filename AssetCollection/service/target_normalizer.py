@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+扫描目标规范化服务，负责目标的规范化、去重以及CIDR和端口范围的展开
+"""
+import ipaddress
+from functools import partial
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
+
+from model.asset_model import Target
+
+# 端口区间（闭区间）
+PortRange = Tuple[int, int]
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+# 各协议的默认端口
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def parse_ports(spec: str) -> List[PortRange]:
+    """解析端口描述，例如 "80,443,8000-8100" """
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            start, end = int(start), int(end)
+        else:
+            start = end = int(part)
+        if not 0 < start <= end <= 65535:
+            raise ValueError(f"无效的端口范围: {part}")
+        ranges.append((start, end))
+    return ranges
+
+
+def merge_ranges(ranges: List[PortRange]) -> List[PortRange]:
+    """合并重叠或相邻的端口区间"""
+    merged: List[PortRange] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def range_size(ranges: List[PortRange]) -> int:
+    """端口区间包含的端口数"""
+    return sum(end - start + 1 for start, end in ranges)
+
+
+def normalize_domain(domain: str) -> str:
+    """域名规范化：去除空白和末尾的点，转为小写，国际化域名转为punycode"""
+    domain = domain.strip().rstrip(".").lower()
+    if not domain:
+        raise ValueError("域名不能为空")
+    try:
+        return domain.encode("idna").decode("ascii")
+    except UnicodeError:
+        return domain
+
+
+def format_host_port(host: str, port: Optional[int]) -> str:
+    """拼接主机和端口，IPv6地址加方括号"""
+    if port is None:
+        return host
+    if ":" in host:
+        return f"[{host}]:{port}"
+    return f"{host}:{port}"
+
+
+class TargetNormalizer:
+    """
+    目标规范化器
+
+    - URL：协议和主机名小写，去掉默认端口；不含路径的URL与主机目标合并（http://x 与 x 视为同一目标）
+    - 域名：小写、去掉末尾的点，同一域名的端口区间合并
+    - IP/CIDR：按端口区间切分后用 collapse_addresses 合并重叠网段，单个IP视为/32（/128）网段
+    - 端口范围：合并重叠区间后展开
+
+    规范化只保存合并后的网段和端口区间，目标在迭代时逐个生成，
+    /16这样的网段不会一次性展开到内存中。总数通过网段大小和端口数直接计算。
+    """
+
+    def __init__(self, targets: List[Target]):
+        # 提交的原始目标数（网段和端口范围按展开后的数量计）
+        self.submitted = 0
+        # 带路径的URL
+        self.urls: Set[str] = set()
+        # 域名 -> [是否包含不带端口的目标, 端口区间列表]
+        self.domains: Dict[str, list] = {}
+        # 网段及其端口区间，None表示不带端口
+        self.networks: List[Tuple[IPNetwork, Optional[List[PortRange]]]] = []
+
+        for target in targets:
+            self._add(target)
+        self._build()
+
+    def _build(self) -> None:
+        """合并端口区间和网段，计算展开后的目标总数"""
+        self.domain_plan = self._plan_domains()
+        self.network_plan = self._plan_networks()
+        self.total = (
+            len(self.urls)
+            + sum(int(bare) + range_size(ranges) for bare, ranges in self.domain_plan)
+            + sum(
+                sum(network.num_addresses for network in networks) * (range_size(ranges) if ranges else 1)
+                for ranges, networks in self.network_plan
+            )
+        )
+
+    @property
+    def collapsed(self) -> int:
+        """去重合并掉的目标数"""
+        return self.submitted - self.total
+
+    def _add(self, target: Target) -> None:
+        """解析单个目标"""
+        ranges: Optional[List[PortRange]] = None
+        if target.port or target.ports:
+            ranges = []
+            if target.port:
+                ranges.append((target.port, target.port))
+            if target.ports:
+                ranges.extend(parse_ports(target.ports))
+
+        if target.url:
+            self._add_url(str(target.url))
+        elif target.domain:
+            self._add_host(target.domain, ranges)
+        elif target.ip:
+            self._add_host(target.ip, ranges)
+
+    def _add_url(self, url: str) -> None:
+        """解析URL目标"""
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        host = parts.hostname or ""
+        port = parts.port
+        if port == DEFAULT_PORTS.get(scheme):
+            port = None
+
+        if parts.path in ("", "/") and not parts.query and not parts.fragment:
+            # 不含路径的URL与主机目标等价
+            self._add_host(host, [(port, port)] if port else None)
+            return
+
+        self.submitted += 1
+        host = self._normalize_host(host)
+        netloc = format_host_port(host, port)
+        if parts.username:
+            netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{netloc}"
+        self.urls.add(urlunsplit((scheme, netloc, parts.path, parts.query, parts.fragment)))
+
+    @staticmethod
+    def _normalize_host(host: str) -> str:
+        """主机名规范化，IP地址转为标准形式"""
+        try:
+            return ipaddress.ip_address(host.strip().strip("[]")).compressed
+        except ValueError:
+            return normalize_domain(host)
+
+    def _add_host(self, host: str, ranges: Optional[List[PortRange]]) -> None:
+        """解析域名、IP或CIDR目标"""
+        host = host.strip().strip("[]")
+        count = range_size(ranges) if ranges else 1
+
+        try:
+            network = ipaddress.ip_network(host, strict=False)
+        except ValueError:
+            network = None
+
+        if network is not None:
+            self.submitted += network.num_addresses * count
+            self.networks.append((network, ranges))
+            return
+
+        self.submitted += count
+        entry = self.domains.setdefault(normalize_domain(host), [False, []])
+        if ranges:
+            entry[1].extend(ranges)
+        else:
+            entry[0] = True
+
+    def _plan_domains(self) -> List[Tuple[bool, List[PortRange]]]:
+        """合并每个域名的端口区间"""
+        plan = []
+        self.domain_names = sorted(self.domains)
+        for domain in self.domain_names:
+            bare, ranges = self.domains[domain]
+            plan.append((bare, merge_ranges(ranges)))
+        return plan
+
+    def _plan_networks(self) -> List[Tuple[Optional[List[PortRange]], List[IPNetwork]]]:
+        """
+        按端口将网段切分为互不重叠的端口段，每个端口段内合并网段
+
+        不同端口描述之间可能存在重叠，先用所有区间的端点把端口切成互不相交的小段，
+        再为每一段收集覆盖它的网段并合并，保证同一个(IP, 端口)只生成一次
+        """
+        plan = []
+
+        # 不带端口的网段
+        bare = [network for network, ranges in self.networks if ranges is None]
+        plan.extend(self._collapse(None, bare))
+
+        # 带端口的网段按端口段合并
+        with_ports = [(network, merge_ranges(ranges)) for network, ranges in self.networks if ranges]
+        bounds = sorted({start for _, ranges in with_ports for start, _ in ranges}
+                        | {end + 1 for _, ranges in with_ports for _, end in ranges})
+        for start, next_start in zip(bounds, bounds[1:]):
+            segment = (start, next_start - 1)
+            covering = [
+                network for network, ranges in with_ports
+                if any(low <= start and next_start - 1 <= high for low, high in ranges)
+            ]
+            plan.extend(self._collapse([segment], covering))
+
+        # 相邻且网段相同的端口段合并，减少重复遍历
+        merged = []
+        for ranges, networks in plan:
+            if merged and ranges and merged[-1][0] and merged[-1][1] == networks \
+                    and merged[-1][0][-1][1] + 1 == ranges[0][0]:
+                merged[-1] = (merged[-1][0] + ranges, networks)
+            else:
+                merged.append((ranges, networks))
+        return merged
+
+    @staticmethod
+    def _collapse(ranges: Optional[List[PortRange]],
+                  networks: List[IPNetwork]) -> List[Tuple[Optional[List[PortRange]], List[IPNetwork]]]:
+        """合并同一端口段下的IPv4和IPv6网段"""
+        plan = []
+        for version in (4, 6):
+            same_version = [network for network in networks if network.version == version]
+            if same_version:
+                plan.append((ranges, list(ipaddress.collapse_addresses(same_version))))
+        return plan
+
+    def _segments(self) -> Iterator[Tuple[int, Callable[[int], Iterator[str]]]]:
+        """
+        按生成顺序列出目标区段：(区段内的目标数, 生成函数)
+
+        生成函数的参数为区段内跳过的目标数，跳过的目标按位置直接计算，不逐个生成
+        """
+        urls = sorted(self.urls)
+        yield len(urls), partial(self._iter_items, urls)
+
+        for domain, (bare, ranges) in zip(self.domain_names, self.domain_plan):
+            if bare:
+                yield 1, partial(self._iter_items, (domain,))
+            if ranges:
+                yield range_size(ranges), partial(self._iter_host_ports, domain, ranges)
+
+        for ranges, networks in self.network_plan:
+            ports = range_size(ranges) if ranges else 1
+            for network in networks:
+                yield network.num_addresses * ports, partial(self._iter_network, network, ranges)
+
+    @staticmethod
+    def _iter_items(items: Sequence[str], skip: int) -> Iterator[str]:
+        """生成列表中的目标，跳过前skip个"""
+        return islice(items, skip, None)
+
+    @staticmethod
+    def _iter_host_ports(host: str, ranges: List[PortRange], skip: int) -> Iterator[str]:
+        """生成主机的各端口目标，跳过前skip个"""
+        for start, end in ranges:
+            size = end - start + 1
+            if skip >= size:
+                skip -= size
+                continue
+            for port in range(start + skip, end + 1):
+                yield format_host_port(host, port)
+            skip = 0
+
+    def _iter_network(self, network: IPNetwork, ranges: Optional[List[PortRange]], skip: int) -> Iterator[str]:
+        """生成网段内的目标，跳过前skip个"""
+        ports = range_size(ranges) if ranges else 1
+        first, port_skip = divmod(skip, ports)
+        # 与nuclei处理CIDR输入一致，包含网络地址和广播地址
+        for offset in range(first, network.num_addresses):
+            host = (network.network_address + offset).compressed
+            if ranges is None:
+                yield host
+            else:
+                yield from self._iter_host_ports(host, ranges, port_skip)
+                port_skip = 0
+
+    def iter_range(self, start: int, stop: int) -> Iterator[str]:
+        """生成序号在 [start, stop) 内的目标，之前的区段按目标数直接跳过"""
+        skip, remaining = start, stop - start
+        for size, generate in self._segments():
+            if remaining <= 0:
+                return
+            if skip >= size:
+                skip -= size
+                continue
+            for target in islice(generate(skip), remaining):
+                yield target
+                remaining -= 1
+            skip = 0
+
+    def __iter__(self) -> Iterator[str]:
+        """逐个生成规范化后的目标"""
+        return self.iter_range(0, self.total)
+
+    def shard_bounds(self, shard_index: int, shard_count: int) -> Tuple[int, int]:
+        """指定分片的目标序号区间 [start, stop)，目标按序号均分为shard_count个连续区间"""
+        return self.total * shard_index // shard_count, self.total * (shard_index + 1) // shard_count
+
+    def shard_size(self, shard_index: int, shard_count: int) -> int:
+        """指定分片的目标数"""
+        start, stop = self.shard_bounds(shard_index, shard_count)
+        return stop - start
+
+    def iter_shard(self, shard_index: int, shard_count: int) -> Iterator[str]:
+        """
+        生成属于指定分片的目标
+
+        各分片的起点由目标总数直接计算（见shard_bounds），
+        每个分片只生成自己的目标，不需要遍历其他分片的目标
+        """
+        return self.iter_range(*self.shard_bounds(shard_index, shard_count))
+
+
+def canonicalize(value: str) -> str:
+    """将单个目标字符串（URL、主机或主机:端口）转换为与TargetNormalizer输出一致的形式"""
+    value = value.strip()
+    normalizer = TargetNormalizer([])
+    try:
+        if "://" in value:
+            normalizer._add_url(value)
+        else:
+            host, port = value, None
+            if value.startswith("[") and "]:" in value:
+                host, port = value[1:].split("]:", 1)
+            elif value.count(":") == 1:
+                host, port = value.split(":", 1)
+            port = int(port) if port else None
+            normalizer._add_host(host, [(port, port)] if port else None)
+        normalizer._build()
+        return next(iter(normalizer), value.lower())
+    except ValueError:
+        return value.lower()
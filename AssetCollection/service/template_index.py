@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+nuclei模板索引服务，记录标签、风险等级到模板ID以及模板ID到路径的映射，用于校验请求中的模板和按指纹选择模板
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config import current_config
+# 模板索引的构建和缓存与AutoScan共用（仓库根目录的easm_common包）
+from easm_common import nuclei_templates
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSnapshot(NamedTuple):
+    """加载完成的模板索引，加载后不再修改，刷新时整体替换"""
+    # 模板目录签名，模板目录不存在时为None
+    signature: Optional[Tuple]
+    # 模板ID -> 相对模板目录的路径
+    paths: Dict[str, str]
+    # 标签 -> 模板ID列表
+    tag_index: Dict[str, List[str]]
+    # 风险等级 -> 模板ID列表
+    severity_index: Dict[str, List[str]]
+
+
+class TemplateIndex:
+    """
+    nuclei模板索引
+
+    首次使用时扫描模板目录构建索引，并以压缩的二进制文件缓存到 TEMPLATE_INDEX_PATH。
+    统计文件、校验和文件以及全部模板文件的修改时间组成索引签名，
+    模板更新（nuclei -ut）或修改子目录中的模板后签名变化，索引重新构建。
+    签名由后台线程每 TEMPLATE_INDEX_CHECK_INTERVAL 秒检查一次，
+    查询直接读取当前的索引快照，不会等待对模板目录的遍历。
+    """
+
+    def __init__(self):
+        # 只保护索引的加载和刷新，查询不获取该锁
+        self.lock = threading.Lock()
+        self.snapshot: Optional[IndexSnapshot] = None
+        self.refresher: Optional[threading.Thread] = None
+
+    @staticmethod
+    def template_dir() -> str:
+        """nuclei模板目录"""
+        return current_config.NUCLEI_TEMPLATE_DIR or os.path.expanduser("~/nuclei-templates")
+
+    def _current(self) -> IndexSnapshot:
+        """获取当前的索引快照，首次使用时加载索引并启动后台刷新线程"""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot
+        with self.lock:
+            if self.snapshot is None:
+                self._reload()
+                self.refresher = threading.Thread(target=self._refresh_loop, name="template-index", daemon=True)
+                self.refresher.start()
+            return self.snapshot
+
+    def refresh(self) -> bool:
+        """检查模板目录签名，变化时重新加载索引，返回索引是否发生变化"""
+        with self.lock:
+            return self._reload()
+
+    def _reload(self) -> bool:
+        """签名变化时加载索引并替换快照（需持有lock）"""
+        signature = nuclei_templates.signature(self.template_dir())
+        if self.snapshot is not None and signature == self.snapshot.signature:
+            return False
+        if signature is None:
+            self.snapshot = IndexSnapshot(None, {}, {}, {})
+            return True
+        _, (paths, tag_index, severity_index) = nuclei_templates.load(
+            self.template_dir(), current_config.TEMPLATE_INDEX_PATH, signature
+        )
+        self.snapshot = IndexSnapshot(signature, paths, tag_index, severity_index)
+        return True
+
+    def _refresh_loop(self) -> None:
+        """后台刷新线程"""
+        while True:
+            time.sleep(max(current_config.TEMPLATE_INDEX_CHECK_INTERVAL, 1))
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("刷新模板索引失败")
+
+    def available(self) -> bool:
+        """模板目录是否存在（不存在时无法校验模板）"""
+        return self._current().signature is not None
+
+    def tags(self) -> Set[str]:
+        """全部标签"""
+        return set(self._current().tag_index)
+
+    def by_tag(self, tag: str) -> List[str]:
+        """带有指定标签的模板ID"""
+        return list(self._current().tag_index.get(tag.lower(), []))
+
+    def by_severity(self, severity: str) -> List[str]:
+        """指定风险等级的模板ID"""
+        return list(self._current().severity_index.get(severity.lower(), []))
+
+    def path(self, template_id: str) -> Optional[str]:
+        """模板ID对应的相对路径"""
+        return self._current().paths.get(template_id)
+
+    def resolve(self, templates: List[str]) -> List[str]:
+        """
+        校验请求中的模板并转换为nuclei的 -t 参数
+
+        每一项可以是模板ID、相对模板目录的文件或目录路径（可省略.yaml后缀）或绝对路径，
+        模板ID转换为相对模板目录的路径（分布式模式下由各工作进程按本机的模板目录解析）。
+        存在无法识别的模板时抛出ValueError；模板目录不存在时无法校验，原样返回
+        """
+        snapshot = self._current()
+        if snapshot.signature is None:
+            return list(templates)
+        paths = snapshot.paths
+
+        template_dir = self.template_dir()
+        resolved = []
+        unknown = []
+        for template in templates:
+            if template in paths:
+                resolved.append(paths[template])
+                continue
+            candidate = os.path.join(template_dir, template)
+            if os.path.exists(candidate):
+                resolved.append(template)
+            elif os.path.exists(candidate + ".yaml"):
+                resolved.append(template + ".yaml")
+            else:
+                unknown.append(template)
+        if unknown:
+            raise ValueError(f"未知的模板: {', '.join(unknown)}")
+        return resolved
+
+
+# 创建全局模板索引实例
+template_index = TemplateIndex()
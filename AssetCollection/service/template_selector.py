@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+基于指纹的模板预选，先以技术识别模板识别目标指纹，再按指纹对应的标签为每组目标选择模板
+"""
+import logging
+import os
+import re
+import tempfile
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from config import current_config
+from service.scan_cache import finding_targets
+from service.target_normalizer import canonicalize
+from service.template_index import template_index
+
+logger = logging.getLogger(__name__)
+
+# 指纹识别阶段占分片进度的百分比
+FINGERPRINT_PROGRESS = 20
+
+# 不能作为预选依据的通用标签（识别阶段已执行或会匹配大量无关模板）
+GENERIC_TAGS = {"tech", "detect", "http", "network", "dns", "ssl", "misc", "generic", "panel", "login", "exposure"}
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+class ScanPass(NamedTuple):
+    """分片中的一次nuclei执行"""
+    target_file: str
+    # 模板参数（-t）、标签参数（-tags）、风险等级参数（-severity）
+    templates: Optional[List[str]]
+    tags: Optional[List[str]]
+    severity: Optional[List[str]]
+    # 本次执行在分片进度中的区间
+    progress_start: int
+    progress_end: int
+    # 是否为指纹识别阶段，该阶段的结果用于选择后续的模板
+    fingerprint: bool = False
+
+    def progress(self, percent: int) -> int:
+        """将本次执行的进度换算为分片进度"""
+        return self.progress_start + percent * (self.progress_end - self.progress_start) // 100
+
+
+class ScanPlan:
+    """单次执行计划，使用请求指定的模板（未指定时为全部模板）扫描分片的全部目标"""
+
+    def __init__(self, target_file: str, templates: Optional[List[str]]):
+        self.target_file = target_file
+        self.templates = templates
+
+    def __iter__(self) -> Iterator[ScanPass]:
+        yield ScanPass(self.target_file, self.templates, None, None, 0, 100)
+
+    def observe(self, result: Dict) -> None:
+        """接收指纹识别阶段的一条结果"""
+
+    def cleanup(self) -> None:
+        """清理计划生成的临时文件"""
+
+
+class FingerprintPlan(ScanPlan):
+    """
+    两阶段执行计划
+
+    第一阶段以 FINGERPRINT_TAGS 标签的模板（nuclei的技术识别模板）扫描全部目标，
+    第二阶段将识别到的指纹映射为模板索引中已有的nuclei标签，标签集合相同的目标合并为一次执行（-tags），
+    没有可用标签的目标使用 FINGERPRINT_FALLBACK_SEVERITY 等级的模板扫描。
+    执行次数超过 FINGERPRINT_MAX_PASSES 时，目标数最少的几组合并为一次执行。
+    """
+
+    def __init__(self, target_file: str, known_tags: Set[str]):
+        super().__init__(target_file, None)
+        self.known_tags = known_tags
+        # 目标 -> 识别到的指纹
+        self.fingerprints: Dict[str, Set[str]] = {}
+        self.temp_files: List[str] = []
+
+    def __iter__(self) -> Iterator[ScanPass]:
+        yield ScanPass(
+            self.target_file, None, list(current_config.FINGERPRINT_TAGS), None,
+            0, FINGERPRINT_PROGRESS, fingerprint=True
+        )
+
+        # 识别阶段结束后再分组
+        groups, fallback_file, fallback_count = self._group()
+        total = sum(len(targets) for _, targets in groups) + fallback_count
+        start = FINGERPRINT_PROGRESS
+        done = 0
+        for tags, targets in groups:
+            path = self._write_targets(targets)
+            end = FINGERPRINT_PROGRESS + (done + len(targets)) * (100 - FINGERPRINT_PROGRESS) // total
+            yield ScanPass(path, None, sorted(tags), None, start, end)
+            done += len(targets)
+            start = end
+        if fallback_count:
+            yield ScanPass(
+                fallback_file, None, None, list(current_config.FINGERPRINT_FALLBACK_SEVERITY), start, 100
+            )
+
+    def observe(self, result: Dict) -> None:
+        words = set()
+        for key in ("matcher-name", "template-id"):
+            if result.get(key):
+                words.add(str(result[key]).lower())
+        tags = (result.get("info") or {}).get("tags")
+        if isinstance(tags, str):
+            tags = tags.split(",")
+        for tag in tags or []:
+            words.add(str(tag).strip().lower())
+        if not words:
+            return
+        for key in self._result_keys(result):
+            self.fingerprints.setdefault(key, set()).update(words)
+
+    @staticmethod
+    def _result_keys(result: Dict) -> List[str]:
+        """结果可能对应的目标，URL形式的候选同时尝试主机和主机:端口形式"""
+        keys = []
+        for candidate in finding_targets(result):
+            keys.append(candidate)
+            if "://" in candidate:
+                parts = urlsplit(candidate)
+                if parts.hostname:
+                    keys.append(canonicalize(parts.hostname))
+                    if parts.port:
+                        keys.append(canonicalize(f"{parts.hostname}:{parts.port}"))
+        return keys
+
+    def tags_for(self, fingerprints: Set[str]) -> Set[str]:
+        """将指纹映射为已知的nuclei标签，指纹按非字母数字字符拆分后逐个匹配"""
+        tags = set()
+        for word in fingerprints:
+            for token in [word] + _TOKEN_SPLIT.split(word):
+                if token and token in self.known_tags and token not in GENERIC_TAGS:
+                    tags.add(token)
+        return tags
+
+    def _group(self) -> Tuple[List[Tuple[Set[str], List[str]]], str, int]:
+        """
+        按标签集合对目标分组，没有标签的目标直接写入回退目标文件
+
+        返回:
+            ([(标签集合, 目标列表)], 回退目标文件, 回退目标数)
+        """
+        groups: Dict[frozenset, List[str]] = {}
+        fallback_count = 0
+        fd, fallback_file = tempfile.mkstemp(dir=current_config.TEMP_DIR, suffix=".txt")
+        self.temp_files.append(fallback_file)
+        with os.fdopen(fd, 'w', encoding='utf-8') as fallback:
+            with open(self.target_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    target = line.strip()
+                    if not target:
+                        continue
+                    tags = self.tags_for(self.fingerprints.get(target, set()))
+                    if tags:
+                        groups.setdefault(frozenset(tags), []).append(target)
+                    else:
+                        fallback.write(target + '\n')
+                        fallback_count += 1
+
+        ordered = sorted(groups.items(), key=lambda item: len(item[1]), reverse=True)
+        limit = max(1, current_config.FINGERPRINT_MAX_PASSES - (1 if fallback_count else 0))
+        merged = [(set(tags), targets) for tags, targets in ordered[:limit - 1]]
+        rest = ordered[limit - 1:]
+        if len(rest) == 1:
+            merged.append((set(rest[0][0]), rest[0][1]))
+        elif rest:
+            # 合并目标数最少的几组，合并后的目标使用各组标签的并集
+            merged.append((
+                set().union(*(tags for tags, _ in rest)),
+                [target for _, targets in rest for target in targets]
+            ))
+        return merged, fallback_file, fallback_count
+
+    def _write_targets(self, targets: List[str]) -> str:
+        fd, path = tempfile.mkstemp(dir=current_config.TEMP_DIR, suffix=".txt")
+        self.temp_files.append(path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for target in targets:
+                f.write(target + '\n')
+        return path
+
+    def cleanup(self) -> None:
+        for path in self.temp_files:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def create_plan(target_file: str, templates: Optional[List[str]], fingerprint: bool) -> ScanPlan:
+    """创建分片的执行计划，指定了模板时不进行指纹预选"""
+    if not fingerprint or templates:
+        return ScanPlan(target_file, templates)
+    known_tags = template_index.tags()
+    if not known_tags:
+        logger.warning("未找到模板目录 %s，指纹识别后全部目标使用等级过滤的模板扫描", template_index.template_dir())
+    return FingerprintPlan(target_file, known_tags)
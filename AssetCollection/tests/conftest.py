@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：将AssetCollection目录和仓库根目录加入导入路径，并将服务的存储目录指向临时目录
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 未安装easm_common包时直接从仓库根目录导入
+sys.path.append(os.path.dirname(ROOT))
+
+from config import current_config  # noqa: E402
+
+# 模拟nuclei的测试程序，输出由环境变量控制（见benchmark/fake_nuclei.py）
+FAKE_NUCLEI = os.path.join(ROOT, "benchmark", "fake_nuclei.py")
+
+
+@pytest.fixture
+def fake_nuclei_path():
+    """模拟nuclei的测试程序路径，可直接作为 NUCLEI_PATH 使用"""
+    return FAKE_NUCLEI
+
+
+@pytest.fixture
+def fake_nuclei():
+    """生成以模拟nuclei扫描目标文件的命令"""
+    return lambda target_file: [sys.executable, FAKE_NUCLEI, "-l", target_file]
+
+
+@pytest.fixture
+def temp_dirs(tmp_path, monkeypatch):
+    """将结果目录和临时目录指向本次测试的临时目录"""
+    monkeypatch.setattr(current_config, "RESULTS_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(current_config, "TEMP_DIR", str(tmp_path / "temp"))
+    os.makedirs(current_config.RESULTS_DIR)
+    os.makedirs(current_config.TEMP_DIR)
+    return tmp_path
+
+
+@pytest.fixture
+def scanner_config(temp_dirs, monkeypatch):
+    """将扫描器使用的全部文件指向临时目录，任务存储使用内存存储"""
+    results = current_config.RESULTS_DIR
+    monkeypatch.setattr(current_config, "JOB_STORE", "memory")
+    monkeypatch.setattr(current_config, "SCAN_CACHE_PATH", os.path.join(results, "scan_cache.db"))
+    monkeypatch.setattr(current_config, "EXPORT_CACHE_DIR", os.path.join(results, "exports"))
+    monkeypatch.setattr(current_config, "TEMPLATE_INDEX_PATH", os.path.join(results, "template_index.bin"))
+    monkeypatch.setattr(current_config, "QUEUE_PATH", os.path.join(results, "queue.db"))
+    return temp_dirs
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+分布式模式下API节点处理工作进程回传的事件：旧租约的事件被忽略，重新扫描时相同结果不重复写入
+"""
+import json
+import time
+
+import pytest
+
+from config import current_config
+from model.asset_model import Target
+
+
+@pytest.fixture
+def scanner(scanner_config, monkeypatch):
+    monkeypatch.setattr(current_config, "SCAN_MODE", "distributed")
+    monkeypatch.setattr(current_config, "QUEUE_BACKEND", "sqlite")
+    monkeypatch.setattr(current_config, "API_NODE_ID", "api-test")
+    monkeypatch.setattr(current_config, "WORKER_POLL_INTERVAL", 0.01)
+    # 导入时创建的全局扫描器也使用临时目录
+    from service.nuclei_scanner import NucleiScanner
+    return NucleiScanner()
+
+
+def finding(name):
+    return json.dumps({"template-id": name, "host": "example.com", "matched-at": f"http://example.com/{name}"})
+
+
+def wait_finished(scanner, scan_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = scanner.get_scan_status(scan_id)
+        if status.status in ("completed", "failed"):
+            return status
+        assert time.monotonic() < deadline, "等待扫描结束超时"
+        time.sleep(0.02)
+
+
+def events(scan_id, attempt, *items):
+    """生成一个分片的事件，items为(类型, 字段)"""
+    return [dict(fields, type=event_type, scan_id=scan_id, shard_index=0, attempt=attempt)
+            for event_type, fields in items]
+
+
+def test_release_after_crash_does_not_duplicate_findings(scanner):
+    scan_id = scanner.start_scan([Target(domain="example.com")])
+    task = scanner.queue.lease("w1", 60)
+    assert task.payload["owner"] == "api-test"
+
+    # 第一个工作进程回传了两条结果后失联，分片被重新租用
+    scanner.queue.push_events("api-test", events(
+        scan_id, 1, ("start", {"queue_wait": 0.1}),
+        ("finding", {"line": finding("a")}), ("finding", {"line": finding("b")})
+    ))
+    scanner.queue.push_events("api-test", events(
+        scan_id, 2, ("start", {"queue_wait": 0.2}),
+        ("finding", {"line": finding("a")}), ("finding", {"line": finding("b")}),
+        ("finding", {"line": finding("c")})
+    ))
+    # 旧租约之后回传的事件被忽略
+    scanner.queue.push_events("api-test", events(
+        scan_id, 1, ("finding", {"line": finding("stale")}), ("finish", {"status": "failed", "error": "lost"})
+    ))
+    scanner.queue.push_events("api-test", events(
+        scan_id, 2, ("finish", {"status": "completed", "error": None})
+    ))
+
+    status = wait_finished(scanner, scan_id)
+    assert status.status == "completed"
+    page = scanner.query_scan_results(scan_id)
+    assert [item["template-id"] for item in page.items] == ["a", "b", "c"]
+    assert page.complete
+
+
+def test_repeated_finding_within_one_lease_is_kept(scanner):
+    scan_id = scanner.start_scan([Target(domain="example.com")])
+    scanner.queue.push_events("api-test", events(
+        scan_id, 1, ("start", {"queue_wait": 0}),
+        ("finding", {"line": finding("a")}), ("finding", {"line": finding("a")}),
+        ("finish", {"status": "completed", "error": None})
+    ))
+    wait_finished(scanner, scan_id)
+    assert scanner.query_scan_results(scan_id).count == 2
+
+
+def test_failed_event_fails_the_shard(scanner, monkeypatch):
+    scan_id = scanner.start_scan([Target(domain="example.com")])
+
+    def broken(*args):
+        raise RuntimeError("磁盘已满")
+
+    monkeypatch.setattr(scanner, "_handle_output_line", broken)
+    scanner.queue.push_events("api-test", events(
+        scan_id, 1, ("start", {"queue_wait": 0}),
+        ("finding", {"line": finding("a")}),
+        ("finish", {"status": "completed", "error": None})
+    ))
+    status = wait_finished(scanner, scan_id)
+    assert status.status == "failed"
+    assert "磁盘已满" in status.error
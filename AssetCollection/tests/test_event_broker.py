@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+扫描事件分发：跨线程发布、按扫描区分订阅者、慢订阅者丢弃事件
+"""
+import asyncio
+import threading
+
+from service.event_broker import EventBroker
+
+
+def test_events_reach_subscribers_of_the_scan():
+    broker = EventBroker()
+
+    async def main():
+        first = broker.subscribe("a")
+        second = broker.subscribe("a")
+        other = broker.subscribe("b")
+        assert broker.subscriber_count("a") == 2 and broker.subscriber_count() == 3
+
+        # 扫描线程发布事件
+        thread = threading.Thread(target=broker.publish, args=("a", "finding", {"n": 1}, 7))
+        thread.start()
+        thread.join()
+
+        expected = {"event": "finding", "data": {"n": 1}, "id": 7}
+        assert await first.get(1) == expected
+        assert await second.get(1) == expected
+        assert other.queue.empty()
+
+        broker.unsubscribe(first)
+        broker.unsubscribe(second)
+        broker.unsubscribe(second)
+        assert broker.subscriber_count("a") == 0
+        broker.publish("a", "status", {})
+        await asyncio.sleep(0)
+        assert first.queue.empty()
+
+    asyncio.run(main())
+
+
+def test_slow_subscriber_drops_events():
+    broker = EventBroker(max_queue_size=2)
+
+    async def main():
+        subscription = broker.subscribe("a")
+        for n in range(5):
+            broker.publish("a", "finding", n)
+        await asyncio.sleep(0.01)
+        assert [(await subscription.get(1))["data"] for _ in range(2)] == [0, 1]
+        assert subscription.dropped == 3
+
+    asyncio.run(main())
+
+
+def test_publish_without_subscribers_is_noop():
+    broker = EventBroker()
+    broker.publish("missing", "status", {})
+    assert broker.subscriber_count() == 0
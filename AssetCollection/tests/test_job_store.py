@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+任务存储：任务状态读写、结果分页查询、批量写入失败重试
+"""
+import uuid
+from datetime import datetime
+
+import pytest
+
+from service.job_store import MemoryJobStore, SQLiteJobStore
+from service.result_blocks import BLOCK_RECORDS
+
+SEVERITIES = ["info", "low", "medium", "high", "critical"]
+
+# 跨越多个压缩块，并留下一个不满的块
+COUNT = BLOCK_RECORDS * 2 + 37
+
+
+def make_result(n):
+    return {
+        "template-id": f"template-{n % 5}",
+        "host": f"host{n % 4}.example.com",
+        "type": "http",
+        "info": {"severity": SEVERITIES[n % len(SEVERITIES)]},
+        "n": n,
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobStore(str(tmp_path))
+    return SQLiteJobStore(str(tmp_path / "jobs.db"), batch_size=50, flush_interval=0.01)
+
+
+def new_scan(store, count=COUNT):
+    """创建一个扫描并写入count条结果，扫描id每次不同，避免共用结果缓存"""
+    scan_id = uuid.uuid4().hex
+    store.create_job(scan_id, {"status": "running", "completed": 0, "total": count,
+                               "start_time": datetime(2024, 1, 1)})
+    for n in range(count):
+        store.add_finding(scan_id, n, make_result(n))
+    return scan_id
+
+
+def collect(store, scan_id, filters, limit):
+    """按游标翻完全部页，返回结果编号"""
+    numbers, cursor = [], 0
+    while cursor is not None:
+        items, cursor = store.query_findings(scan_id, filters, cursor, limit)
+        assert len(items) <= limit
+        numbers.extend(item["n"] for item in items)
+    return numbers
+
+
+def test_job_fields_round_trip(store):
+    scan_id = new_scan(store, 0)
+    store.update_job(scan_id, {"progress": 50, "shards": [{"index": 0, "status": "running"}]})
+    assert store.finalize_job(scan_id, {"status": "completed", "partial": False,
+                                        "end_time": datetime(2024, 1, 2)}) is None
+    job = store.get_job(scan_id)
+    assert job["status"] == "completed"
+    assert job["progress"] == 50
+    assert job["shards"] == [{"index": 0, "status": "running"}]
+    assert job["start_time"] == datetime(2024, 1, 1)
+    assert job["end_time"] == datetime(2024, 1, 2)
+    assert job["partial"] is False
+    assert store.get_job("missing") is None
+
+
+@pytest.mark.parametrize("filters", [{}, {"severity": "high"}, {"host": "host1.example.com", "template_id": "template-3"}])
+def test_query_pages_after_finalize(store, filters):
+    scan_id = new_scan(store)
+    assert store.finalize_job(scan_id, {"status": "completed"}) is None
+    expected = [n for n in range(COUNT) if all(
+        {"severity": SEVERITIES[n % 5], "host": f"host{n % 4}.example.com",
+         "template_id": f"template-{n % 5}"}[field] == value for field, value in filters.items()
+    )]
+    assert collect(store, scan_id, filters, 100) == expected
+    assert collect(store, scan_id, filters, 7) == expected
+
+
+def test_iter_findings_in_order(store):
+    scan_id = new_scan(store)
+    store.finalize_job(scan_id, {"status": "completed"})
+    assert [item["n"] for item in store.iter_findings(scan_id)] == list(range(COUNT))
+    assert list(store.iter_findings("missing")) == []
+
+
+def test_query_while_running(store):
+    scan_id = new_scan(store)
+    if isinstance(store, SQLiteJobStore):
+        store.flush()
+    assert collect(store, scan_id, {}, 100) == list(range(COUNT))
+    store.add_finding(scan_id, COUNT, make_result(COUNT))
+    store.finalize_job(scan_id, {"status": "completed"})
+    assert collect(store, scan_id, {}, 100) == list(range(COUNT + 1))
+
+
+@pytest.mark.parametrize("filters", [{}, {"severity": "high"}])
+def test_live_query_resumes_from_end(store, filters):
+    scan_id = new_scan(store)
+    if isinstance(store, SQLiteJobStore):
+        store.flush()
+    numbers, cursor = [], 0
+    while True:
+        items, cursor = store.query_findings(scan_id, filters, cursor, 100, live=True)
+        numbers.extend(item["n"] for item in items)
+        if not items:
+            break
+    assert cursor == COUNT
+    assert store.query_findings(scan_id, filters, cursor, 100, live=True) == ([], COUNT)
+
+    # 从读到末尾时返回的游标继续轮询，只读到之后写入的结果
+    for n in range(COUNT, COUNT + 5):
+        store.add_finding(scan_id, n, make_result(n))
+    store.finalize_job(scan_id, {"status": "completed"})
+    items, cursor = store.query_findings(scan_id, filters, COUNT, 100)
+    numbers.extend(item["n"] for item in items)
+    assert cursor is None
+    assert numbers == collect(store, scan_id, filters, 100)
+
+
+def test_raw_line_is_stored_verbatim(store):
+    scan_id = new_scan(store, 0)
+    store.add_finding(scan_id, 0, {"n": 0}, raw='{"n": 0, "extra": "原文"}')
+    store.finalize_job(scan_id, {"status": "completed"})
+    assert store.query_findings(scan_id, {}, 0, 10) == ([{"n": 0, "extra": "原文"}], None)
+
+
+def test_recover_interrupted(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = SQLiteJobStore(path, flush_interval=0.01)
+    running = new_scan(store, 1)
+    store.update_job(running, {"completed": 1})
+    done = new_scan(store, 0)
+    store.finalize_job(done, {"status": "completed"})
+    store.flush()
+
+    restarted = SQLiteJobStore(path, flush_interval=0.01)
+    assert restarted.recover_interrupted() == 1
+    job = restarted.get_job(running)
+    assert job["status"] == "failed"
+    assert job["partial"] is True
+    assert job["end_time"] is not None
+    assert restarted.get_job(done)["status"] == "completed"
+
+
+def failing_apply(store, monkeypatch, should_fail):
+    """让写线程的批量写入按条件失败"""
+    apply = store._apply
+
+    def wrapper(batch):
+        if should_fail(batch):
+            raise RuntimeError("disk I/O error")
+        apply(batch)
+
+    monkeypatch.setattr(store, "RETRY_INTERVAL", 0)
+    monkeypatch.setattr(store, "_apply", wrapper)
+
+
+def test_failed_batch_is_retried(tmp_path, monkeypatch):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"), batch_size=BLOCK_RECORDS * 4, flush_interval=0.01)
+    calls = []
+    failing_apply(store, monkeypatch, lambda batch: not calls.append(batch) and len(calls) == 2)
+    scan_id = new_scan(store)
+    assert store.finalize_job(scan_id, {"status": "completed"}) is None
+    assert store.get_job(scan_id)["status"] == "completed"
+    # 重试前恢复了未写齐的块，所有结果都能读出
+    assert collect(store, scan_id, {}, 100) == list(range(COUNT))
+
+
+def test_dropped_batch_fails_the_job(tmp_path, monkeypatch, caplog):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"), flush_interval=0.01, write_retries=2)
+    attempts = []
+
+    def should_fail(batch):
+        if any(op == "finding" for op, _, _ in batch):
+            attempts.append(batch)
+            return True
+        return False
+
+    failing_apply(store, monkeypatch, should_fail)
+    scan_id = new_scan(store, 0)
+    store.flush()
+    for n in range(10):
+        store.add_finding(scan_id, n, make_result(n))
+    store.flush()
+    assert len(attempts) == 3
+    assert "重试后仍失败" in caplog.text and scan_id in caplog.text
+
+    error = store.finalize_job(scan_id, {"status": "completed"})
+    assert "disk I/O error" in error
+    job = store.get_job(scan_id)
+    assert job["status"] == "failed"
+    assert job["error"] == error
+    assert job["partial"] is True
+    assert store.query_findings(scan_id, {}, 0, 10) == ([], None)
+
+
+def test_finished_scan_is_kept_only_as_blocks(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"), flush_interval=0.01)
+    scan_id = new_scan(store)
+    store.flush()
+    conn = store._reader()
+    assert conn.execute("SELECT COUNT(*) FROM findings WHERE scan_id = ?", (scan_id,)).fetchone()[0] == COUNT
+
+    assert store.finalize_job(scan_id, {"status": "completed"}) is None
+    assert conn.execute("SELECT COUNT(*) FROM findings WHERE scan_id = ?", (scan_id,)).fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM finding_blocks WHERE scan_id = ?", (scan_id,)).fetchone()[0] == 3
+    assert collect(store, scan_id, {"severity": "high"}, 50) == [n for n in range(COUNT) if n % 5 == 3]
+    assert [item["n"] for item in store.iter_findings(scan_id)] == list(range(COUNT))
+
+    # 重启后从结果索引读取
+    restarted = SQLiteJobStore(str(tmp_path / "jobs.db"), flush_interval=0.01)
+    assert collect(restarted, scan_id, {"host": "host2.example.com"}, 100) == list(range(2, COUNT, 4))
+
+
+def test_scan_with_gaps_keeps_its_rows(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"), flush_interval=0.01)
+    scan_id = new_scan(store, 0)
+    for n in (0, 1, 3):
+        store.add_finding(scan_id, n, make_result(n))
+    assert store.finalize_job(scan_id, {"status": "completed"}) is None
+    conn = store._reader()
+    assert conn.execute("SELECT COUNT(*) FROM findings WHERE scan_id = ?", (scan_id,)).fetchone()[0] == 3
+    assert collect(store, scan_id, {}, 2) == [0, 1, 3]
+    assert [item["n"] for item in store.iter_findings(scan_id)] == [0, 1, 3]
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+nuclei输出的逐行处理：统计信息解析、线程引擎和asyncio引擎的流式读取、超时
+"""
+import asyncio
+import json
+
+import pytest
+
+from service.nuclei_process import (
+    NucleiRun, failure_message, parse_stats_percent, run_nuclei, run_nuclei_async,
+    start_nuclei, start_nuclei_async, write_target_file
+)
+
+
+@pytest.fixture
+def target_file(temp_dirs):
+    return write_target_file(f"host{i}.example.com" for i in range(4))
+
+
+@pytest.mark.parametrize("line, percent", [
+    ('{"percent": "42"}', 42),
+    ('{"percent": 12.7, "requests": "10"}', 12),
+    ('{"percent": "100"}', 99),
+    ('{"percent": "-3"}', 0),
+    ('{"percent": "abc"}', None),
+    ('{"requests": "10"}', None),
+    ('[WRN] not stats', None),
+    ('{broken', None),
+])
+def test_parse_stats_percent(line, percent):
+    assert parse_stats_percent(line) == percent
+
+
+def test_failure_message():
+    assert failure_message(NucleiRun(0, False, []), 10) is None
+    assert "超时" in failure_message(NucleiRun(None, True, []), 10)
+    assert "返回码: 2" in failure_message(NucleiRun(2, False, ["boom"]), 10)
+    assert "(无错误输出)" in failure_message(NucleiRun(1, False, []), 10)
+
+
+def test_write_target_file(target_file):
+    with open(target_file, encoding="utf-8") as f:
+        assert f.read().splitlines() == [f"host{i}.example.com" for i in range(4)]
+
+
+def test_run_nuclei_streams_lines_before_exit(target_file, fake_nuclei, monkeypatch):
+    monkeypatch.setenv("FAKE_FINDINGS", "3")
+    monkeypatch.setenv("FAKE_DELAY", "0.02")
+    process = start_nuclei(fake_nuclei(target_file))
+    lines, running, progress = [], [], []
+
+    def on_output(line):
+        lines.append(json.loads(line))
+        running.append(process.poll() is None)
+
+    run = run_nuclei(process, 30, on_output, progress.append)
+    assert run.returncode == 0 and not run.timed_out
+    assert len(lines) == 12
+    # 第一条结果在进程结束前就已处理，而不是等输出全部缓冲后再处理
+    assert running[0]
+    assert progress and progress == sorted(progress) and progress[-1] == 99
+
+
+def test_run_nuclei_timeout_keeps_earlier_lines(target_file, fake_nuclei, monkeypatch):
+    monkeypatch.setenv("FAKE_FINDINGS", "2")
+    monkeypatch.setenv("FAKE_FAILURE", "hang")
+    lines = []
+    run = run_nuclei(start_nuclei(fake_nuclei(target_file)), 1, lines.append, lambda percent: None)
+    assert run.timed_out
+    assert len(lines) == 4
+    assert "超时" in failure_message(run, 1)
+
+
+def test_run_nuclei_async_preserves_order(target_file, fake_nuclei, monkeypatch):
+    monkeypatch.setenv("FAKE_FINDINGS", "50")
+    monkeypatch.setenv("FAKE_FAILURE", "garbage")
+    lines, progress = [], []
+
+    async def scan():
+        process = await start_nuclei_async(fake_nuclei(target_file))
+        return await run_nuclei_async(process, 30, lines.append, progress.append)
+
+    run = asyncio.run(scan())
+    assert run.returncode == 0
+    findings = [json.loads(line) for line in lines if line.startswith("{")]
+    assert len(findings) == 200
+    assert [finding["matched-at"] for finding in findings[:3]] == [
+        "host0.example.com/path-0", "host0.example.com/path-1", "host0.example.com/path-2"
+    ]
+    assert progress[-1] == 99
+
+
+def test_run_nuclei_async_raises_handler_error(target_file, fake_nuclei, monkeypatch):
+    monkeypatch.setenv("FAKE_FINDINGS", "5")
+
+    def on_output(line):
+        raise RuntimeError("store unavailable")
+
+    async def scan():
+        process = await start_nuclei_async(fake_nuclei(target_file))
+        return await run_nuclei_async(process, 30, on_output, lambda percent: None)
+
+    with pytest.raises(RuntimeError, match="store unavailable"):
+        asyncio.run(scan())
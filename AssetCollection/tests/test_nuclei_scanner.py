@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+本地扫描：线程引擎和asyncio引擎执行分片、合并结果和状态快照
+"""
+import time
+
+import pytest
+
+from config import current_config
+from model.asset_model import Target
+
+
+@pytest.fixture(params=["thread", "asyncio"])
+def scanner(request, scanner_config, fake_nuclei_path, monkeypatch):
+    monkeypatch.setattr(current_config, "SCAN_MODE", "local")
+    monkeypatch.setattr(current_config, "SCAN_ENGINE", request.param)
+    monkeypatch.setattr(current_config, "NUCLEI_PATH", fake_nuclei_path)
+    monkeypatch.setattr(current_config, "STATS_INTERVAL", 1)
+    monkeypatch.setenv("FAKE_FINDINGS", "2")
+    from service.nuclei_scanner import NucleiScanner
+    return NucleiScanner()
+
+
+def wait_finished(scanner, scan_id, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = scanner.get_scan_status(scan_id)
+        if status.status in ("completed", "failed"):
+            return status
+        assert time.monotonic() < deadline, "等待扫描结束超时"
+        time.sleep(0.05)
+
+
+def targets(count):
+    return [Target(domain=f"host{n}.example.com") for n in range(count)]
+
+
+def test_sharded_scan_merges_results(scanner):
+    scan_id = scanner.start_scan(targets(5), shards=2)
+    status = wait_finished(scanner, scan_id)
+    assert status.status == "completed"
+    assert status.progress == 100
+    assert [shard.status for shard in status.shards] == ["completed", "completed"]
+    assert sum(shard.total for shard in status.shards) == 5
+
+    page = scanner.query_scan_results(scan_id, limit=100)
+    assert page.count == 10 and page.complete
+    assert len({item["host"] for item in page.items}) == 5
+    # 结束后的任务从任务存储中读取
+    assert scan_id not in scanner.scan_jobs
+
+
+def test_failed_nuclei_fails_the_scan(scanner, monkeypatch):
+    monkeypatch.setenv("FAKE_FAILURE", "exit")
+    monkeypatch.setenv("FAKE_EXIT_CODE", "2")
+    scan_id = scanner.start_scan(targets(2))
+    status = wait_finished(scanner, scan_id)
+    assert status.status == "failed"
+    assert status.error
+    # 失败前已输出的结果保留
+    assert status.partial
+    assert scanner.query_scan_results(scan_id).count == 4
+
+
+def test_missing_nuclei_is_reported(scanner, monkeypatch):
+    monkeypatch.setattr(current_config, "NUCLEI_PATH", "/nonexistent/nuclei")
+    scan_id = scanner.start_scan(targets(1))
+    status = wait_finished(scanner, scan_id)
+    assert status.status == "failed"
+    assert "/nonexistent/nuclei" in status.error
+
+
+def test_status_is_readable_while_job_lock_is_held(scanner, monkeypatch):
+    monkeypatch.setenv("FAKE_DELAY", "0.05")
+    scan_id = scanner.start_scan(targets(3))
+    job = scanner.scan_jobs[scan_id]
+    # 状态查询读取已发布的快照，不等待任务锁
+    with job.lock:
+        status = scanner.get_scan_status(scan_id)
+    assert status.status in ("pending", "running")
+    assert wait_finished(scanner, scan_id).status == "completed"
+
+
+def test_unknown_scan(scanner):
+    assert scanner.get_scan_status("missing") is None
+    assert scanner.query_scan_results("missing") is None
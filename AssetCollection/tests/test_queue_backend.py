@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+分布式任务队列：任务租用、续租和过期重租，以及按API节点区分的事件通道
+"""
+import time
+
+import pytest
+
+from config import current_config
+from service.queue_backend import RedisQueueBackend, SQLiteQueueBackend
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        return SQLiteQueueBackend(str(tmp_path / "queue.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr("redis.Redis.from_url", lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+    return RedisQueueBackend("redis://test")
+
+
+def test_lease_is_exclusive(backend):
+    backend.enqueue("a", {"n": 1})
+    backend.enqueue("b", {"n": 2})
+    assert backend.queue_depth() == 2
+
+    first = backend.lease("w1", 60)
+    second = backend.lease("w2", 60)
+    assert {first.task_id, second.task_id} == {"a", "b"}
+    assert {first.task_id: first.payload, second.task_id: second.payload} == {"a": {"n": 1}, "b": {"n": 2}}
+    assert first.attempt == second.attempt == 1
+    assert first.enqueued_at > 0
+    # 租约有效期内不会被其他工作进程租用
+    assert backend.lease("w3", 60) is None
+    assert backend.queue_depth() == 0
+
+
+def test_heartbeat_only_renews_own_lease(backend):
+    backend.enqueue("a", {})
+    task = backend.lease("w1", 60)
+    assert backend.heartbeat(task.task_id, "w1", 60)
+    assert not backend.heartbeat(task.task_id, "w2", 60)
+    assert not backend.heartbeat("missing", "w1", 60)
+
+
+def test_heartbeat_keeps_lease_alive(backend):
+    backend.enqueue("a", {})
+    backend.lease("w1", 0.3)
+    for _ in range(3):
+        time.sleep(0.15)
+        assert backend.heartbeat("a", "w1", 0.3)
+    assert backend.lease("w2", 60) is None
+
+
+def test_expired_lease_is_requeued(backend):
+    backend.enqueue("a", {"n": 1})
+    assert backend.lease("w1", 0.1).attempt == 1
+    time.sleep(0.2)
+
+    task = backend.lease("w2", 60)
+    assert (task.task_id, task.payload, task.attempt) == ("a", {"n": 1}, 2)
+    # 原工作进程的租约已失效，不能续租，也不能删除任务
+    assert not backend.heartbeat("a", "w1", 60)
+    backend.complete("a", "w1")
+    assert backend.heartbeat("a", "w2", 60)
+
+    backend.complete("a", "w2")
+    assert backend.lease("w3", 60) is None
+    assert backend.queue_depth() == 0
+
+
+def test_event_channels_are_separate_per_api_node(backend):
+    backend.push_events("api-1", [{"n": 1}, {"n": 2}])
+    backend.push_events("api-2", [{"n": 3}])
+    backend.push_events("api-1", [{"n": 4}])
+
+    events, token = backend.pull_events("api-1", 10)
+    assert events == [{"n": 1}, {"n": 2}, {"n": 4}]
+    backend.ack_events("api-1", token)
+    # 确认本节点的事件不影响其他节点的事件
+    assert backend.pull_events("api-1", 10)[0] == []
+    events, token = backend.pull_events("api-2", 10)
+    assert events == [{"n": 3}]
+
+
+def test_events_are_pulled_in_order_and_acked_in_batches(backend):
+    backend.push_events("api", [{"n": n} for n in range(5)])
+    events, token = backend.pull_events("api", 2)
+    assert events == [{"n": 0}, {"n": 1}]
+    # 未确认的事件再次读取时仍然返回
+    assert backend.pull_events("api", 2)[0] == events
+    backend.ack_events("api", token)
+    backend.push_events("api", [{"n": 5}])
+    events, token = backend.pull_events("api", 10)
+    assert events == [{"n": n} for n in range(2, 6)]
+    backend.ack_events("api", token)
+    assert backend.pull_events("api", 10)[0] == []
+
+
+def test_sqlite_drops_events_of_departed_nodes(tmp_path, monkeypatch):
+    backend = SQLiteQueueBackend(str(tmp_path / "queue.db"))
+    backend.push_events("gone", [{"n": 1}])
+    backend.push_events("api", [{"n": 2}])
+    backend.ack_events("api", backend.pull_events("api", 10)[1])
+    assert backend.pull_events("gone", 10)[0] == [{"n": 1}]
+
+    # 超过保留时长后，无人消费的事件在其他节点确认事件时删除
+    monkeypatch.setattr(current_config, "WORKER_EVENT_TTL", -1)
+    backend.push_events("api", [{"n": 3}])
+    backend.ack_events("api", backend.pull_events("api", 10)[1])
+    assert backend.pull_events("gone", 10)[0] == []
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+nuclei资源调控：份额计算和参数换算
+"""
+import pytest
+
+from config import current_config
+from service.resource_governor import ResourceGovernor
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    monkeypatch.setattr(current_config, "NUCLEI_RATE_LIMIT_TOTAL", 500)
+    monkeypatch.setattr(current_config, "NUCLEI_CONCURRENCY_TOTAL", 100)
+    monkeypatch.setattr(current_config, "NUCLEI_BULK_SIZE_TOTAL", 100)
+    governor = ResourceGovernor(5)
+    governor.scale = 1.0
+    return governor
+
+
+def test_lone_process_gets_full_budget(governor):
+    allocation = governor.acquire("a", 1)
+    assert allocation.share == 1.0
+    assert (allocation.concurrency, allocation.bulk_size, allocation.rate_limit) == (100, 100, 500)
+
+
+def test_queued_processes_split_evenly(governor):
+    shares = [governor.acquire(key, 4).share for key in "abcd"]
+    assert shares == [0.25] * 4
+    assert sum(governor.allocations.values()) == pytest.approx(1.0)
+
+
+def test_later_process_splits_with_running_set(governor):
+    assert governor.acquire("a", 1).share == 1.0
+    # 先启动的进程无法缩减份额，之后启动的进程按运行数平分，而不是只分得剩余的预算
+    assert governor.acquire("b", 1).share == 0.5
+    assert governor.acquire("c", 1).share == pytest.approx(1 / 3)
+    governor.release("a")
+    governor.release("b")
+    assert governor.acquire("d", 1).share == 0.5
+
+
+def test_demand_is_capped_by_slots(governor):
+    assert governor.acquire("a", 50).share == pytest.approx(0.2)
+
+
+def test_cpu_scale_reduces_new_shares(governor):
+    governor.scale = 0.5
+    allocation = governor.acquire("a", 2)
+    assert allocation.share == 0.25
+    assert allocation.rate_limit == 125
+
+
+def test_parameters_are_at_least_one(governor, monkeypatch):
+    monkeypatch.setattr(current_config, "NUCLEI_BULK_SIZE_TOTAL", 2)
+    allocation = governor.acquire("a", 5)
+    assert allocation.bulk_size == 1
+
+
+def test_release_is_idempotent(governor):
+    governor.acquire("a", 1)
+    governor.release("a")
+    governor.release("a")
+    assert governor.allocations == {}
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+结果压缩块格式和按字节数限制的LRU块缓存
+"""
+import json
+
+from service.result_blocks import BLOCK_RECORDS, BlockCache, block_of, block_size, decode_block, encode_block
+
+
+def test_block_of():
+    assert block_of(0) == 0
+    assert block_of(BLOCK_RECORDS - 1) == 0
+    assert block_of(BLOCK_RECORDS) == 1
+    assert block_of(BLOCK_RECORDS * 3 + 5) == 3
+
+
+def test_encode_decode_round_trip():
+    lines = [json.dumps({"n": n, "host": "example.com", "info": {"name": "测试"}}, ensure_ascii=False)
+             for n in range(BLOCK_RECORDS)]
+    data = encode_block(lines)
+    assert decode_block(data) == lines
+    # 重复度高的结果压缩后明显变小
+    assert len(data) * 4 < len("\n".join(lines).encode("utf-8"))
+    assert decode_block(encode_block(["{}"])) == ["{}"]
+
+
+def test_block_size_grows_with_content():
+    assert block_size(["a" * 1000]) > block_size(["a"]) > block_size([])
+
+
+def test_get_and_replace():
+    cache = BlockCache(100)
+    assert cache.get(("scan", 0)) is None
+    cache.put(("scan", 0), "first", 10)
+    cache.put(("scan", 0), "second", 30)
+    assert cache.get(("scan", 0)) == "second"
+    assert cache.size == 30
+    assert len(cache.items) == 1
+
+
+def test_least_recently_used_is_evicted_by_bytes():
+    cache = BlockCache(100)
+    cache.put(("scan", 0), 0, 40)
+    cache.put(("scan", 1), 1, 40)
+    cache.get(("scan", 0))  # 最近使用，保留
+    cache.put(("scan", 2), 2, 40)
+    assert cache.get(("scan", 1)) is None
+    assert cache.get(("scan", 0)) == 0
+    assert cache.get(("scan", 2)) == 2
+    assert cache.size == 80
+
+    # 一个大的缓存项可以淘汰多个小的缓存项
+    cache.put(("scan", 3), 3, 90)
+    assert list(cache.items) == [("scan", 3)]
+    assert cache.size == 90
+
+
+def test_oversized_item_is_not_cached():
+    cache = BlockCache(100)
+    cache.put(("scan", 0), 0, 60)
+    cache.put(("scan", 1), 1, 101)
+    assert cache.get(("scan", 1)) is None
+    assert cache.get(("scan", 0)) == 0
+    assert cache.size == 60
+
+
+def test_discard_scan():
+    cache = BlockCache(1000)
+    cache.put(("a", 0), 0, 10)
+    cache.put(("a", "index"), "index", 20)
+    cache.put(("b", 0), 0, 30)
+    cache.discard("a")
+    cache.discard("missing")
+    assert list(cache.items) == [("b", 0)]
+    assert cache.size == 30
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+结果导出：流式生成各格式、缓存文件复用和旧版本清理
+"""
+import csv
+import io
+import json
+import os
+
+import pytest
+
+from service import result_exporter
+from service.result_exporter import EXPORT_COLUMNS, ResultExporter
+
+RESULTS = [
+    {"host": f"host{n}.example.com", "type": "http", "template-id": f"t-{n}", "matched-at": f"http://host{n}/",
+     "info": {"severity": "high", "description": f"描述, \"{n}\""}}
+    for n in range(50)
+]
+
+JOB = {"completed": len(RESULTS), "end_time": "2024-01-01T00:00:00"}
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    # 缩小数据块，覆盖分块输出
+    monkeypatch.setattr(result_exporter, "CHUNK_SIZE", 256)
+    return ResultExporter(str(tmp_path / "exports"))
+
+
+class Counting:
+    """记录结果被消费的次数"""
+
+    def __init__(self, results):
+        self.results = results
+        self.consumed = 0
+
+    def __iter__(self):
+        self.consumed += 1
+        return iter(self.results)
+
+
+def drain(artifact):
+    assert artifact.path is None
+    return b"".join(artifact.stream).decode("utf-8")
+
+
+def read(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def parse(export_format, text):
+    if export_format == "csv":
+        return list(csv.reader(io.StringIO(text)))
+    if export_format == "jsonl":
+        return [json.loads(line) for line in text.splitlines()]
+    return json.loads(text)
+
+
+def expected(export_format):
+    if export_format == "csv":
+        return [EXPORT_COLUMNS] + [
+            [r["host"], "http", "high", r["template-id"], r["info"]["description"], r["matched-at"]]
+            for r in RESULTS
+        ]
+    return RESULTS
+
+
+@pytest.mark.parametrize("export_format", ["csv", "jsonl", "json"])
+def test_stream_then_cached_file(exporter, export_format):
+    artifact = exporter.export("scan", export_format, JOB, RESULTS)
+    extension = "jsonl" if export_format == "jsonl" else export_format
+    assert artifact.filename == f"scan.{extension}"
+    chunks = list(artifact.stream)
+    assert len(chunks) > 1
+    text = b"".join(chunks).decode("utf-8")
+    assert parse(export_format, text) == expected(export_format)
+
+    results = Counting(RESULTS)
+    cached = exporter.export("scan", export_format, JOB, results)
+    assert cached.stream is None
+    assert read(cached.path) == text
+    assert results.consumed == 0
+
+
+@pytest.mark.parametrize("export_format", ["csv", "jsonl", "json"])
+def test_empty_results(exporter, export_format):
+    text = drain(exporter.export("scan", export_format, JOB, []))
+    assert parse(export_format, text) == ([EXPORT_COLUMNS] if export_format == "csv" else [])
+
+
+def test_interrupted_stream_is_not_cached(exporter):
+    stream = exporter.export("scan", "jsonl", JOB, RESULTS).stream
+    next(stream)
+    stream.close()
+    assert os.listdir(exporter.cache_dir) == []
+    assert exporter.export("scan", "jsonl", JOB, RESULTS).stream is not None
+
+
+def test_new_version_replaces_stale_file(exporter):
+    drain(exporter.export("scan", "csv", JOB, RESULTS))
+    drain(exporter.export("other", "csv", JOB, RESULTS))
+    drain(exporter.export("scan", "jsonl", JOB, RESULTS))
+
+    updated = dict(JOB, completed=len(RESULTS) - 1)
+    assert ResultExporter.version(updated) != ResultExporter.version(JOB)
+    artifact = exporter.export("scan", "csv", updated, RESULTS[:-1])
+    assert artifact.stream is not None
+    drain(artifact)
+
+    files = sorted(name.split(".", 2)[0] + "." + name.rsplit(".", 1)[1] for name in os.listdir(exporter.cache_dir))
+    assert files == ["other.csv", "scan.csv", "scan.jsonl"]
+    assert ResultExporter.version(updated) in "".join(os.listdir(exporter.cache_dir))
+
+
+def test_excel(exporter):
+    openpyxl = pytest.importorskip("openpyxl")
+    artifact = exporter.export("scan", "excel", JOB, RESULTS)
+    assert artifact.stream is None
+    assert artifact.filename == "scan.xlsx"
+    rows = list(openpyxl.load_workbook(artifact.path, read_only=True).active.values)
+    assert list(rows[0]) == EXPORT_COLUMNS
+    assert list(rows[1]) == [RESULTS[0]["host"], "http", "high", "t-0", RESULTS[0]["info"]["description"],
+                             RESULTS[0]["matched-at"]]
+    assert len(rows) == len(RESULTS) + 1
+
+    results = Counting(RESULTS)
+    assert exporter.export("scan", "excel", JOB, results).path == artifact.path
+    assert results.consumed == 0
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+结果倒排索引和游标分页
+"""
+import pytest
+
+from service.result_index import ResultIndex, extract_fields, normalize_filters
+
+SEVERITIES = ["info", "low", "medium", "high", "critical"]
+
+
+def make_result(n):
+    return {
+        "template-id": f"template-{n % 7}",
+        "host": f"host{n % 3}.example.com",
+        "type": "http" if n % 2 else "dns",
+        "info": {"severity": SEVERITIES[n % len(SEVERITIES)].upper()},
+    }
+
+
+@pytest.fixture
+def index():
+    index = ResultIndex()
+    for n in range(500):
+        assert index.add(make_result(n)) == n
+    return index
+
+
+def collect(index, filters, limit):
+    """按游标翻完全部页"""
+    ordinals, cursor = [], 0
+    while cursor is not None:
+        page, cursor = index.query(filters, cursor, limit)
+        assert len(page) <= limit
+        ordinals.extend(page)
+    return ordinals
+
+
+def test_extract_fields_lowercases_severity_and_type():
+    fields = extract_fields({"template-id": "x", "host": "h", "type": "HTTP", "info": {"severity": "High"}})
+    assert fields == {"severity": "high", "template_id": "x", "host": "h", "type": "http"}
+    assert extract_fields({})["severity"] == ""
+
+
+def test_normalize_filters_drops_empty_and_unknown():
+    assert normalize_filters({"severity": "HIGH", "host": "", "template_id": None, "raw": "x"}) == {"severity": "high"}
+    assert normalize_filters({"host": "Example.com"}) == {"host": "Example.com"}
+
+
+def test_unfiltered_pages(index):
+    page, cursor = index.query({}, 0, 100)
+    assert page == list(range(100)) and cursor == 100
+    page, cursor = index.query({}, 450, 100)
+    assert page == list(range(450, 500)) and cursor is None
+    assert index.query({}, 500, 10) == ([], None)
+
+
+@pytest.mark.parametrize("filters", [
+    {"severity": "high"},
+    {"host": "host1.example.com"},
+    {"severity": "critical", "type": "http"},
+    {"template_id": "template-3", "host": "host2.example.com", "type": "dns"},
+])
+@pytest.mark.parametrize("limit", [1, 7, 1000])
+def test_filtered_pages_match_full_scan(index, filters, limit):
+    expected = [
+        n for n in range(500)
+        if all(extract_fields(make_result(n))[field] == value for field, value in filters.items())
+    ]
+    assert expected
+    assert collect(index, filters, limit) == expected
+
+
+def test_unknown_value_returns_empty(index):
+    assert index.query({"host": "missing"}, 0, 10) == ([], None)
+
+
+def test_index_grows_while_paging(index):
+    page, cursor = index.query({"severity": "info"}, 0, 100)
+    assert cursor is None
+    index.add(make_result(500))
+    page, _ = index.query({"severity": "info"}, page[-1] + 1, 100)
+    assert page == [500]
+
+
+@pytest.mark.parametrize("filters", [{}, {"severity": "info"}, {"host": "missing"}])
+def test_live_query_returns_resume_cursor(index, filters):
+    page, cursor = index.query(filters, 400, 1000, live=True)
+    assert cursor == 500
+    index.add(make_result(500))
+    page, cursor = index.query(filters, cursor, 1000, live=True)
+    assert page == ([500] if filters.get("host") != "missing" else [])
+    assert cursor == 501
+
+
+def test_dump_and_load_round_trip(index):
+    loaded = ResultIndex.load(index.dump())
+    assert len(loaded) == 500
+    for filters in ({}, {"severity": "low"}, {"host": "host0.example.com", "type": "http"}):
+        assert collect(loaded, filters, 33) == collect(index, filters, 33)
+    assert loaded.nbytes() > 0
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+增量扫描缓存：命中、过期和结果归属
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from service import scan_cache
+from service.scan_cache import ScanCache, finding_targets, template_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ScanCache(str(tmp_path / "scan_cache.db"), ttl=3600)
+
+
+def test_template_key_ignores_order_and_duplicates():
+    assert template_key(None) == template_key([]) == "*"
+    assert template_key(["b", "a", "b"]) == template_key(["a", "b"]) == "a,b"
+
+
+def test_finding_targets_include_host_without_port():
+    candidates = finding_targets({"host": "Example.com:8443", "matched-at": "https://example.com:8443/login"})
+    assert candidates[0] == "example.com:8443"
+    assert "example.com" in candidates
+
+
+def test_miss_then_hit(cache):
+    assert list(cache.lookup("*", ["a.com", "b.com"])) == [("a.com", None), ("b.com", None)]
+    cache.record("*", ["a.com", "b.com"], [(["a.com"], '{"n": 1}'), (["a.com"], '{"n": 2}')])
+    assert dict(cache.lookup("*", ["a.com", "b.com", "c.com"])) == {
+        "a.com": ['{"n": 1}', '{"n": 2}'],
+        # 扫描过但没有结果的目标也会命中
+        "b.com": [],
+        "c.com": None,
+    }
+    # 不同模板集合的缓存相互独立
+    assert dict(cache.lookup("cves", ["a.com"])) == {"a.com": None}
+
+
+def test_finding_belongs_to_first_scanned_candidate(cache):
+    cache.record("*", ["b.com"], [(["a.com", "b.com"], "x"), (["c.com"], "unscanned")])
+    assert dict(cache.lookup("*", ["a.com", "b.com", "c.com"])) == {"a.com": None, "b.com": ["x"], "c.com": None}
+
+
+def test_rescan_replaces_findings(cache):
+    cache.record("*", ["a.com"], [(["a.com"], "old")])
+    cache.record("*", ["a.com"], [(["a.com"], "new")])
+    assert dict(cache.lookup("*", ["a.com"])) == {"a.com": ["new"]}
+
+
+def test_expired_entries_miss_and_are_pruned(tmp_path, monkeypatch):
+    cache = ScanCache(str(tmp_path / "scan_cache.db"), ttl=60)
+    cache.record("*", ["a.com"], [(["a.com"], "x")])
+    later = time.time() + 120
+    monkeypatch.setattr(scan_cache, "time", SimpleNamespace(time=lambda: later))
+    assert dict(cache.lookup("*", ["a.com"])) == {"a.com": None}
+    cache.record("*", ["b.com"], [])
+    conn = cache._reader()
+    assert conn.execute("SELECT COUNT(*) FROM cache_targets WHERE target = 'a.com'").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM cache_findings").fetchone()[0] == 0
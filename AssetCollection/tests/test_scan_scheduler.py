@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+扫描调度器：槽位分发、异常和取消后释放槽位
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from service.scan_scheduler import ScanScheduler
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+class BlockingRunner:
+    """记录开始执行的任务，任务在放行前一直占用槽位"""
+
+    def __init__(self):
+        self.started = []
+        self.gates = {}
+
+    def __call__(self, scan_id, payload, queue_wait):
+        gate = self.gates.setdefault(scan_id, threading.Event())
+        self.started.append((scan_id, payload, queue_wait))
+        gate.wait(5)
+
+    def release(self, scan_id):
+        self.gates.setdefault(scan_id, threading.Event()).set()
+
+
+def test_dispatch_waits_for_free_slot():
+    runner = BlockingRunner()
+    scheduler = ScanScheduler(runner, 2)
+    for scan_id in ("a", "b", "c"):
+        scheduler.submit(scan_id, {"shard": scan_id})
+
+    wait_until(lambda: len(runner.started) == 2)
+    assert scheduler.active_count() == 2
+    time.sleep(0.1)
+    assert [scan_id for scan_id, _, _ in runner.started] == ["a", "b"]
+
+    runner.release("a")
+    wait_until(lambda: len(runner.started) == 3)
+    scan_id, payload, queue_wait = runner.started[2]
+    assert (scan_id, payload) == ("c", {"shard": "c"})
+    assert queue_wait >= 0.1
+
+    runner.release("b")
+    runner.release("c")
+    wait_until(lambda: scheduler.active_count() == 0)
+    assert scheduler.queue_depth() == 0
+
+
+def test_failing_runner_frees_slot_and_reports():
+    errors = []
+
+    def runner(scan_id, payload, queue_wait):
+        raise RuntimeError("boom")
+
+    scheduler = ScanScheduler(runner, 1, on_error=lambda *args: errors.append(args))
+    scheduler.submit("a", 0)
+    scheduler.submit("b", 1)
+    wait_until(lambda: len(errors) == 2)
+    assert errors == [("a", 0, "boom"), ("b", 1, "boom")]
+    wait_until(lambda: scheduler.active_count() == 0)
+
+
+def test_coroutine_runner(loop):
+    done = []
+
+    async def runner(scan_id, payload, queue_wait):
+        await asyncio.sleep(0.01)
+        done.append(scan_id)
+
+    scheduler = ScanScheduler(runner, 2, loop_getter=lambda: loop)
+    for scan_id in "abcde":
+        scheduler.submit(scan_id, None)
+    wait_until(lambda: len(done) == 5 and scheduler.active_count() == 0)
+    assert sorted(done) == list("abcde")
+
+
+def test_cancelled_coroutine_frees_slot(loop):
+    tasks = []
+    errors = []
+
+    async def runner(scan_id, payload, queue_wait):
+        tasks.append(asyncio.current_task())
+        await asyncio.sleep(60)
+
+    scheduler = ScanScheduler(runner, 1, loop_getter=lambda: loop, on_error=lambda *args: errors.append(args))
+    scheduler.submit("a", None)
+    scheduler.submit("b", None)
+    wait_until(lambda: len(tasks) == 1)
+    loop.call_soon_threadsafe(tasks[0].cancel)
+    # 取消不算执行失败，槽位释放后分发下一个任务
+    wait_until(lambda: len(tasks) == 2)
+    loop.call_soon_threadsafe(tasks[1].cancel)
+    wait_until(lambda: scheduler.active_count() == 0)
+    assert errors == []
+
+
+def test_failing_coroutine_is_reported(loop):
+    errors = []
+
+    async def runner(scan_id, payload, queue_wait):
+        raise ValueError("bad payload")
+
+    scheduler = ScanScheduler(runner, 1, loop_getter=lambda: loop, on_error=lambda *args: errors.append(args))
+    scheduler.submit("a", 7)
+    wait_until(lambda: errors)
+    assert errors == [("a", 7, "bad payload")]
+    wait_until(lambda: scheduler.active_count() == 0)
+
+
+def test_launch_failure_is_reported():
+    errors = []
+
+    def closed_loop():
+        raise RuntimeError("事件循环已关闭")
+
+    async def runner(scan_id, payload, queue_wait):
+        pass
+
+    scheduler = ScanScheduler(runner, 1, loop_getter=closed_loop, on_error=lambda *args: errors.append(args))
+    scheduler.submit("a", None)
+    scheduler.submit("b", None)
+    wait_until(lambda: len(errors) == 2)
+    assert errors[0][:2] == ("a", None)
+    assert "事件循环已关闭" in errors[0][2]
+    assert scheduler.active_count() == 0
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+目标规范化：去重合并、端口区间和CIDR网段的展开、按分片生成
+"""
+import ipaddress
+
+import pytest
+
+from model.asset_model import Target
+from service.target_normalizer import TargetNormalizer, canonicalize, merge_ranges, parse_ports
+
+
+def targets(normalizer):
+    return list(normalizer)
+
+
+def test_parse_ports():
+    assert parse_ports("80, 443,8000-8002,") == [(80, 80), (443, 443), (8000, 8002)]
+    for spec in ("0", "70000", "90-80", "abc"):
+        with pytest.raises(ValueError):
+            parse_ports(spec)
+
+
+def test_merge_ranges_joins_overlapping_and_adjacent():
+    assert merge_ranges([(90, 100), (80, 85), (86, 88), (95, 120), (443, 443)]) == [(80, 88), (90, 120), (443, 443)]
+
+
+def test_domains_and_urls_are_deduplicated():
+    normalizer = TargetNormalizer([
+        Target(domain="Example.COM."),
+        Target(domain="example.com"),
+        Target(url="HTTP://example.com/"),
+        Target(url="https://example.com:443"),
+        Target(url="http://example.com:8080"),
+        Target(url="http://Example.com/login?next=1"),
+        Target(domain="例子.测试"),
+    ])
+    assert targets(normalizer) == [
+        "http://example.com/login?next=1",
+        "example.com",
+        "example.com:8080",
+        "xn--fsqu00a.xn--0zwm56d",
+    ]
+    assert normalizer.submitted == 7
+    assert normalizer.total == 4
+    assert normalizer.collapsed == 3
+
+
+def test_domain_port_ranges_are_merged():
+    normalizer = TargetNormalizer([
+        Target(domain="a.com", ports="80-82"),
+        Target(domain="a.com", ports="81-83", port=443),
+    ])
+    assert targets(normalizer) == ["a.com:80", "a.com:81", "a.com:82", "a.com:83", "a.com:443"]
+    assert normalizer.submitted == 7
+    assert normalizer.collapsed == 2
+
+
+def test_overlapping_networks_are_collapsed():
+    normalizer = TargetNormalizer([
+        Target(ip="10.0.0.0/29"),
+        Target(ip="10.0.0.4/30"),
+        Target(ip="10.0.0.9"),
+        Target(ip="10.0.0.8"),
+        Target(ip="::1"),
+    ])
+    expected = [str(ipaddress.ip_address("10.0.0.0") + n) for n in range(10)] + ["::1"]
+    assert targets(normalizer) == expected
+    assert normalizer.total == 11
+    assert normalizer.collapsed == 4
+
+
+def test_networks_with_overlapping_ports_yield_each_pair_once():
+    specs = [("10.0.0.0/30", "80-81"), ("10.0.0.2/31", "81-82"), ("10.0.0.3", "443")]
+    normalizer = TargetNormalizer([Target(ip=ip, ports=ports) for ip, ports in specs])
+    produced = targets(normalizer)
+
+    expected = set()
+    for ip, ports in specs:
+        for address in ipaddress.ip_network(ip):
+            for start, end in parse_ports(ports):
+                expected.update(f"{address}:{port}" for port in range(start, end + 1))
+    assert len(produced) == len(set(produced)) == normalizer.total
+    assert set(produced) == expected
+
+
+def test_ipv6_host_with_port():
+    normalizer = TargetNormalizer([Target(ip="2001:db8::1", port=8443)])
+    assert targets(normalizer) == ["[2001:db8::1]:8443"]
+
+
+def test_large_network_is_counted_without_expanding():
+    normalizer = TargetNormalizer([Target(ip="10.0.0.0/8", ports="1-65535")])
+    assert normalizer.total == 2 ** 24 * 65535
+    assert list(normalizer.iter_range(65535, 65537)) == ["10.0.0.1:1", "10.0.0.1:2"]
+
+
+@pytest.fixture
+def mixed():
+    return TargetNormalizer([
+        Target(url="http://z.com/path"),
+        Target(url="http://y.com/path"),
+        Target(domain="b.com"),
+        Target(domain="a.com", ports="80,443,8000-8003"),
+        Target(ip="192.168.0.0/28", ports="22,80"),
+        Target(ip="192.168.0.16/30"),
+        Target(ip="fe80::/126"),
+    ])
+
+
+def test_iter_range_matches_full_order(mixed):
+    full = targets(mixed)
+    assert len(full) == mixed.total
+    for start in range(0, mixed.total, 5):
+        for stop in (start, start + 1, start + 7, mixed.total + 3):
+            assert list(mixed.iter_range(start, stop)) == full[start:stop]
+
+
+@pytest.mark.parametrize("shard_count", [1, 2, 3, 7, 100])
+def test_shards_are_contiguous_and_cover_all(mixed, shard_count):
+    shards = [list(mixed.iter_shard(index, shard_count)) for index in range(shard_count)]
+    assert [target for shard in shards for target in shard] == targets(mixed)
+    sizes = [len(shard) for shard in shards]
+    assert max(sizes) - min(sizes) <= 1
+    assert sizes == [mixed.shard_size(index, shard_count) for index in range(shard_count)]
+
+
+@pytest.mark.parametrize("total, shard_count", [(10, 3), (7, 7), (100, 6), (1, 1)])
+def test_shard_size_matches_generated_targets(total, shard_count):
+    normalizer = TargetNormalizer([Target(domain=f"host{n}.example.com") for n in range(total)])
+    for index in range(shard_count):
+        assert normalizer.shard_size(index, shard_count) == sum(1 for _ in normalizer.iter_shard(index, shard_count))
+    assert [normalizer.shard_size(index, 3) for index in range(3)] == [total * (i + 1) // 3 - total * i // 3
+                                                                      for i in range(3)]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("HTTP://Example.com:80", "example.com"),
+    ("https://example.com:8443/", "example.com:8443"),
+    ("Example.com:8080", "example.com:8080"),
+    ("[2001:DB8::1]:443", "[2001:db8::1]:443"),
+    ("10.0.0.1", "10.0.0.1"),
+    ("http://example.com/a?b=1", "http://example.com/a?b=1"),
+    ("not a host:port:x", "not a host:port:x"),
+])
+def test_canonicalize_matches_normalizer_output(value, expected):
+    assert canonicalize(value) == expected
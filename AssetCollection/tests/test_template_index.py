@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+nuclei模板索引：模板头解析、索引缓存和失效、模板名称校验
+"""
+import json
+import os
+
+import pytest
+
+from config import current_config
+from easm_common import nuclei_templates
+from service.template_index import TemplateIndex
+
+TEMPLATE = """id: {id}
+
+info:
+  name: {id}
+  author: test
+  severity: {severity}
+  tags: {tags}
+
+http:
+  - method: GET
+    path:
+      - "{{{{BaseURL}}}}"
+"""
+
+
+def write_template(template_dir, relative, template_id, severity="info", tags="tech"):
+    path = template_dir / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(TEMPLATE.format(id=template_id, severity=severity, tags=tags), encoding="utf-8")
+    return path
+
+
+def touch_later(path):
+    """将文件的修改时间推后，避免文件系统时间精度导致签名不变"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    root = tmp_path / "nuclei-templates"
+    write_template(root, "http/technologies/nginx.yaml", "nginx-detect", tags="tech, Nginx")
+    write_template(root, "http/cves/2021/CVE-2021-0001.yaml", "CVE-2021-0001", severity="CRITICAL", tags="cve,rce")
+    write_template(root, "dns/spf.yml", "spf-record", tags='"dns"')
+    (root / "http" / "README.md").write_text("id: not-a-template", encoding="utf-8")
+    write_template(root, ".github/workflow.yaml", "hidden")
+    (root / "helpers").mkdir()
+    (root / "helpers" / "payload.yaml").write_text("- a\n- b\n", encoding="utf-8")
+    (root / nuclei_templates.CHECKSUM_FILE).write_text("a:1\n", encoding="utf-8")
+    return root
+
+
+def test_parse_template_header():
+    text = TEMPLATE.format(id="x-y", severity="High", tags="a, B ,")
+    assert nuclei_templates.parse_template_header(text) == ("x-y", "high", ["a", "b"])
+    assert nuclei_templates.parse_template_header("id: 'quoted' # comment\n") == ("quoted", "unknown", [])
+    assert nuclei_templates.parse_template_header("- list\n") is None
+
+
+def test_build(template_dir):
+    paths, tags, severities = nuclei_templates.build(str(template_dir))
+    assert paths == {
+        "spf-record": os.path.join("dns", "spf.yml"),
+        "CVE-2021-0001": os.path.join("http", "cves", "2021", "CVE-2021-0001.yaml"),
+        "nginx-detect": os.path.join("http", "technologies", "nginx.yaml"),
+    }
+    assert tags == {"dns": ["spf-record"], "cve": ["CVE-2021-0001"], "rce": ["CVE-2021-0001"],
+                    "tech": ["nginx-detect"], "nginx": ["nginx-detect"]}
+    assert severities == {"info": ["spf-record", "nginx-detect"], "critical": ["CVE-2021-0001"]}
+
+
+def test_stats_tags_when_no_templates(tmp_path):
+    stats = {"tags": [{"name": "CVE", "count": 1}, {"name": "tech"}, {"count": 3}]}
+    (tmp_path / nuclei_templates.STATS_FILE).write_text(json.dumps(stats), encoding="utf-8")
+    assert nuclei_templates.stats_tags(str(tmp_path)) == {"cve", "tech"}
+    assert nuclei_templates.build(str(tmp_path)) == ({}, {"cve": [], "tech": []}, {})
+
+    (tmp_path / nuclei_templates.STATS_FILE).write_text("not json", encoding="utf-8")
+    assert nuclei_templates.stats_tags(str(tmp_path)) == set()
+
+
+def test_signature_changes(template_dir):
+    assert nuclei_templates.signature(str(template_dir / "missing")) is None
+    original = nuclei_templates.signature(str(template_dir))
+    assert nuclei_templates.signature(str(template_dir)) == original
+
+    # 修改子目录中的模板
+    nested = template_dir / "http" / "cves" / "2021" / "CVE-2021-0001.yaml"
+    touch_later(nested)
+    edited = nuclei_templates.signature(str(template_dir))
+    assert edited != original
+
+    # 新增模板
+    write_template(template_dir, "http/cves/2021/CVE-2021-0002.yaml", "CVE-2021-0002")
+    os.utime(template_dir / "http" / "cves" / "2021" / "CVE-2021-0002.yaml", ns=(0, 0))
+    added = nuclei_templates.signature(str(template_dir))
+    assert added != edited
+
+    # 校验和文件内容变化（修改时间不变）
+    checksum = template_dir / nuclei_templates.CHECKSUM_FILE
+    stat = os.stat(checksum)
+    checksum.write_text("a:2\n", encoding="utf-8")
+    os.utime(checksum, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert nuclei_templates.signature(str(template_dir)) != added
+
+    # 隐藏目录中的文件不影响签名
+    current = nuclei_templates.signature(str(template_dir))
+    touch_later(template_dir / ".github" / "workflow.yaml")
+    assert nuclei_templates.signature(str(template_dir)) == current
+
+
+def test_load_uses_cache_until_signature_changes(template_dir, tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "cache" / "index.bin")
+    signature, data = nuclei_templates.load(str(template_dir), cache_path)
+    assert os.path.exists(cache_path)
+    assert "nginx-detect" in data[0]
+
+    builds = []
+    build = nuclei_templates.build
+    monkeypatch.setattr(nuclei_templates, "build", lambda path: builds.append(path) or build(path))
+    assert nuclei_templates.load(str(template_dir), cache_path) == (signature, data)
+    assert builds == []
+
+    touch_later(template_dir / "dns" / "spf.yml")
+    nuclei_templates.load(str(template_dir), cache_path)
+    assert builds == [str(template_dir)]
+
+
+def test_corrupt_cache_is_rebuilt(template_dir, tmp_path):
+    cache_path = tmp_path / "index.bin"
+    cache_path.write_bytes(b"garbage")
+    _, data = nuclei_templates.load(str(template_dir), str(cache_path))
+    assert "spf-record" in data[0]
+    assert nuclei_templates.load_cache(str(cache_path), nuclei_templates.signature(str(template_dir))) == data
+
+
+@pytest.fixture
+def index(template_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(current_config, "NUCLEI_TEMPLATE_DIR", str(template_dir))
+    monkeypatch.setattr(current_config, "TEMPLATE_INDEX_PATH", str(tmp_path / "template_index.bin"))
+    # 由测试调用refresh()检查更新，后台刷新线程不在测试期间运行
+    monkeypatch.setattr(current_config, "TEMPLATE_INDEX_CHECK_INTERVAL", 3600)
+    return TemplateIndex()
+
+
+def test_index_lookups(index):
+    assert index.available()
+    assert index.tags() == {"dns", "cve", "rce", "tech", "nginx"}
+    assert index.by_tag("NGINX") == ["nginx-detect"]
+    assert index.by_severity("Critical") == ["CVE-2021-0001"]
+    assert index.path("spf-record") == os.path.join("dns", "spf.yml")
+    assert index.path("missing") is None
+
+
+def test_resolve(index, template_dir):
+    assert index.resolve(["nginx-detect", "http/cves", "dns/spf.yml", "http/cves/2021/CVE-2021-0001"]) == [
+        os.path.join("http", "technologies", "nginx.yaml"), "http/cves", "dns/spf.yml",
+        "http/cves/2021/CVE-2021-0001.yaml",
+    ]
+    with pytest.raises(ValueError, match="unknown-one, unknown-two"):
+        index.resolve(["nginx-detect", "unknown-one", "unknown-two"])
+
+
+def test_index_picks_up_new_templates(index, template_dir):
+    with pytest.raises(ValueError):
+        index.resolve(["new-template"])
+    write_template(template_dir, "http/misc/new.yaml", "new-template", tags="misc")
+    touch_later(template_dir / "http" / "misc" / "new.yaml")
+    # 刷新前查询使用原有的索引
+    assert index.by_tag("misc") == []
+    assert index.refresh()
+    assert not index.refresh()
+    assert index.resolve(["new-template"]) == [os.path.join("http", "misc", "new.yaml")]
+    assert index.by_tag("misc") == ["new-template"]
+
+
+def test_missing_template_dir(index, tmp_path, monkeypatch):
+    monkeypatch.setattr(current_config, "NUCLEI_TEMPLATE_DIR", str(tmp_path / "missing"))
+    assert not index.available()
+    assert index.tags() == set()
+    assert index.resolve(["anything"]) == ["anything"]
+
+
+def test_lookups_do_not_wait_for_refresh(index):
+    assert index.available()
+    # 刷新持有锁（遍历模板目录）期间查询不被阻塞
+    with index.lock:
+        assert index.by_tag("nginx") == ["nginx-detect"]
+        assert index.resolve(["spf-record"]) == [os.path.join("dns", "spf.yml")]
+
+
+def test_missing_template_dir_is_detected_on_refresh(index, tmp_path, monkeypatch):
+    assert index.available()
+    monkeypatch.setattr(current_config, "NUCLEI_TEMPLATE_DIR", str(tmp_path / "missing"))
+    assert index.refresh()
+    assert not index.available()
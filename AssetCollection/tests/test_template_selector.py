@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+基于指纹的模板预选：指纹到标签的映射、按标签分组和执行次数上限
+"""
+import pytest
+
+from config import current_config
+from service.template_selector import FINGERPRINT_PROGRESS, FingerprintPlan, ScanPlan
+
+
+@pytest.fixture
+def target_file(temp_dirs):
+    path = temp_dirs / "targets.txt"
+    path.write_text("a.com\nb.com:8080\nc.com\nd.com\n", encoding="utf-8")
+    return str(path)
+
+
+def detect(plan, host, *words):
+    plan.observe({"host": host, "template-id": "tech-detect", "matcher-name": words[0],
+                  "info": {"tags": ",".join(words[1:])}})
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().split()
+
+
+def test_single_pass_plan(target_file):
+    passes = list(ScanPlan(target_file, ["cves/x.yaml"]))
+    assert len(passes) == 1
+    assert passes[0].templates == ["cves/x.yaml"] and passes[0].progress(50) == 50
+
+
+def test_tags_for_skips_generic_and_unknown_tags(target_file):
+    plan = FingerprintPlan(target_file, {"apache", "tomcat", "tech", "panel"})
+    assert plan.tags_for({"apache-tomcat", "tech", "login-panel", "iis"}) == {"apache", "tomcat"}
+
+
+def test_targets_are_grouped_by_tags(target_file, monkeypatch):
+    monkeypatch.setattr(current_config, "FINGERPRINT_FALLBACK_SEVERITY", ["critical"])
+    plan = FingerprintPlan(target_file, {"apache", "tomcat", "nginx"})
+    passes = iter(plan)
+    detection = next(passes)
+    assert detection.fingerprint and detection.tags == current_config.FINGERPRINT_TAGS
+    assert detection.progress_end == FINGERPRINT_PROGRESS
+
+    detect(plan, "a.com", "apache-tomcat")
+    detect(plan, "http://b.com:8080", "nginx")
+    detect(plan, "c.com", "tomcat", "apache")
+    rest = list(passes)
+    try:
+        assert [(scan_pass.tags, read(scan_pass.target_file)) for scan_pass in rest[:-1]] == [
+            (["apache", "tomcat"], ["a.com", "c.com"]),
+            (["nginx"], ["b.com:8080"]),
+        ]
+        fallback = rest[-1]
+        assert fallback.tags is None and fallback.severity == ["critical"]
+        assert read(fallback.target_file) == ["d.com"]
+        # 各次执行的进度区间首尾相接
+        assert [scan_pass.progress_start for scan_pass in rest] == [FINGERPRINT_PROGRESS, 60, 80]
+        assert rest[-1].progress_end == 100
+    finally:
+        plan.cleanup()
+
+
+def test_smallest_groups_are_merged_over_pass_limit(target_file, monkeypatch):
+    monkeypatch.setattr(current_config, "FINGERPRINT_MAX_PASSES", 2)
+    plan = FingerprintPlan(target_file, {"apache", "nginx", "iis", "tomcat"})
+    passes = iter(plan)
+    next(passes)
+    detect(plan, "a.com", "apache")
+    detect(plan, "c.com", "apache")
+    detect(plan, "b.com:8080", "nginx")
+    detect(plan, "d.com", "iis")
+    rest = list(passes)
+    try:
+        assert [scan_pass.tags for scan_pass in rest] == [["apache"], ["iis", "nginx"]]
+        assert sorted(read(rest[1].target_file)) == ["b.com:8080", "d.com"]
+    finally:
+        plan.cleanup()
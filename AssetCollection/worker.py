@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+扫描工作进程，从任务队列租用扫描分片，执行nuclei并将状态和结果回传给API节点
+
+用法（SCAN_MODE 为 distributed 时，可在多台主机上启动多个工作进程）:
+    python worker.py --concurrency 5
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import current_config
+from model.asset_model import Target
+from service.queue_backend import LeasedTask, QueueBackend, create_queue_backend
+from service.resource_governor import create_governor
+from service.template_selector import ScanPass, ScanPlan, create_plan
+from service.target_normalizer import TargetNormalizer
+from service.nuclei_process import (
+    NUCLEI_NOT_FOUND_ERROR, build_command, failure_message, write_target_file, start_nuclei, run_nuclei
+)
+
+logger = logging.getLogger("worker")
+
+
+class ScanWorker:
+    """
+    扫描工作进程
+
+    每个执行线程循环租用并执行任务，续租线程定期为持有的任务续租，续租失败（租约已被
+    重新分配）时结束对应的nuclei进程。回传的事件先放入发件队列，由发送线程批量写入任务队列。
+    """
+
+    def __init__(self, backend: QueueBackend, worker_id: str, concurrency: int):
+        self.backend = backend
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.stopping = threading.Event()
+
+        # 当前持有的任务: task_id -> {"process": nuclei进程, "lost": 租约是否已丢失}
+        self.leases: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+        # 待回传的事件，队列满时执行线程等待发送，避免任务队列写入较慢时占用过多内存
+        self.outbox = queue.Queue(maxsize=current_config.WORKER_EVENT_BATCH_SIZE * 20)
+
+        # 按本机的预算为每个nuclei进程分配并发和速率参数
+        self.governor = create_governor(concurrency)
+
+    def run(self) -> None:
+        """启动续租、事件发送和执行线程，阻塞直到进程退出"""
+        threads = [
+            threading.Thread(target=self._heartbeat_loop, daemon=True),
+            threading.Thread(target=self._sender_loop, daemon=True)
+        ]
+        threads.extend(
+            threading.Thread(target=self._work_loop, daemon=True) for _ in range(self.concurrency)
+        )
+        for thread in threads:
+            thread.start()
+        logger.info("扫描工作进程已启动: %s，并发数: %d", self.worker_id, self.concurrency)
+        try:
+            while not self.stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self) -> None:
+        """停止租用新任务，并结束正在执行的nuclei进程（租约到期后任务由其他工作进程重新执行）"""
+        self.stopping.set()
+        with self.lock:
+            for lease in self.leases.values():
+                if lease["process"] is not None and lease["process"].poll() is None:
+                    lease["process"].kill()
+
+    def _emit(self, task: LeasedTask, event_type: str, **fields) -> None:
+        """放入一条待回传的事件，事件回传到提交任务的API节点的事件通道"""
+        self.outbox.put((task.payload.get("owner", ""), dict(
+            fields,
+            type=event_type,
+            scan_id=task.payload["scan_id"],
+            shard_index=task.payload["shard_index"],
+            attempt=task.attempt
+        )))
+
+    def _flush(self) -> None:
+        """等待此前放入的事件全部回传"""
+        done = threading.Event()
+        self.outbox.put(done)
+        done.wait()
+
+    def _sender_loop(self) -> None:
+        """事件发送线程，合并发件队列中的事件后批量写入任务队列"""
+        while True:
+            batch = [self.outbox.get()]
+            deadline = time.monotonic() + current_config.JOB_STORE_FLUSH_INTERVAL
+            while len(batch) < current_config.WORKER_EVENT_BATCH_SIZE and not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.outbox.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # 按API节点分组回传，同一节点的事件保持原有顺序
+            channels: Dict[str, List[Dict]] = {}
+            for item in batch:
+                if not isinstance(item, threading.Event):
+                    channel, event = item
+                    channels.setdefault(channel, []).append(event)
+            for channel, events in channels.items():
+                while True:
+                    try:
+                        self.backend.push_events(channel, events)
+                        break
+                    except Exception as e:
+                        logger.warning("回传事件失败，稍后重试: %s", e)
+                        time.sleep(1)
+
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _heartbeat_loop(self) -> None:
+        """续租线程"""
+        while not self.stopping.wait(current_config.HEARTBEAT_INTERVAL):
+            with self.lock:
+                task_ids = list(self.leases)
+            for task_id in task_ids:
+                try:
+                    alive = self.backend.heartbeat(task_id, self.worker_id, current_config.LEASE_TIMEOUT)
+                except Exception as e:
+                    logger.warning("续租失败: %s, %s", task_id, e)
+                    continue
+                if alive:
+                    continue
+                # 租约已被重新分配，停止执行
+                logger.warning("租约已丢失，停止执行: %s", task_id)
+                with self.lock:
+                    lease = self.leases.get(task_id)
+                    if lease is not None:
+                        lease["lost"] = True
+                        if lease["process"] is not None and lease["process"].poll() is None:
+                            lease["process"].kill()
+
+    def _work_loop(self) -> None:
+        """执行线程，循环租用并执行任务"""
+        while not self.stopping.is_set():
+            try:
+                task = self.backend.lease(self.worker_id, current_config.LEASE_TIMEOUT)
+            except Exception as e:
+                logger.warning("租用任务失败: %s", e)
+                task = None
+            if task is None:
+                self.stopping.wait(current_config.WORKER_POLL_INTERVAL)
+                continue
+
+            with self.lock:
+                self.leases[task.task_id] = {"process": None, "lost": False}
+            try:
+                status, error = self._execute(task)
+                with self.lock:
+                    lost = self.leases[task.task_id]["lost"]
+                if lost or self.stopping.is_set():
+                    # 任务将由其他工作进程重新执行，不回传结束状态
+                    continue
+                self._emit(task, "finish", status=status, error=error)
+                # 结束事件回传后才从队列中删除任务，避免进程崩溃导致任务状态丢失
+                self._flush()
+                self.backend.complete(task.task_id, self.worker_id)
+            finally:
+                with self.lock:
+                    self.leases.pop(task.task_id, None)
+
+    def _demand(self) -> int:
+        """本机需要运行的nuclei进程数（持有的任务数加上队列中等待的任务数）"""
+        with self.lock:
+            held = len(self.leases)
+        try:
+            return held + self.backend.queue_depth()
+        except Exception:
+            return held
+
+    def _output_handler(self, task: LeasedTask, plan: ScanPlan, scan_pass: ScanPass):
+        """生成nuclei输出回调，结果回传给API节点，指纹识别阶段的结果同时交给执行计划"""
+        def on_output(line: str) -> None:
+            line = line.strip()
+            if not line:
+                return
+            self._emit(task, "finding", line=line)
+            if scan_pass.fingerprint:
+                try:
+                    plan.observe(json.loads(line))
+                except (json.JSONDecodeError, AttributeError):
+                    pass
+        return on_output
+
+    def _execute(self, task: LeasedTask) -> Tuple[str, Optional[str]]:
+        """执行一个扫描分片，返回(分片状态, 错误信息)"""
+        payload = task.payload
+        self._emit(task, "start", queue_wait=round(max(0.0, time.time() - task.enqueued_at), 3))
+
+        target_file: Optional[str] = None
+        plan = None
+        allocation = None
+        try:
+            targets = TargetNormalizer([Target(**target) for target in payload["targets"]])
+            target_file = write_target_file(targets.iter_shard(payload["shard_index"], payload["shard_count"]))
+            if self.governor is not None:
+                allocation = self.governor.acquire(task.task_id, self._demand())
+            scan_timeout = payload.get("timeout") or current_config.SCAN_TIMEOUT
+            deadline = time.monotonic() + scan_timeout
+
+            plan = create_plan(target_file, payload.get("templates"), payload.get("fingerprint", False))
+            for scan_pass in plan:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return "failed", f"扫描超时，已超过{scan_timeout}秒"
+                cmd = build_command(
+                    scan_pass.target_file, scan_pass.templates, payload.get("verbose", False),
+                    allocation, scan_pass.tags, scan_pass.severity
+                )
+
+                with self.lock:
+                    if self.leases[task.task_id]["lost"] or self.stopping.is_set():
+                        # 结束状态不会回传，任务由其他工作进程重新执行
+                        return "failed", "任务已停止"
+
+                try:
+                    process = start_nuclei(cmd)
+                except FileNotFoundError:
+                    return "failed", NUCLEI_NOT_FOUND_ERROR.format(path=current_config.NUCLEI_PATH)
+                except Exception as e:
+                    return "failed", f"启动nuclei进程失败: {str(e)}"
+
+                with self.lock:
+                    self.leases[task.task_id]["process"] = process
+
+                run = run_nuclei(
+                    process, remaining, self._output_handler(task, plan, scan_pass),
+                    lambda percent: self._emit(task, "progress", percent=scan_pass.progress(percent))
+                )
+                error = failure_message(run, scan_timeout)
+                if error is not None:
+                    return "failed", error
+            return "completed", None
+        except Exception as e:
+            logger.exception("执行任务出错: %s", task.task_id)
+            return "failed", str(e)
+        finally:
+            if allocation is not None:
+                self.governor.release(task.task_id)
+            if plan is not None:
+                plan.cleanup()
+            if target_file and os.path.exists(target_file):
+                os.remove(target_file)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="扫描工作进程")
+    parser.add_argument("--concurrency", type=int, default=current_config.WORKER_CONCURRENCY,
+                        help="同时执行的任务数")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="工作进程标识，需在所有工作进程中唯一")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    os.makedirs(current_config.TEMP_DIR, exist_ok=True)
+    ScanWorker(create_queue_backend(), args.worker_id, args.concurrency).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,14 +13,21 @@ AutoNuclei 自动化扫描工具
 团队: base64-sec
 博客: https://painter-sec.cnblogs.com
 """
-from openpyxl import workbook, load_workbook
+import argparse
 import os
 import platform
 import time
-import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 
 import ProcessMonitor
+import TemplateIndex
+import TagMatcher
+import ScanPipeline
+import FingerprintReader
+import Checkpoint
+import FindingStore
 
 class AutoNuclei():
     """
@@ -28,36 +35,59 @@ class AutoNuclei():
     该类封装了从指纹识别到漏洞扫描的完整流程
     """
 
-    def __init__(self):
+    def __init__(self, pipeline=False, input_file=None, resume=False):
         """
         初始化AutoNuclei实例并启动完整的扫描流程
         流程包括：显示标题、创建目录、启动指纹扫描、加载配置、解析数据、执行扫描
+        :param pipeline: 为True时以流水线方式运行，EHole输出的指纹立即交给nuclei扫描
+        :param input_file: 已有的指纹结果文件（xlsx、csv或jsonl），指定后不再运行EHole
+        :param resume: 为True时从检查点恢复，跳过上次已完成的阶段和扫描单元
         """
         self.plat = platform.system().lower()
         if self.plat == 'windows':
             self.nuclei_path = '.\\module\\Nuclei\\nuclei.exe'
-            self.tags_file = '.\\nuclei-templates\\TEMPLATES-STATS.json'  # 读取nuclei里所有的tags标签
+            self.ehole_path = '.\\module\\EHole\\EHole.exe'
+            self.templates_dir = '.\\nuclei-templates'  # nuclei模板目录，从中读取所有的tags标签
         else:
             self.nuclei_path = os.environ['HOME'] + '/nuclei'
-            self.tags_file = './nuclei-templates/TEMPLATES-STATS.json'  # 读取nuclei里所有的tags标签
+            self.ehole_path = './module/EHole/EHole'
+            self.templates_dir = './nuclei-templates'  # nuclei模板目录，从中读取所有的tags标签
         self.target_file = 'wait_check.xlsx'  # 默认，不要动
+        self.input_file = input_file  # 指纹结果文件，为None时读取EHole输出的self.target_file
 
         self.level_target_temp = 'temp/level_target_temp.txt'  # 存储用于等级扫描的目标临时文件
-        self.tag_target_temp = 'temp/tag_target_temp.txt'  # 存储用于标签扫描的目标临时文件
+        self.tag_target_temp = 'temp/tag_target_{}.txt'  # 存储用于标签扫描的目标临时文件，每组标签一个
+        self.tag_scan_workers = 4  # 同时运行的nuclei标签扫描进程数
         # self.nuclei_path = r'C:\Users\painter\Desktop\auto_nuclei'
         self.nuclei_tags = []  # 存放nuclei里的所有tags
-        self.all_message = []  # 存放从Excel读取的所有数据
+        self.records = iter(())  # 逐行读取的(url, 指纹)记录
         self.base_scan_target = []  # 存放后续用高低中等级的poc来进行扫描的目标
         self.tags_scan_target = []  # 存放可以用nuclei的tags来进行扫描的目标
 
+        self.pipeline_batch_size = 200  # 流水线模式每批最多的目标数
+        self.pipeline_flush_interval = 30  # 流水线模式批次多久没有新目标时提前扫描（秒）
+        self.checkpoint_path = 'temp/checkpoint.jsonl'  # 检查点日志，记录已完成的阶段和扫描单元
+        self.findings_path = 'result/findings.db'  # 合并去重后的漏洞结果库
+        self.unit_output = 'temp/{}_vul_{}_{}.jsonl'  # 每次nuclei扫描的JSONL输出，合并到结果库后删除
+
         self.create_dir()  # 创建必要的目录
-        self.start_Ehole()  # 启动资产扫描(EHole指纹识别)
-        self.get_nuclei_tags()  # 获取nuclei的所有标签
-        self.excel_load()  # 加载Excel文件数据
-        self.extract_data()  # 根据excel资产，来采用不同的方式调用nuclei
+        self.checkpoint = Checkpoint.Checkpoint(self.checkpoint_path, resume)
+        self.findings = FindingStore.FindingStore(self.findings_path)
+        if pipeline:
+            self.get_nuclei_tags()  # 获取nuclei的所有标签
+            self.pipeline_scan()  # 指纹识别和漏洞扫描同时进行
+        else:
+            if self.input_file is None:
+                self.start_Ehole()  # 启动资产扫描(EHole指纹识别)
+            self.get_nuclei_tags()  # 获取nuclei的所有标签
+            self.excel_load()  # 逐行读取指纹结果
+            self.extract_data()  # 根据excel资产，来采用不同的方式调用nuclei
 
-        self.tag_scan()  # 启用标签扫描
-        self.level_scan()  # 启用高低中扫描(当前注释掉)
+            self.tag_scan()  # 启用标签扫描
+            self.level_scan()  # 启用高低中扫描(当前注释掉)
+        self.checkpoint.close()
+        print(f'[+]漏洞结果已合并到{self.findings_path}: {self.findings.summary()}')
+        self.findings.close()
         # 启动 xray + rad
         self.xray_rad()
 
@@ -75,129 +105,204 @@ class AutoNuclei():
     def start_Ehole(self):
         """
         启动EHole工具进行指纹识别
-        调用EHole.exe对targets.txt中的目标进行指纹识别，并将结果保存到wait_check.xlsx
-        使用ProcessMonitor监控EHole进程，等待其执行完成
+        调用EHole对targets.txt中的目标进行指纹识别，并将结果保存到wait_check.xlsx
+        使用ProcessMonitor等待启动的EHole进程执行完成，恢复运行时上次已完成则跳过
         """
-        cmd = 'module\\EHole\\EHole.exe finger -l targets.txt -o wait_check.xlsx'
+        if self.checkpoint.stage_done('ehole') and os.path.exists(self.target_file):
+            print('[+]指纹扫描已完成，跳过')
+            return
+        cmd = [self.ehole_path, 'finger', '-l', 'targets.txt', '-o', self.target_file]
         print('[+]正在进行指纹扫描...')
-        os.system(cmd)
-        while True:
-            status = ProcessMonitor.ProcessMonitor("EHole").main()  # 获取EHole是否执行完毕
-            if status:  # 如果执行完毕，则跳出循环
-                break
+        returncode, _ = self.run_and_wait(cmd)
+        if returncode:
+            print(f'[-]EHole执行失败，返回码: {returncode}')
+        else:
+            self.checkpoint.finish_stage('ehole')
+
+    def run_and_wait(self, cmd, timeout=None):
+        """
+        启动进程并等待其结束
+        :param cmd: 命令参数列表
+        :param timeout: 最长等待时间（秒），超时后结束进程
+        :return: (返回码, 是否超时)
+        """
+        print(' '.join(cmd))
+        try:
+            process = subprocess.Popen(cmd)
+        except OSError as e:
+            print(f'[-]启动进程失败: {e}')
+            return -1, False
+        returncode, timed_out = ProcessMonitor.ProcessMonitor(process, timeout).wait()
+        if timed_out:
+            print(f'[-]进程执行超时（{timeout}秒），已结束: {cmd[0]}')
+            process.kill()
+            process.wait()
+        return returncode, timed_out
+
+    def run_unit(self, tags, targets, cmd, output):
+        """
+        执行一个nuclei扫描单元，将结果合并到结果库，成功后记录到检查点
+        扫描失败时已输出的结果同样合并
+        :param tags: 标签列表，None表示等级扫描
+        :param targets: 目标列表
+        :param cmd: 命令参数列表
+        :param output: nuclei的JSONL输出文件
+        :return: 返回码
+        """
+        returncode, _ = self.run_and_wait(cmd)
+        if os.path.exists(output):
+            try:
+                added, duplicated = self.findings.ingest(output)
+            except (OSError, FindingStore.sqlite3.Error) as e:
+                print(f'[-]合并扫描结果失败，结果保留在{output}: {e}')
+            else:
+                os.remove(output)
+                if added or duplicated:
+                    print(f'[+]新增漏洞{added}个，重复{duplicated}个')
+        if returncode != 0:
+            print(f'[-]nuclei扫描失败，返回码: {returncode}，命令: {" ".join(cmd)}')
+        else:
+            self.checkpoint.finish_unit(tags, targets)
+        return returncode
 
     def get_nuclei_tags(self):
         """
-        从nuclei模板统计文件中获取所有可用的标签
-        读取TEMPLATES-STATS.json文件，提取其中的所有标签名称并存储到self.nuclei_tags列表中
+        从nuclei模板索引中获取所有可用的标签
+        模板索引缓存在temp目录中，模板目录未更新时不再重新解析，标签存储到self.nuclei_tags列表中
         """
-        temp = json.load(open(self.tags_file))
-        messages = temp["tags"]
-        for info in messages:
-            if info['name'] != '':  # 过滤掉空标签
-                self.nuclei_tags.append(info['name'])  # 将所有的标签储存起来
+        self.template_index = TemplateIndex.TemplateIndex(self.templates_dir)
+        self.nuclei_tags = self.template_index.tags()  # 将所有的标签储存起来
 
     def excel_load(self):
         """
-        加载并读取Excel格式的扫描结果文件
-        打开wait_check.xlsx文件，读取Sheet1中的所有数据行并存储到self.all_message列表中
-        """
-        # 读取工作簿
-        wb = load_workbook(self.target_file)  # 打开工作簿
-        # 获取sheet，获取所有sheet
-        # 获取第一张表
-        sheet = wb['Sheet1']  # 这是我们的需要的表
-        for row in sheet.iter_rows(min_row=2):  # 遍历,从第2行开始读取所有行
-            row_message = []  # 存放每一行的数据
-            for cel in row:
-                if row[0].value == None:  # 没数据了，就退出
-                    break
-                row_message.append(cel.value)  # 每一行的数据
-            self.all_message.append(row_message)
+        打开指纹结果文件，逐行读取(url, 指纹)记录
+        xlsx以只读模式读取，遇到第一个空行停止；也可以使用csv、jsonl格式的指纹结果，
+        记录在extract_data中边读边分类，不保存全部数据
+        """
+        self.records = FingerprintReader.read_records(self.input_file or self.target_file)
 
     # 对资产进行分类
     def extract_data(self):
         """
-        根据Excel中的资产数据进行分类处理
-        将目标分为两类：
-        1. 有匹配指纹标签的目标，存储到self.tags_scan_target字典(标签->目标列表)
+        根据指纹结果逐条对资产进行分类处理
+        所有标签编译为Aho-Corasick自动机，每条指纹只扫描一遍，将目标分为两类：
+        1. 有匹配指纹标签的目标，存储到self.tags_scan_target字典(标签->目标集合)
         2. 无匹配指纹标签的目标，存储到self.base_scan_target列表，后续使用高低中等级POC扫描
         """
-        # print(self.all_message)
-        temp_result = []
-        for message in self.all_message:
-            url = {}  # 存储当前目标匹配的标签和URL
-            stat = 0  # 开关，表示是否匹配到标签
-
-            if message[1] == '':  # 如果没有指纹信息
-                self.base_scan_target.append(message[0])  # 该目标后续用高低中poc来进行批量扫描
-            else:
-                # 检查目标指纹是否匹配任何nuclei标签
-                for t in self.nuclei_tags:
-                    if str(t).lower() in str(message[1]).lower():
-                        stat = 1
-                        url[t] = message[0]
-                if stat == 0:  # 一个目标，一个标签都没命中，就让其进行高低中扫描
-                    self.base_scan_target.append(message[0])  # 该目标后续用高低中poc来进行批量扫描
-            temp_result.append(url)
-
-        # 整合结果，将相同标签的目标合并到一起
-        result = {}
-        for temp in temp_result:
-            for tag in temp.keys():
-                if result.get(tag) == None:
-                    result.update({tag: []})
-                for t in temp.values():
-                    result.get(tag).append(t)
-        self.tags_scan_target = result
+        matcher = TagMatcher.TagMatcher(self.nuclei_tags)
+        self.tags_scan_target, unmatched = matcher.build_index(self.records)
+        self.base_scan_target.extend(unmatched)  # 没有指纹或一个标签都没命中的目标，后续用高低中poc来进行批量扫描
 
     def level_scan(self):
         """
         执行基于风险级别的扫描
         将self.base_scan_target中的目标写入临时文件，然后使用nuclei进行high和critical级别的漏洞扫描
-        扫描结果保存到result/level_vul_result.txt文件
-        """
-        with open(self.level_target_temp, 'a+', encoding="utf-8") as f:
-            # print(self.base_scan_target)
-            for info in self.base_scan_target:
-                f.write(info + '\n')
-        # 构建nuclei命令，使用high和critical级别的模板进行扫描
-        cmd = (f'{self.nuclei_path}'
-               f' -l {self.level_target_temp}'
-               f' -s high,critical'
-               f' -o result/level_vul_result.txt'
-               f' -stats'
-               f' -t ./nuclei-templates'
-               f' -duc')
-
-        # 等tag_scan 结束
-        status = ProcessMonitor.ProcessMonitor("nuclei").main()
-        print(cmd)
-        if status:
-            os.system(cmd)
+        扫描结果合并到结果库
+        恢复运行时只扫描检查点中还未完成的目标
+        """
+        if self.checkpoint.stage_done('level_scan'):
+            print('[+]等级扫描已完成，跳过')
+            return
+        targets = self.checkpoint.pending(None, self.base_scan_target)
+        if targets:
+            with open(self.level_target_temp, 'w', encoding="utf-8") as f:
+                for info in targets:
+                    f.write(info + '\n')
+            # 构建nuclei命令，使用high和critical级别的模板进行扫描
+            output = self.unit_output.format('level', 0, int(time.time()))
+            cmd = self.level_command(self.level_target_temp, output) + ['-stats']
+
+            # tag_scan 返回时标签扫描的nuclei进程已全部结束，直接开始
+            if self.run_unit(None, targets, cmd, output) != 0:
+                return
+        self.checkpoint.finish_stage('level_scan')
 
     def tag_scan(self):
         """
         执行基于标签的扫描
-        对self.tags_scan_target中的每个标签及其对应的目标列表，分别执行nuclei扫描
-        每个标签的扫描结果保存到单独的文件中
+        目标集合完全相同的标签合并为一组，每组写入单独的目标文件，用一次 -tags a,b,c 调用nuclei扫描，
+        各组由最多self.tag_scan_workers个nuclei进程并行执行，总耗时接近最慢的一组
+        每组的扫描结果合并到结果库
+        恢复运行时每组只扫描检查点中还未完成的目标，全部完成的组直接跳过
         """
-        # 遍历每个标签及其对应的目标列表
+        if self.checkpoint.stage_done('tag_scan'):
+            print('[+]标签扫描已完成，跳过')
+            return
+        # 按目标集合对标签分组
+        groups = {}
         for tag_name, targets in self.tags_scan_target.items():  # 解包，获取标签名，和每个标签对应的所有资产
-            with open(self.tag_target_temp, 'a+', encoding="utf-8") as f:
+            groups.setdefault(frozenset(targets), []).append(tag_name)
+
+        units = []
+        for index, (targets, tags) in enumerate(groups.items()):
+            tags = sorted(tags)
+            targets = self.checkpoint.pending(tags, sorted(targets))
+            if not targets:  # 上次已完成
+                continue
+            target_file = self.tag_target_temp.format(index)
+            with open(target_file, 'w', encoding="utf-8") as f:  # 每组单独的目标文件，不会重复扫描其他组的目标
                 for target in targets:
                     f.write(target + '\n')
-            # 构建nuclei命令，使用特定标签的模板进行扫描
-            cmd = (f'{self.nuclei_path}'
-                   f' -l {self.tag_target_temp}'
-                   f' -tags {tag_name}'
-                   f' -stats '
-                   f' -o result/tag_vul_{time.time()}.txt'
-                   f' -t ./nuclei-templates'
-                   f' -duc'
-                   )
-            print(cmd)
-            os.system(cmd)
+            # 构建nuclei命令，使用这组标签的模板进行扫描
+            output = self.unit_output.format('tag', index, int(time.time()))
+            units.append((tags, targets, self.tag_command(tags, target_file, output), output))
+
+        print(f'[+]标签扫描: {len(self.tags_scan_target)}个标签合并为{len(groups)}组，需要扫描{len(units)}组')
+        with ThreadPoolExecutor(max_workers=self.tag_scan_workers) as pool:
+            returncodes = list(pool.map(lambda unit: self.run_unit(*unit), units))
+        if not any(returncodes):
+            self.checkpoint.finish_stage('tag_scan')
+
+    def tag_command(self, tags, target_file, output):
+        """
+        构建标签扫描的nuclei命令
+        :param tags: 标签列表
+        :param target_file: 目标文件
+        :param output: JSONL结果文件
+        :return: 命令参数列表
+        """
+        return [self.nuclei_path, '-l', target_file, '-tags', ','.join(tags),
+                '-jsonl', '-o', output, '-t', self.templates_dir, '-duc']
+
+    def level_command(self, target_file, output):
+        """
+        构建等级扫描（high、critical）的nuclei命令
+        :param target_file: 目标文件
+        :param output: JSONL结果文件
+        :return: 命令参数列表
+        """
+        return [self.nuclei_path, '-l', target_file, '-s', 'high,critical',
+                '-jsonl', '-o', output, '-t', self.templates_dir, '-duc']
+
+    def pipeline_scan(self):
+        """
+        流水线扫描
+        EHole输出的每条指纹立即匹配标签，标签组合相同的目标攒批后交给nuclei，
+        指纹识别和漏洞扫描同时进行，EHole仍然将完整结果保存到wait_check.xlsx；
+        指定了input_file时从指纹结果文件逐行读取记录；
+        恢复运行时如果上次EHole已经完成，从wait_check.xlsx读取指纹，已扫描过的目标不再扫描
+        """
+        if self.checkpoint.stage_done('pipeline'):
+            print('[+]流水线扫描已完成，跳过')
+            return
+        print('[+]正在以流水线方式进行指纹扫描和漏洞扫描...')
+        if self.input_file is not None:
+            source = FingerprintReader.read_records(self.input_file)
+        elif self.checkpoint.stage_done('ehole') and os.path.exists(self.target_file):
+            source = FingerprintReader.read_records(self.target_file)
+        else:
+            source = ScanPipeline.ehole_records(
+                [self.ehole_path, 'finger', '-l', 'targets.txt', '-o', self.target_file],
+                on_success=lambda: self.checkpoint.finish_stage('ehole')
+            )
+        pipeline = ScanPipeline.ScanPipeline(
+            self, TagMatcher.TagMatcher(self.nuclei_tags),
+            batch_size=self.pipeline_batch_size, flush_interval=self.pipeline_flush_interval
+        )
+        pipeline.run(source)
+        # EHole失败或有批次失败时不记录完成，恢复运行时重新读取指纹并补扫缺少的目标
+        if pipeline.succeeded:
+            self.checkpoint.finish_stage('pipeline')
 
     def xray_rad(self):
         return None
@@ -207,4 +312,9 @@ if __name__ == '__main__':
     程序入口点
     创建AutoNuclei实例并启动扫描流程
     """
-    scan = AutoNuclei()
+    parser = argparse.ArgumentParser(description='AutoNuclei 自动化扫描工具')
+    parser.add_argument('--pipeline', action='store_true', help='指纹识别和漏洞扫描同时进行')
+    parser.add_argument('-i', '--input', help='使用已有的指纹结果文件（xlsx、csv或jsonl），不再运行EHole')
+    parser.add_argument('--resume', action='store_true', help='从检查点恢复，跳过上次已完成的扫描')
+    args = parser.parse_args()
+    scan = AutoNuclei(pipeline=args.pipeline, input_file=args.input, resume=args.resume)
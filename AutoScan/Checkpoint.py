@@ -0,0 +1,120 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+扫描检查点日志
+
+以追加方式记录已完成的阶段（EHole指纹识别、标签扫描、等级扫描）和已完成的nuclei扫描单元（标签, 目标批次），
+每条记录写入后立即刷盘，程序崩溃或被中断时已写入的记录不会丢失。
+恢复运行时读取日志，跳过已完成的阶段，扫描单元中已用全部标签扫描过的目标不再扫描，只重新扫描缺少的部分。
+
+日志为JSONL格式，每行一条记录：
+    {"type": "stage", "name": "ehole"}
+    {"type": "unit", "tags": ["apache", "tomcat"], "targets": ["http://a.com", ...]}
+等级扫描单元的tags为空列表。
+"""
+import json
+import os
+import threading
+
+LEVEL_TAG = ''  # 等级扫描单元在索引中使用的标签
+
+
+class Checkpoint():
+    """
+    Checkpoint类用于记录和查询扫描进度
+    已完成的目标按 (标签, 目标) 记录，与分组方式无关，
+    重新分组或在顺序模式和流水线模式之间切换后仍然可以正确跳过已扫描的目标
+    """
+
+    def __init__(self, path='temp/checkpoint.jsonl', resume=False):
+        """
+        初始化检查点日志
+        :param path: 日志文件路径
+        :param resume: 为True时读取已有日志继续上次的扫描，否则清空日志重新开始
+        """
+        self.path = path
+        self.lock = threading.Lock()  # 标签扫描由多个线程同时完成
+        self.stages = set()  # 已完成的阶段
+        self.scanned = {}  # 标签 -> 已扫描的目标集合
+        if resume:
+            self.load()
+            print(f'[+]从检查点恢复: 已完成阶段{sorted(self.stages) or "无"}，'
+                  f'已完成{sum(len(targets) for targets in self.scanned.values())}个(标签, 目标)扫描')
+        self.journal = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def load(self):
+        """
+        读取日志，最后一行不完整（写入时中断）时忽略该行
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('type') == 'stage':
+                    self.stages.add(record['name'])
+                elif record.get('type') == 'unit':
+                    for tag in record['tags'] or [LEVEL_TAG]:
+                        self.scanned.setdefault(tag, set()).update(record['targets'])
+
+    def write(self, record):
+        """
+        追加一条记录并刷盘
+        """
+        with self.lock:
+            self.journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def stage_done(self, name):
+        """
+        阶段是否已完成
+        """
+        return name in self.stages
+
+    def finish_stage(self, name):
+        """
+        记录阶段完成
+        """
+        self.stages.add(name)
+        self.write({'type': 'stage', 'name': name})
+
+    def target_done(self, tags, target):
+        """
+        目标是否已用全部标签扫描过
+        :param tags: 标签列表，None或空列表表示等级扫描
+        :param target: 目标
+        """
+        for tag in tags or [LEVEL_TAG]:
+            if target not in self.scanned.get(tag, ()):
+                return False
+        return True
+
+    def pending(self, tags, targets):
+        """
+        获取扫描单元中还未完成的目标
+        :param tags: 标签列表，None或空列表表示等级扫描
+        :param targets: 目标列表
+        :return: 未完成的目标列表
+        """
+        return [target for target in targets if not self.target_done(tags, target)]
+
+    def finish_unit(self, tags, targets):
+        """
+        记录扫描单元完成
+        :param tags: 标签列表，None或空列表表示等级扫描
+        :param targets: 目标列表
+        """
+        tags = sorted(tags) if tags else []
+        targets = list(targets)
+        self.write({'type': 'unit', 'tags': tags, 'targets': targets})
+
+    def close(self):
+        """
+        关闭日志文件
+        """
+        with self.lock:
+            self.journal.close()
@@ -0,0 +1,190 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+漏洞结果库
+
+每次nuclei扫描结束后将其JSONL输出合并到同一个SQLite数据库中，
+以 (template-id, matched-at) 的哈希去重，并按主机、风险等级、模板建立索引，
+查询某个主机或某个等级的漏洞不再需要grep大量结果文件。
+
+命令行查询示例:
+    python FindingStore.py --severity critical,high
+    python FindingStore.py --host example.com
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+SEVERITY_ORDER = ['critical', 'high', 'medium', 'low', 'info', 'unknown']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS findings (
+    id TEXT PRIMARY KEY,
+    template_id TEXT NOT NULL,
+    matched_at TEXT NOT NULL,
+    host TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    name TEXT,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_findings_host ON findings (host);
+CREATE INDEX IF NOT EXISTS idx_findings_severity ON findings (severity, host);
+CREATE INDEX IF NOT EXISTS idx_findings_template ON findings (template_id);
+'''
+
+
+def finding_host(result):
+    """
+    获取结果对应的主机名（小写，不含协议和端口）
+    :param result: nuclei的一条JSON结果
+    """
+    value = str(result.get('host') or result.get('matched-at') or '').strip()
+    if '://' in value:
+        return (urlsplit(value).hostname or '').lower()
+    value = value.split('/', 1)[0]
+    if value.startswith('['):  # IPv6地址
+        return value[1:].split(']', 1)[0].lower()
+    if value.count(':') == 1:
+        value = value.split(':', 1)[0]
+    return value.lower()
+
+
+def finding_id(template_id, matched_at):
+    """
+    计算去重用的结果ID
+    """
+    return hashlib.sha1(f'{template_id}\0{matched_at}'.encode('utf-8')).hexdigest()
+
+
+class FindingStore():
+    """
+    FindingStore类用于合并、去重和查询nuclei扫描结果
+    多个nuclei进程的结果由不同线程写入，写入时共用一个连接并加锁
+    """
+
+    def __init__(self, path='result/findings.db'):
+        """
+        打开（不存在时创建）结果库
+        :param path: 数据库文件路径
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def ingest(self, path):
+        """
+        将一个nuclei JSONL结果文件合并到结果库
+        :param path: nuclei的-jsonl输出文件
+        :return: (新增结果数, 重复结果数)
+        """
+        now = int(time.time())
+        rows = []
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(result, dict):
+                    continue
+                template_id = str(result.get('template-id') or '')
+                matched_at = str(result.get('matched-at') or result.get('host') or '')
+                if not template_id or not matched_at:
+                    continue
+                info = result.get('info') or {}
+                severity = str(info.get('severity') or 'unknown').lower()
+                rows.append((finding_id(template_id, matched_at), template_id, matched_at, finding_host(result),
+                             severity, info.get('name'), now, now, line))
+
+        with self.lock, self.conn:
+            # 先插入新结果，再更新重复结果的last_seen，新增数即插入语句改变的行数
+            before = self.conn.total_changes
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO findings '
+                '(id, template_id, matched_at, host, severity, name, first_seen, last_seen, raw) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            added = self.conn.total_changes - before
+            if added < len(rows):
+                self.conn.executemany('UPDATE findings SET last_seen = ? WHERE id = ? AND last_seen < ?',
+                                      [(now, row[0], now) for row in rows])
+        return added, len(rows) - added
+
+    def query(self, host=None, severity=None, template_id=None, limit=None):
+        """
+        查询结果
+        :param host: 主机名
+        :param severity: 风险等级列表
+        :param template_id: 模板ID
+        :param limit: 最多返回的条数
+        :return: nuclei原始JSON结果列表，按风险等级从高到低排序
+        """
+        conditions, params = [], []
+        if host:
+            conditions.append('host = ?')
+            params.append(host.lower())
+        if severity:
+            conditions.append('severity IN (%s)' % ','.join('?' * len(severity)))
+            params.extend(level.lower() for level in severity)
+        if template_id:
+            conditions.append('template_id = ?')
+            params.append(template_id)
+        sql = 'SELECT raw FROM findings'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        order = ' '.join(f"WHEN '{level}' THEN {index}" for index, level in enumerate(SEVERITY_ORDER))
+        sql += f' ORDER BY CASE severity {order} ELSE {len(SEVERITY_ORDER)} END, host, template_id'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(raw) for raw, in rows]
+
+    def summary(self):
+        """
+        统计各风险等级的结果数
+        :return: 风险等级 -> 结果数
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT severity, COUNT(*) FROM findings GROUP BY severity').fetchall()
+        counts = dict(rows)
+        return {level: counts[level] for level in SEVERITY_ORDER + sorted(set(counts) - set(SEVERITY_ORDER))
+                if level in counts}
+
+    def close(self):
+        """
+        关闭数据库连接
+        """
+        with self.lock:
+            self.conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='查询AutoScan漏洞结果库')
+    parser.add_argument('--db', default='result/findings.db', help='结果库路径')
+    parser.add_argument('--host', help='主机名')
+    parser.add_argument('--severity', help='风险等级，多个用逗号分隔')
+    parser.add_argument('--template', help='模板ID')
+    parser.add_argument('--limit', type=int, help='最多显示的条数')
+    args = parser.parse_args()
+
+    store = FindingStore(args.db)
+    severity = [level.strip() for level in args.severity.split(',') if level.strip()] if args.severity else None
+    for result in store.query(args.host, severity, args.template, args.limit):
+        info = result.get('info') or {}
+        print(f"[{info.get('severity', 'unknown')}] [{result.get('template-id')}] {result.get('matched-at')}")
+    print(f'[+]共{sum(store.summary().values())}条结果: {store.summary()}')
+    store.close()
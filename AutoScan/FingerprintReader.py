@@ -0,0 +1,102 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+指纹结果读取
+
+逐行读取指纹识别结果，生成(url, 指纹)记录，内存占用与资产数量无关。
+支持以下格式（按扩展名区分）：
+    .xlsx  EHole输出的工作簿，读取Sheet1（不存在时读取第一张表），第1列为url，第2列为指纹，第1行为表头
+    .csv   第1列为url，第2列为指纹，第1行为表头
+    .jsonl 每行一个JSON对象，url取url/target字段，指纹取cms/fingerprint字段
+遇到第一个url为空的行时停止读取（jsonl格式跳过空行）。
+"""
+import csv
+import json
+import os
+import sys
+
+from openpyxl import load_workbook
+
+URL_KEYS = ('url', 'target')
+FINGERPRINT_KEYS = ('cms', 'fingerprint')
+
+
+def read_records(path):
+    """
+    按扩展名选择读取方式
+    :param path: 指纹结果文件
+    :return: 生成(url, 指纹)的生成器
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return read_csv(path)
+    if ext in ('.jsonl', '.json'):
+        return read_jsonl(path)
+    return read_excel(path)
+
+
+def compact(url, fingerprint):
+    """
+    生成精简的记录，相同的指纹字符串只保留一份
+    :return: (url, 指纹)，url为空时返回None
+    """
+    url = str(url).strip() if url is not None else ''
+    if url == '':
+        return None
+    fingerprint = str(fingerprint).strip() if fingerprint is not None else ''
+    return url, sys.intern(fingerprint)
+
+
+def read_excel(path):
+    """
+    以只读模式逐行读取工作簿，不构建完整的单元格对象
+    """
+    wb = load_workbook(path, read_only=True)
+    try:
+        sheet = wb['Sheet1'] if 'Sheet1' in wb.sheetnames else wb.worksheets[0]
+        for row in sheet.iter_rows(min_row=2, max_col=2, values_only=True):
+            record = compact(row[0] if row else None, row[1] if len(row) > 1 else None)
+            if record is None:  # 没数据了，就退出
+                break
+            yield record
+    finally:
+        wb.close()  # 只读模式需要手动关闭文件
+
+
+def read_csv(path):
+    """
+    逐行读取CSV文件
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # 跳过表头
+        for row in reader:
+            record = compact(row[0] if row else None, row[1] if len(row) > 1 else None)
+            if record is None:
+                break
+            yield record
+
+
+def read_jsonl(path):
+    """
+    逐行读取JSONL文件，无法解析的行会被跳过
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if line == '':
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                print(f'[-]第{number}行不是有效的JSON，已跳过')
+                continue
+            if not isinstance(item, dict):
+                continue
+            url = next((item[key] for key in URL_KEYS if item.get(key)), None)
+            fingerprint = next((item[key] for key in FINGERPRINT_KEYS if item.get(key)), None)
+            if isinstance(fingerprint, list):
+                fingerprint = ','.join(str(value) for value in fingerprint)
+            record = compact(url, fingerprint)
+            if record is not None:
+                yield record
@@ -3,98 +3,142 @@
 """
 进程监控模块
 
-该模块提供跨平台的进程监控功能，支持Windows和Linux操作系统
-主要用于监控指定名称的进程是否在运行，可用于等待某个进程执行完成
+该模块用于等待本程序启动的子进程执行完成，并返回退出码
+只等待指定的进程（subprocess.Popen对象或PID），不按进程名匹配，主机上其他同名进程不会影响等待结果
+
+Linux下通过pidfd（内核5.3+）或waitpid在进程退出时立即返回，不轮询进程列表；
+其他系统或无法使用pidfd时使用psutil.wait_procs
 
 使用示例:
-    monitor = ProcessMonitor("process_name")
-    status = monitor.main()  # 当进程结束时返回1
+    process = subprocess.Popen(cmd)
+    monitor = ProcessMonitor(process, timeout=3600)
+    returncode, timed_out = monitor.wait()
 """
 
-import psutil
-import subprocess
+import os
 import platform
-import time
+import select
+import subprocess
+
+import psutil
 
 
 class ProcessMonitor():
     """
     进程监控类
-    用于监控指定名称的进程是否在运行
-    支持Windows和Linux两种操作系统
+    用于等待指定的子进程结束
     """
-    
-    def __init__(self, processname):
+
+    def __init__(self, process, timeout=None):
         """
         初始化ProcessMonitor实例
-        
+
         参数:
-            processname (str): 要监控的进程名称
+            process (subprocess.Popen | int): 要等待的进程对象或PID
+            timeout (float): 最长等待时间（秒），None表示一直等待
         """
-        self.processname = processname
-        
-    def main(self):
+        self.process = process
+        self.timeout = timeout
+
+    def wait(self):
         """
-        主方法，启动进程监控
-        
+        等待进程结束
+
         返回:
-            int: 当监控的进程结束时返回1
+            tuple: (退出码, 是否超时)，超时时退出码为None；
+                   等待的不是本进程的子进程时无法获取退出码，退出码为None
         """
-        status = self.check_system()
-        return status
-        
-    def check_system(self):
+        if isinstance(self.process, subprocess.Popen):
+            pid = self.process.pid
+        else:
+            pid = int(self.process)
+
+        if platform.system().lower() == 'linux':
+            result = self.linux_wait(pid)
+            if result is not None:
+                return result
+        return self.psutil_wait(pid)
+
+    def linux_wait(self, pid):
         """
-        检查当前操作系统类型，调用相应的监控方法
-        
+        Linux系统下等待进程结束
+        不限时等待子进程时直接阻塞在waitpid上；限时等待时阻塞在pidfd上，进程退出时pidfd变为可读
+
         返回:
-            int: 当监控的进程结束时返回1
+            tuple: (退出码, 是否超时)，无法使用pidfd时返回None
         """
-        plat = platform.system().lower()
-        if plat == 'windows':
-            return self.win_process()
-        elif plat == 'linux':
-            return self.linux_process()
+        if self.timeout is None:
+            try:
+                return self.reap(pid, 0), False
+            except ChildProcessError:
+                pass  # 不是本进程的子进程，改用pidfd等待
+
+        if not hasattr(os, 'pidfd_open'):  # Python 3.9+
+            return None
+        try:
+            fd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            # 进程已退出（子进程已被回收或从未存在）
+            return self.reap_nowait(pid), False
+        except OSError:
+            return None  # 内核不支持pidfd
+
+        try:
+            poller = select.poll()
+            poller.register(fd, select.POLLIN)
+            ready = poller.poll(None if self.timeout is None else self.timeout * 1000)
+        finally:
+            os.close(fd)
+        if not ready:
+            return None, True
+        return self.reap_nowait(pid), False
 
-    def win_process(self):
+    def reap(self, pid, options):
         """
-        Windows系统下的进程监控实现
-        通过psutil模块获取进程列表并监控指定进程
-        
+        回收子进程并获取退出码
+
         返回:
-            int: 当监控的进程结束时返回1
+            int: 退出码（被信号结束时为负的信号值），进程未结束时返回None
         """
-        # print("[+]这是windows系统")
-        while True:
-            start_pl = psutil.pids()
-            time.sleep(1)
-            for pid in start_pl:
-                if self.processname not in psutil.Process(pid).name():  # 看我们监控的进程名是否在进程列表里
-                    # print("[+]程序执行完毕")
-                    return 1  # 进程执行完毕
-
-    # linux进程监控
-    def linux_process(self):
+        if isinstance(self.process, subprocess.Popen):
+            # 由Popen回收，保证Popen.returncode与实际退出码一致
+            if options == 0:
+                return self.process.wait()
+            return self.process.poll()
+        waited_pid, status = os.waitpid(pid, options)
+        if waited_pid == 0:
+            return None
+        return os.waitstatus_to_exitcode(status)
+
+    def reap_nowait(self, pid):
         """
-        Linux系统下的进程监控实现
-        通过ps命令获取进程列表并监控指定进程
-        
+        进程已退出后获取退出码
+
         返回:
-            int: 当监控的进程结束时返回1
+            int: 退出码，不是本进程的子进程时返回None
         """
-        # print("[+]这是linux系统")
-        while True:
-            cmd = "ps -aux | grep {} ".format(self.processname) + "| grep -v grep | awk '{print $2}'"
-            start_rsp = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-            time.sleep(1)
-            end_rsp = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-            if len(start_rsp.stdout.read().strip()) != 0:
-                # print("[+]程序正在执行中...")
-                if len(end_rsp.stdout.read().strip()) == 0:
-                    # print("[+]程序执行完毕")
-                    return 1
-
-
-
+        try:
+            return self.reap(pid, os.WNOHANG)
+        except ChildProcessError:
+            return None
 
+    def psutil_wait(self, pid):
+        """
+        通过psutil等待进程结束（Windows、macOS或无法使用pidfd时）
 
+        返回:
+            tuple: (退出码, 是否超时)
+        """
+        if isinstance(self.process, subprocess.Popen):
+            try:
+                return self.process.wait(self.timeout), False
+            except subprocess.TimeoutExpired:
+                return None, True
+        try:
+            process = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            return None, False
+        gone, alive = psutil.wait_procs([process], timeout=self.timeout)
+        if alive:
+            return None, True
+        return gone[0].returncode, False
@@ -0,0 +1,212 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式扫描流水线
+
+EHole边识别边输出指纹，指纹记录经过标签匹配后立即按标签组合攒批，每批目标交给nuclei扫描，
+指纹识别和漏洞扫描同时进行，总耗时接近最慢的一个阶段而不是各阶段之和。
+阶段之间使用有界队列，nuclei处理不过来时标签匹配和EHole输出的读取随之暂停（背压）。
+
+    EHole stdout -> 记录队列 -> 标签匹配/攒批 -> 任务队列 -> nuclei进程池
+"""
+import queue
+import re
+import subprocess
+import threading
+import time
+
+ANSI_PATTERN = re.compile(r'\x1b\[[0-9;]*m')
+
+STOP = None  # 队列结束标记
+
+
+def parse_ehole_line(line):
+    """
+    解析EHole finger的一行输出
+    输出格式为 [ url | cms | server | statuscode | length | title ]
+    :param line: 一行输出
+    :return: (url, 指纹)，不是指纹记录时返回None
+    """
+    line = ANSI_PATTERN.sub('', line).strip()
+    if not (line.startswith('[') and line.endswith(']')):
+        return None
+    parts = [part.strip() for part in line[1:-1].split(' | ')]
+    if len(parts) < 2 or '://' not in parts[0]:
+        return None
+    return parts[0], parts[1]
+
+
+class ScanPipeline():
+    """
+    ScanPipeline类用于流式执行指纹识别和漏洞扫描
+    标签组合相同的目标攒成一批，批次达到batch_size或flush_interval秒内没有新目标时交给nuclei，
+    没有匹配标签的目标按同样方式攒批，使用high、critical等级的模板扫描
+    """
+
+    def __init__(self, scan, matcher, batch_size=200, flush_interval=30, queue_size=1000):
+        """
+        :param scan: AutoNuclei实例，提供nuclei命令和进程执行
+        :param matcher: TagMatcher实例
+        :param batch_size: 每批最多的目标数
+        :param flush_interval: 批次多久没有新目标时提前提交（秒）
+        :param queue_size: 记录队列长度
+        """
+        self.scan = scan
+        self.matcher = matcher
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records = queue.Queue(maxsize=queue_size)  # 指纹记录
+        self.jobs = queue.Queue(maxsize=scan.tag_scan_workers)  # 待执行的nuclei批次
+        self.batches = {}  # 标签组合（None表示等级扫描） -> [目标列表, 最后加入时间]
+        self.batch_count = 0
+        self.skipped = 0  # 检查点中已扫描过而跳过的目标数
+        self.failed = []  # 执行失败的批次
+        self.source_error = None  # 读取指纹记录失败（如EHole执行失败）时的错误信息
+
+    def run(self, source):
+        """
+        运行流水线直到所有批次扫描完成
+        :param source: 生成(url, 指纹)记录的可迭代对象
+        """
+        workers = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.scan.tag_scan_workers)]
+        for worker in workers:
+            worker.start()
+        reader = threading.Thread(target=self.read, args=(source,), daemon=True)
+        reader.start()
+
+        self.classify()
+        for _ in workers:
+            self.jobs.put(STOP)
+        for worker in workers:
+            worker.join()
+        print(f'[+]流水线扫描完成，共{self.batch_count}批，失败{len(self.failed)}批，跳过已扫描的目标{self.skipped}个')
+        if self.source_error is not None:
+            print(f'[-]指纹记录未能完整读取: {self.source_error}')
+
+    @property
+    def succeeded(self):
+        """
+        指纹记录全部读取完成且所有批次都扫描成功
+        """
+        return self.source_error is None and not self.failed
+
+    def read(self, source):
+        """
+        读取阶段：将指纹记录放入记录队列，队列满时等待
+        读取失败时记录错误，已读取的记录照常扫描
+        """
+        try:
+            for record in source:
+                self.records.put(record)
+        except Exception as e:
+            self.source_error = str(e) or type(e).__name__
+        finally:
+            self.records.put(STOP)
+
+    def classify(self):
+        """
+        标签匹配阶段：为每个目标匹配标签并加入对应的批次，批次满或空闲超时时提交
+        检查点中已用全部标签扫描过的目标直接跳过
+        """
+        while True:
+            try:
+                record = self.records.get(timeout=1)
+            except queue.Empty:
+                self.flush_idle()
+                continue
+            if record is STOP:
+                break
+            url, fingerprint = record
+            tags = self.matcher.match(fingerprint) if fingerprint else None
+            key = frozenset(tags) if tags else None
+            if self.scan.checkpoint.target_done(tags, url):
+                self.skipped += 1
+                continue
+            batch = self.batches.setdefault(key, [[], 0])
+            batch[0].append(url)
+            batch[1] = time.time()
+            if len(batch[0]) >= self.batch_size:
+                self.submit(key)
+            self.flush_idle()
+
+        for key in list(self.batches):
+            self.submit(key)
+
+    def flush_idle(self):
+        """
+        提交空闲超过flush_interval秒的批次
+        """
+        now = time.time()
+        for key, (targets, updated) in list(self.batches.items()):
+            if targets and now - updated >= self.flush_interval:
+                self.submit(key)
+
+    def submit(self, key):
+        """
+        将一个批次交给nuclei进程池，所有进程忙时等待
+        """
+        targets = self.batches.pop(key, [[], 0])[0]
+        if not targets:
+            return
+        index = self.batch_count
+        self.batch_count += 1
+        tags = sorted(key) if key is not None else None
+        self.jobs.put((index, tags, targets))
+
+    def worker(self):
+        """
+        扫描阶段：执行nuclei批次
+        单个批次出错时记为失败并继续取下一批，任务队列不会因为工作线程退出而阻塞
+        """
+        while True:
+            job = self.jobs.get()
+            if job is STOP:
+                return
+            index, tags, targets = job
+            try:
+                if self.run_batch(index, tags, targets) != 0:
+                    self.failed.append(index)
+            except Exception as e:
+                print(f'[-]第{index}批扫描出错: {str(e)}')
+                self.failed.append(index)
+
+    def run_batch(self, index, tags, targets):
+        """
+        写入批次的目标文件并执行nuclei
+        :return: nuclei的返回码
+        """
+        target_file = self.scan.tag_target_temp.format(f'pipeline_{index}')
+        with open(target_file, 'w', encoding='utf-8') as f:
+            for target in targets:
+                f.write(target + '\n')
+        if tags is None:
+            output = self.scan.unit_output.format('level', index, int(time.time()))
+            cmd = self.scan.level_command(target_file, output)
+        else:
+            output = self.scan.unit_output.format('tag', index, int(time.time()))
+            cmd = self.scan.tag_command(tags, target_file, output)
+        return self.scan.run_unit(tags, targets, cmd, output)
+
+
+def ehole_records(cmd, on_success=None):
+    """
+    启动EHole并逐行读取输出中的指纹记录
+    :param cmd: EHole命令参数列表
+    :param on_success: EHole正常退出后调用的函数
+    :return: 生成(url, 指纹)的生成器；EHole无法启动或返回码不为0时抛出异常
+    """
+    print(' '.join(cmd))
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               encoding='utf-8', errors='replace', bufsize=1)
+    try:
+        for line in process.stdout:
+            record = parse_ehole_line(line)
+            if record is not None:
+                yield record
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode:
+        raise RuntimeError(f'EHole执行失败，返回码: {returncode}')
+    if on_success is not None:
+        on_success()
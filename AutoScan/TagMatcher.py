@@ -0,0 +1,131 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+指纹标签匹配
+
+将nuclei的所有标签编译为Aho-Corasick自动机，对每条指纹只扫描一遍即可找出其中出现的全部标签，
+匹配规则与逐个标签做子串判断相同（不区分大小写）。
+"""
+import re
+from collections import OrderedDict
+
+CACHE_SIZE = 65536  # 缓存的指纹片段数上限
+
+
+class TagMatcher():
+    """
+    TagMatcher类用于在指纹字符串中查找nuclei标签
+    自动机只构建一次。标签不可能跨越标签中从未出现的字符（如逗号、空格），
+    指纹按这些字符拆分为片段后分别匹配，相同的片段只匹配一次
+    """
+
+    def __init__(self, tags, cache_size=CACHE_SIZE):
+        """
+        将标签编译为自动机
+        :param tags: nuclei标签列表
+        :param cache_size: 缓存的指纹片段数上限，超过后淘汰最久未使用的片段
+        """
+        self.goto = [{}]  # 每个状态的转移: 字符 -> 状态
+        self.fail = [0]  # 每个状态的失败转移
+        self.output = [()]  # 到达每个状态时匹配到的标签
+        self.cache = OrderedDict()  # 指纹片段 -> 匹配到的标签集合（LRU）
+        self.cache_size = cache_size
+        alphabet = set()
+
+        for tag in tags:
+            tag = str(tag).lower()
+            if tag == '':  # 过滤掉空标签
+                continue
+            alphabet.update(tag)
+            state = 0
+            for ch in tag:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            if tag not in self.output[state]:
+                self.output[state] = self.output[state] + (tag,)
+        self.build_fail()
+        # 按标签中未出现的字符拆分指纹
+        self.splitter = re.compile('[^' + ''.join(re.escape(ch) for ch in sorted(alphabet)) + ']+') if alphabet else None
+
+    def build_fail(self):
+        """
+        按广度优先顺序计算失败转移，并合并失败状态上的匹配结果
+        """
+        queue = list(self.goto[0].values())
+        index = 0
+        while index < len(queue):
+            state = queue[index]
+            index += 1
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and ch not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(ch, 0)
+                if fail == next_state:
+                    fail = 0
+                self.fail[next_state] = fail
+                if self.output[fail]:
+                    self.output[next_state] = self.output[next_state] + self.output[fail]
+
+    def match(self, text):
+        """
+        查找指纹中出现的全部标签
+        :param text: 指纹字符串
+        :return: 标签集合
+        """
+        if self.splitter is None:
+            return set()
+        result = set()
+        for segment in self.splitter.split(str(text).lower()):
+            if segment:
+                result |= self.match_segment(segment)
+        return result
+
+    def match_segment(self, segment):
+        """
+        用自动机扫描一个指纹片段
+        :param segment: 只包含标签字符的片段
+        :return: 标签集合
+        """
+        result = self.cache.get(segment)
+        if result is not None:
+            self.cache.move_to_end(segment)
+            return result
+
+        goto, fail, output = self.goto, self.fail, self.output
+        result = set()
+        state = 0
+        for ch in segment:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                result.update(output[state])
+        self.cache[segment] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    def build_index(self, rows):
+        """
+        构建标签到目标的倒排索引
+        :param rows: (目标, 指纹)列表
+        :return: (标签 -> 目标集合, 没有匹配到任何标签的目标列表)
+        """
+        index = {}
+        unmatched = []
+        for target, fingerprint in rows:
+            tags = self.match(fingerprint) if fingerprint else ()
+            if not tags:
+                unmatched.append(target)
+                continue
+            for tag in tags:
+                index.setdefault(tag, set()).add(target)
+        return index, unmatched
@@ -0,0 +1,49 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+nuclei模板索引
+
+扫描nuclei-templates目录，记录 标签->模板ID、风险等级->模板ID、模板ID->路径 的映射，
+并以压缩的二进制文件缓存，模板目录未更新时直接读取缓存，不再每次解析TEMPLATES-STATS.json和模板文件。
+索引的构建和缓存与AssetCollection服务共用仓库根目录的easm_common包（在仓库根目录执行 pip install -e . 安装）。
+"""
+from easm_common import nuclei_templates
+
+
+class TemplateIndex():
+    """
+    TemplateIndex类用于构建和缓存nuclei模板索引
+    统计文件、校验和文件以及全部模板文件的修改时间组成签名，
+    签名与缓存文件中的一致时直接使用缓存，否则重新扫描模板目录
+    """
+
+    def __init__(self, template_dir, cache_path='temp/template_index.bin'):
+        """
+        初始化模板索引并加载
+        :param template_dir: nuclei-templates目录
+        :param cache_path: 索引缓存文件路径
+        """
+        self.template_dir = template_dir
+        self.cache_path = cache_path
+        self.paths = {}  # 模板ID -> 相对模板目录的路径
+        self.tag_index = {}  # 标签 -> 模板ID列表
+        self.severity_index = {}  # 风险等级 -> 模板ID列表
+        self.load()
+
+    def load(self):
+        """
+        加载索引，缓存有效时直接读取，否则重新构建并写入缓存
+        """
+        signature = nuclei_templates.signature(self.template_dir)
+        if signature is None:
+            print(f'[-]模板目录不存在: {self.template_dir}')
+            return
+        _, data = nuclei_templates.load(self.template_dir, self.cache_path, signature)
+        self.paths, self.tag_index, self.severity_index = data
+
+    def tags(self):
+        """
+        获取所有标签
+        :return: 标签列表
+        """
+        return list(self.tag_index)
@@ -0,0 +1,12 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：将AutoScan目录和仓库根目录加入导入路径
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 未安装easm_common包时直接从仓库根目录导入
+sys.path.append(os.path.dirname(ROOT))
@@ -0,0 +1,90 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+扫描检查点日志：记录完成的阶段和扫描单元，恢复时跳过已扫描的(标签, 目标)
+"""
+import json
+
+from Checkpoint import LEVEL_TAG, Checkpoint
+
+
+def read_journal(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_are_written_immediately(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = Checkpoint(path)
+    checkpoint.finish_stage('ehole')
+    checkpoint.finish_unit(['tomcat', 'apache'], ['http://a', 'http://b'])
+    checkpoint.finish_unit(None, ['http://c'])
+    # 不关闭文件，已写入的记录也能读出
+    assert read_journal(path) == [
+        {'type': 'stage', 'name': 'ehole'},
+        {'type': 'unit', 'tags': ['apache', 'tomcat'], 'targets': ['http://a', 'http://b']},
+        {'type': 'unit', 'tags': [], 'targets': ['http://c']},
+    ]
+    assert checkpoint.stage_done('ehole')
+    checkpoint.close()
+
+
+def test_resume_skips_scanned_targets(tmp_path, capsys):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = Checkpoint(path)
+    checkpoint.finish_stage('ehole')
+    checkpoint.finish_unit(['apache', 'tomcat'], ['http://a', 'http://b'])
+    checkpoint.finish_unit(['php'], ['http://a'])
+    checkpoint.finish_unit([], ['http://c'])
+    checkpoint.close()
+
+    resumed = Checkpoint(path, resume=True)
+    assert '已完成6个(标签, 目标)扫描' in capsys.readouterr().out
+    assert resumed.stage_done('ehole')
+    assert not resumed.stage_done('tag')
+    assert resumed.scanned[LEVEL_TAG] == {'http://c'}
+
+    # 按(标签, 目标)判断，与分组方式无关
+    assert resumed.pending(['apache'], ['http://a', 'http://b', 'http://d']) == ['http://d']
+    assert resumed.pending(['apache', 'php'], ['http://a', 'http://b']) == ['http://b']
+    assert resumed.pending(None, ['http://a', 'http://c']) == ['http://a']
+    assert resumed.target_done([], 'http://c')
+
+    # 恢复后继续追加
+    resumed.finish_stage('tag')
+    resumed.close()
+    assert Checkpoint(path, resume=True).stages == {'ehole', 'tag'}
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = tmp_path / 'checkpoint.jsonl'
+    path.write_text(
+        json.dumps({'type': 'stage', 'name': 'ehole'}) + '\n'
+        + json.dumps({'type': 'unit', 'tags': ['apache'], 'targets': ['http://a']}) + '\n'
+        + '{"type": "unit", "tags": ["php"], "targ',
+        encoding='utf-8'
+    )
+    checkpoint = Checkpoint(str(path), resume=True)
+    assert checkpoint.stages == {'ehole'}
+    assert checkpoint.scanned == {'apache': {'http://a'}}
+    checkpoint.close()
+
+
+def test_start_without_resume_clears_journal(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = Checkpoint(path)
+    checkpoint.finish_stage('ehole')
+    checkpoint.close()
+
+    fresh = Checkpoint(path)
+    assert fresh.stages == set()
+    fresh.close()
+    assert read_journal(path) == []
+    assert Checkpoint(path, resume=True).stages == set()
+
+
+def test_resume_without_journal(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.jsonl'), resume=True)
+    assert checkpoint.stages == set()
+    assert checkpoint.pending(['apache'], ['http://a']) == ['http://a']
+    checkpoint.close()
@@ -0,0 +1,111 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+漏洞结果库：合并nuclei输出、按(template-id, matched-at)去重和查询
+"""
+import json
+
+import pytest
+
+import FindingStore as finding_store
+from FindingStore import FindingStore, finding_host
+
+
+def result(template_id, matched_at, severity='info', host=None):
+    item = {'template-id': template_id, 'matched-at': matched_at, 'info': {'name': template_id, 'severity': severity}}
+    if host is not None:
+        item['host'] = host
+    return item
+
+
+def write_output(path, items, extra_lines=()):
+    with open(path, 'w', encoding='utf-8') as f:
+        for item in items:
+            f.write(json.dumps(item) + '\n')
+        for line in extra_lines:
+            f.write(line + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FindingStore(str(tmp_path / 'findings.db'))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize('item, expected', [
+    ({'host': 'https://Example.com:8443', 'matched-at': 'https://example.com:8443/x'}, 'example.com'),
+    ({'matched-at': 'http://a.com/path'}, 'a.com'),
+    ({'host': 'B.com:443'}, 'b.com'),
+    ({'host': 'c.com/path'}, 'c.com'),
+    ({'host': '[2001:DB8::1]:80'}, '2001:db8::1'),
+    ({'host': '2001:db8::1'}, '2001:db8::1'),
+    ({'host': '10.0.0.1'}, '10.0.0.1'),
+    ({}, ''),
+])
+def test_finding_host(item, expected):
+    assert finding_host(item) == expected
+
+
+def test_ingest_counts_new_and_duplicate_findings(store, tmp_path, monkeypatch):
+    first = write_output(tmp_path / 'first.jsonl', [
+        result('tomcat-detect', 'http://a.com'),
+        result('CVE-2021-0001', 'http://a.com/x', 'critical'),
+        result('tomcat-detect', 'http://a.com'),  # 同一文件中的重复结果
+    ], extra_lines=['', 'not json', '[1, 2]', json.dumps({'template-id': 'no-location'})])
+    monkeypatch.setattr(finding_store.time, 'time', lambda: 1000)
+    assert store.ingest(first) == (2, 1)
+
+    second = write_output(tmp_path / 'second.jsonl', [
+        result('tomcat-detect', 'http://a.com'),
+        result('CVE-2021-0001', 'http://b.com/x', 'high'),
+    ])
+    monkeypatch.setattr(finding_store.time, 'time', lambda: 2000)
+    assert store.ingest(second) == (1, 1)
+    assert store.ingest(second) == (0, 2)
+
+    rows = dict(store.conn.execute('SELECT matched_at || template_id, first_seen || ":" || last_seen FROM findings'))
+    assert rows == {
+        'http://a.comtomcat-detect': '1000:2000',
+        'http://a.com/xCVE-2021-0001': '1000:1000',
+        'http://b.com/xCVE-2021-0001': '2000:2000',
+    }
+
+
+def test_query_and_summary(store, tmp_path):
+    store.ingest(write_output(tmp_path / 'out.jsonl', [
+        result('tech-detect', 'http://b.com', 'info'),
+        result('exposed-panel', 'http://a.com/admin', 'Medium'),
+        result('CVE-2021-0001', 'http://b.com/x', 'critical'),
+        result('CVE-2021-0002', 'http://a.com/y', 'high'),
+        result('custom', 'http://a.com/z', 'weird'),
+        {'template-id': 'no-info', 'host': 'http://c.com'},
+    ]))
+
+    def ids(**kwargs):
+        return [item['template-id'] for item in store.query(**kwargs)]
+
+    assert ids() == ['CVE-2021-0001', 'CVE-2021-0002', 'exposed-panel', 'tech-detect', 'no-info', 'custom']
+    assert ids(host='A.com') == ['CVE-2021-0002', 'exposed-panel', 'custom']
+    assert ids(severity=['HIGH', 'critical']) == ['CVE-2021-0001', 'CVE-2021-0002']
+    assert ids(host='b.com', severity=['info']) == ['tech-detect']
+    assert ids(template_id='exposed-panel') == ['exposed-panel']
+    assert ids(limit=2) == ['CVE-2021-0001', 'CVE-2021-0002']
+    assert store.query(host='missing.com') == []
+    assert list(store.summary().items()) == [
+        ('critical', 1), ('high', 1), ('medium', 1), ('info', 1), ('unknown', 1), ('weird', 1)
+    ]
+
+
+def test_reopen_keeps_findings(tmp_path):
+    path = str(tmp_path / 'findings.db')
+    output = write_output(tmp_path / 'out.jsonl', [result('tech-detect', 'http://a.com')])
+    store = FindingStore(path)
+    assert store.ingest(output) == (1, 0)
+    store.close()
+
+    store = FindingStore(path)
+    assert store.ingest(output) == (0, 1)
+    assert store.summary() == {'info': 1}
+    store.close()
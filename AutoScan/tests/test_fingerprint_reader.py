@@ -0,0 +1,82 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+指纹结果读取：xlsx、csv、jsonl三种格式生成相同的(url, 指纹)记录
+"""
+import json
+
+import pytest
+from openpyxl import Workbook
+
+from FingerprintReader import read_records
+
+ROWS = [
+    ('http://a.com', 'Apache,PHP'),
+    ('https://b.com:8443', ''),
+    (' http://c.com ', ' nginx '),
+]
+EXPECTED = [
+    ('http://a.com', 'Apache,PHP'),
+    ('https://b.com:8443', ''),
+    ('http://c.com', 'nginx'),
+]
+
+
+def write_excel(path, rows, sheet='Sheet1'):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = sheet
+    ws.append(['url', 'cms', 'server'])
+    for row in rows:
+        ws.append(list(row) + ['ignored'])
+    wb.save(path)
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write('url,cms\n')
+        for url, fingerprint in rows:
+            f.write(f'{url},"{fingerprint}"\n')
+
+
+@pytest.mark.parametrize('sheet', ['Sheet1', 'results'])
+def test_excel(tmp_path, sheet):
+    path = str(tmp_path / 'fingerprint.xlsx')
+    write_excel(path, ROWS + [(None, 'after-empty'), ('http://d.com', 'skipped')], sheet)
+    assert list(read_records(path)) == EXPECTED
+
+
+def test_csv(tmp_path):
+    path = str(tmp_path / 'fingerprint.CSV')
+    write_csv(path, ROWS + [('', 'after-empty'), ('http://d.com', 'skipped')])
+    assert list(read_records(path)) == EXPECTED
+
+
+def test_csv_short_rows(tmp_path):
+    path = tmp_path / 'fingerprint.csv'
+    path.write_text('url\nhttp://a.com\n', encoding='utf-8')
+    assert list(read_records(str(path))) == [('http://a.com', '')]
+
+
+def test_jsonl(tmp_path, capsys):
+    path = tmp_path / 'fingerprint.jsonl'
+    lines = [
+        json.dumps({'url': 'http://a.com', 'cms': 'Apache,PHP'}),
+        '',
+        json.dumps({'target': 'https://b.com:8443'}),
+        '{"url": broken',
+        json.dumps(['not', 'an', 'object']),
+        json.dumps({'cms': 'no url'}),
+        json.dumps({'url': ' http://c.com ', 'cms': '', 'fingerprint': [' nginx ']}),
+        json.dumps({'url': 'http://d.com', 'fingerprint': ['IIS', 'ASP.NET']}),
+    ]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    assert list(read_records(str(path))) == EXPECTED + [('http://d.com', 'IIS,ASP.NET')]
+    assert '第4行' in capsys.readouterr().out
+
+
+def test_identical_fingerprints_share_one_string(tmp_path):
+    path = str(tmp_path / 'fingerprint.csv')
+    write_csv(path, [('http://a.com', 'Apache,PHP'), ('http://b.com', 'Apache,PHP')])
+    (_, first), (_, second) = read_records(path)
+    assert first is second
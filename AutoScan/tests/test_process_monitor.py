@@ -0,0 +1,46 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+进程监控：等待指定的子进程结束并返回退出码
+"""
+import subprocess
+import sys
+
+import pytest
+
+from ProcessMonitor import ProcessMonitor
+
+
+def start(code):
+    """启动一个执行指定代码的Python子进程"""
+    return subprocess.Popen([sys.executable, '-c', code])
+
+
+@pytest.mark.parametrize('timeout', [None, 10])
+def test_wait_returns_exit_code(timeout):
+    process = start('import sys; sys.exit(3)')
+    assert ProcessMonitor(process, timeout).wait() == (3, False)
+    assert process.returncode == 3
+
+
+@pytest.mark.parametrize('timeout', [None, 10])
+def test_wait_by_pid(timeout):
+    process = start('import sys; sys.exit(5)')
+    assert ProcessMonitor(process.pid, timeout).wait() == (5, False)
+
+
+def test_wait_times_out():
+    process = start('import time; time.sleep(30)')
+    try:
+        assert ProcessMonitor(process, 0.2).wait() == (None, True)
+        assert process.poll() is None
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_exited_process_is_not_waited_for():
+    process = start('pass')
+    process.wait()
+    returncode, timed_out = ProcessMonitor(process.pid, 1).wait()
+    assert not timed_out
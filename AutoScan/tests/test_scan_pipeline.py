@@ -0,0 +1,174 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式扫描流水线：EHole输出解析、攒批和空闲提交、检查点跳过、读取失败和批次失败的处理
+"""
+import sys
+import threading
+
+import pytest
+
+from Checkpoint import Checkpoint
+from TagMatcher import TagMatcher
+from ScanPipeline import ScanPipeline as Pipeline, ehole_records, parse_ehole_line
+
+
+class FakeScan():
+    """
+    代替AutoNuclei，记录每个批次而不启动nuclei
+    """
+
+    def __init__(self, tmp_path, returncode=0, workers=2):
+        self.tag_scan_workers = workers
+        self.checkpoint = Checkpoint(str(tmp_path / 'checkpoint.jsonl'))
+        self.tag_target_temp = str(tmp_path / 'tag_target_{}.txt')
+        self.unit_output = str(tmp_path / '{}_vul_{}_{}.jsonl')
+        self.returncode = returncode
+        self.units = []
+        self.lock = threading.Lock()
+
+    def tag_command(self, tags, target_file, output):
+        return ['nuclei', '-l', target_file, '-tags', ','.join(tags)]
+
+    def level_command(self, target_file, output):
+        return ['nuclei', '-l', target_file, '-s', 'high,critical']
+
+    def run_unit(self, tags, targets, cmd, output):
+        with self.lock:
+            self.units.append((tags, sorted(targets)))
+        returncode = self.returncode(tags) if callable(self.returncode) else self.returncode
+        if returncode == 0:
+            self.checkpoint.finish_unit(tags, targets)
+        return returncode
+
+
+def fake_ehole(tmp_path, lines, returncode=0):
+    """生成输出指定行后以returncode退出的命令"""
+    script = tmp_path / 'ehole.py'
+    script.write_text(
+        'import sys\n'
+        f'for line in {lines!r}:\n'
+        '    print(line)\n'
+        f'sys.exit({returncode})\n',
+        encoding='utf-8'
+    )
+    return [sys.executable, str(script)]
+
+
+@pytest.fixture
+def matcher():
+    return TagMatcher(['apache', 'tomcat', 'nginx'])
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('[ http://a.com | Apache-Tomcat | nginx | 200 | 1024 | Home ]', ('http://a.com', 'Apache-Tomcat')),
+    ('\x1b[32m[ https://b.com |  | | 403 | 0 | ]\x1b[0m', ('https://b.com', '')),
+    ('[INFO] loaded 100 fingers', None),
+    ('[ not-a-url | x ]', None),
+    ('', None),
+])
+def test_parse_ehole_line(line, expected):
+    assert parse_ehole_line(line) == expected
+
+
+def test_ehole_records_success(tmp_path):
+    done = []
+    cmd = fake_ehole(tmp_path, ['banner', '[ http://a.com | Apache | | 200 | 1 | a ]'])
+    assert list(ehole_records(cmd, on_success=lambda: done.append(True))) == [('http://a.com', 'Apache')]
+    assert done == [True]
+
+
+def test_ehole_records_failure(tmp_path):
+    done = []
+    records = ehole_records(fake_ehole(tmp_path, ['[ http://a.com | Apache | | 200 | 1 | a ]'], 2),
+                            on_success=lambda: done.append(True))
+    assert next(records) == ('http://a.com', 'Apache')
+    with pytest.raises(RuntimeError, match='返回码: 2'):
+        next(records)
+    assert done == []
+
+
+def test_ehole_failure_fails_the_pipeline(tmp_path, matcher):
+    scan = FakeScan(tmp_path)
+    pipeline = Pipeline(scan, matcher, flush_interval=60)
+    pipeline.run(ehole_records(fake_ehole(tmp_path, ['[ http://a.com | Apache | | 200 | 1 | a ]'], 1)))
+    # 已读取的记录照常扫描，但流水线不算完成
+    assert scan.units == [(['apache'], ['http://a.com'])]
+    assert pipeline.failed == []
+    assert 'EHole执行失败' in pipeline.source_error
+    assert not pipeline.succeeded
+
+
+def test_missing_ehole_fails_the_pipeline(tmp_path, matcher):
+    scan = FakeScan(tmp_path)
+    pipeline = Pipeline(scan, matcher)
+    pipeline.run(ehole_records([str(tmp_path / 'missing-ehole')]))
+    assert scan.units == []
+    assert pipeline.source_error
+    assert not pipeline.succeeded
+
+
+def test_failed_and_crashed_batches_keep_draining(tmp_path, matcher):
+    def returncode(tags):
+        if tags == ['nginx']:
+            raise OSError('disk full')
+        return 1 if tags is None else 0
+
+    scan = FakeScan(tmp_path, returncode, workers=1)
+    pipeline = Pipeline(scan, matcher, batch_size=1, flush_interval=60)
+    records = [(f'http://{n}.com', ['Nginx', 'Apache', ''][n % 3]) for n in range(12)]
+    pipeline.run(records)
+    # 出错的批次不影响后续批次，全部批次都被执行
+    assert pipeline.batch_count == 12
+    assert len(scan.units) == 12
+    assert len(pipeline.failed) == 8
+    assert pipeline.source_error is None
+    assert not pipeline.succeeded
+
+
+def test_successful_run(tmp_path, matcher):
+    scan = FakeScan(tmp_path)
+    pipeline = Pipeline(scan, matcher, flush_interval=60)
+    pipeline.run([('http://a.com', 'Apache'), ('http://b.com', 'unknown')])
+    assert sorted(scan.units, key=str) == sorted([(['apache'], ['http://a.com']), (None, ['http://b.com'])], key=str)
+    assert pipeline.succeeded
+
+
+def test_full_batches_are_split_by_batch_size(tmp_path, matcher):
+    scan = FakeScan(tmp_path, workers=1)
+    pipeline = Pipeline(scan, matcher, batch_size=2, flush_interval=60)
+    records = [(f'http://{n}.com', 'Apache') for n in range(5)] + [('http://x.com', 'nginx')]
+    pipeline.run(records)
+    assert pipeline.batch_count == 4
+    assert sorted(len(targets) for tags, targets in scan.units if tags == ['apache']) == [1, 2, 2]
+    assert (['nginx'], ['http://x.com']) in scan.units
+    assert pipeline.succeeded
+
+
+def test_idle_batch_is_flushed_before_source_ends(tmp_path, matcher):
+    scan = FakeScan(tmp_path)
+    flushed = threading.Event()
+    scan.checkpoint.finish_unit = lambda tags, targets: flushed.set()
+    pipeline = Pipeline(scan, matcher, batch_size=100, flush_interval=0.1)
+
+    def source():
+        yield 'http://a.com', 'Apache'
+        # 后续记录迟迟没有到来，未满的批次在空闲超时后提交
+        assert flushed.wait(5)
+        yield 'http://b.com', 'Apache'
+
+    pipeline.run(source())
+    assert scan.units == [(['apache'], ['http://a.com']), (['apache'], ['http://b.com'])]
+    assert pipeline.succeeded
+
+
+def test_checkpointed_targets_are_skipped(tmp_path, matcher):
+    scan = FakeScan(tmp_path)
+    scan.checkpoint.finish_unit(['apache'], ['http://a.com'])
+    scan.checkpoint.close()
+    # 恢复运行时读取上次已完成的扫描单元
+    scan.checkpoint = Checkpoint(scan.checkpoint.path, resume=True)
+    pipeline = Pipeline(scan, matcher, flush_interval=60)
+    pipeline.run([('http://a.com', 'Apache'), ('http://b.com', 'Apache')])
+    assert pipeline.skipped == 1
+    assert scan.units == [(['apache'], ['http://b.com'])]
@@ -0,0 +1,81 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+指纹标签匹配：自动机的匹配结果与逐个标签做子串判断一致
+"""
+import random
+
+import pytest
+
+from TagMatcher import TagMatcher
+
+TAGS = ['apache', 'tomcat', 'apache-tomcat', 'php', 'phpmyadmin', 'wordpress', 'wp', 'wp-plugin', 'iis',
+        'nginx', 'jira', 'a', 'ab', 'bab', 'CVE', 'spring-boot', 'boot']
+
+
+def naive(tags, text):
+    """逐个标签做子串判断"""
+    text = str(text).lower()
+    return {tag.lower() for tag in tags if tag and tag.lower() in text}
+
+
+@pytest.mark.parametrize('text', [
+    'Apache-Tomcat/9.0',
+    '[ Apache , PHP/7.4 , phpMyAdmin ]',
+    'WordPress,wp-plugin-akismet',
+    'Microsoft-IIS/10.0',
+    'Spring-Boot',
+    'ababab',
+    'nothing here',
+    '',
+    12345,
+])
+def test_matches_naive_substring_search(text):
+    assert TagMatcher(TAGS).match(text) == naive(TAGS, text)
+
+
+def test_random_fingerprints():
+    rng = random.Random(0)
+    alphabet = 'abcpt-,/ '
+    tags = [''.join(rng.choice('abcpt-') for _ in range(rng.randint(1, 4))) for _ in range(40)]
+    matcher = TagMatcher(tags)
+    for _ in range(500):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        assert matcher.match(text) == naive(tags, text)
+
+
+def test_no_tags():
+    assert TagMatcher([]).match('apache') == set()
+    assert TagMatcher(['']).match('apache') == set()
+
+
+def test_duplicate_and_mixed_case_tags():
+    assert TagMatcher(['Apache', 'apache', 'APACHE']).match('apache httpd') == {'apache'}
+
+
+def test_build_index():
+    matcher = TagMatcher(TAGS)
+    index, unmatched = matcher.build_index([
+        ('http://a', 'Apache-Tomcat'),
+        ('http://b', 'nginx'),
+        ('http://c', ''),
+        ('http://d', None),
+        ('http://e', 'unknown-server'),
+        ('http://f', 'nginx,PHP'),
+    ])
+    assert index == {
+        'apache': {'http://a'}, 'tomcat': {'http://a'}, 'apache-tomcat': {'http://a'}, 'a': {'http://a'},
+        'nginx': {'http://b', 'http://f'}, 'php': {'http://f'},
+    }
+    assert unmatched == ['http://c', 'http://d', 'http://e']
+
+
+def test_segment_cache_is_bounded():
+    matcher = TagMatcher(TAGS, cache_size=2)
+    assert matcher.match('apache') == {'apache', 'a'}
+    matcher.match('nginx')
+    matcher.match('apache')  # 最近使用，保留
+    matcher.match('jira')
+    assert list(matcher.cache) == ['apache', 'jira']
+    assert matcher.match('nginx') == {'nginx'}
+    assert len(matcher.cache) == 2
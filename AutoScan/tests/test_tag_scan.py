@@ -0,0 +1,90 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+标签扫描：目标集合相同的标签合并为一组，各组并行执行，全部成功后才记录阶段完成
+"""
+import threading
+
+import pytest
+
+from AutoScan import AutoNuclei
+from Checkpoint import Checkpoint
+
+
+def make_scan(tmp_path, tags_scan_target, returncode=0, resume=False):
+    """不执行完整流程，只设置标签扫描需要的属性"""
+    scan = AutoNuclei.__new__(AutoNuclei)
+    scan.nuclei_path = 'nuclei'
+    scan.templates_dir = 'nuclei-templates'
+    scan.tag_target_temp = str(tmp_path / 'tag_target_{}.txt')
+    scan.unit_output = str(tmp_path / '{}_vul_{}_{}.jsonl')
+    scan.tag_scan_workers = 4
+    scan.tags_scan_target = tags_scan_target
+    scan.checkpoint = Checkpoint(str(tmp_path / 'checkpoint.jsonl'), resume)
+    scan.units = []
+    scan.running = 0
+    scan.peak = 0
+    lock = threading.Lock()
+
+    def run_unit(tags, targets, cmd, output):
+        with lock:
+            scan.running += 1
+            scan.peak = max(scan.peak, scan.running)
+        with open(cmd[cmd.index('-l') + 1], encoding='utf-8') as f:
+            written = f.read().split()
+        threading.Event().wait(0.05)
+        with lock:
+            scan.running -= 1
+            scan.units.append((tags, targets, written, cmd[cmd.index('-tags') + 1]))
+        code = returncode(tags) if callable(returncode) else returncode
+        if code == 0:
+            scan.checkpoint.finish_unit(tags, targets)
+        return code
+
+    scan.run_unit = run_unit
+    return scan
+
+
+TARGETS = {
+    'apache': {'http://a.com', 'http://b.com'},
+    'tomcat': {'http://b.com', 'http://a.com'},
+    'nginx': {'http://c.com'},
+    'iis': {'http://d.com'},
+}
+
+
+def test_tags_with_same_targets_share_one_run(tmp_path):
+    scan = make_scan(tmp_path, TARGETS)
+    scan.tag_scan()
+    units = sorted(scan.units)
+    assert units == [
+        (['apache', 'tomcat'], ['http://a.com', 'http://b.com'], ['http://a.com', 'http://b.com'], 'apache,tomcat'),
+        (['iis'], ['http://d.com'], ['http://d.com'], 'iis'),
+        (['nginx'], ['http://c.com'], ['http://c.com'], 'nginx'),
+    ]
+    # 各组并行执行
+    assert scan.peak > 1
+    assert scan.checkpoint.stage_done('tag_scan')
+
+
+def test_failed_group_keeps_stage_open(tmp_path):
+    scan = make_scan(tmp_path, TARGETS, returncode=lambda tags: 1 if tags == ['nginx'] else 0)
+    scan.tag_scan()
+    assert len(scan.units) == 3
+    assert not scan.checkpoint.stage_done('tag_scan')
+
+    # 恢复运行时只重新扫描失败的组
+    scan.checkpoint.close()
+    resumed = make_scan(tmp_path, TARGETS, resume=True)
+    resumed.tag_scan()
+    assert [unit[0] for unit in resumed.units] == [['nginx']]
+    assert resumed.checkpoint.stage_done('tag_scan')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_worker_limit(tmp_path, workers):
+    scan = make_scan(tmp_path, TARGETS)
+    scan.tag_scan_workers = workers
+    scan.tag_scan()
+    assert scan.peak <= workers
+    assert len(scan.units) == 3
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+AssetCollection服务和AutoScan共用的代码
+
+安装（在仓库根目录执行）:
+    pip install -e .
+"""
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+nuclei模板索引的构建和缓存，AssetCollection服务和AutoScan共用
+
+扫描nuclei-templates目录，记录 模板ID->路径、标签->模板ID、风险等级->模板ID 的映射，
+并以压缩的二进制文件缓存，模板目录的签名与缓存中的一致时直接读取缓存。
+本模块只依赖标准库，两个项目通过将仓库根目录加入sys.path导入。
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+# 索引格式版本，格式或签名变化时旧的缓存文件失效
+INDEX_VERSION = 2
+
+# 只读取模板开头的这些字节解析id和info，避免读取完整的请求定义
+HEADER_BYTES = 8192
+
+STATS_FILE = "TEMPLATES-STATS.json"
+CHECKSUM_FILE = "templates-checksum.txt"
+
+_ID_PATTERN = re.compile(r"^id:\s*['\"]?([^\s'\"#]+)", re.MULTILINE)
+_SEVERITY_PATTERN = re.compile(r"^\s+severity:\s*['\"]?(\w+)", re.MULTILINE)
+_TAGS_PATTERN = re.compile(r"^\s+tags:\s*['\"]?([^'\"\n#]+)", re.MULTILINE)
+
+# (模板ID -> 相对路径, 标签 -> 模板ID列表, 风险等级 -> 模板ID列表)
+IndexData = Tuple[Dict[str, str], Dict[str, List[str]], Dict[str, List[str]]]
+
+
+def parse_template_header(text: str) -> Optional[Tuple[str, str, List[str]]]:
+    """从模板开头解析(模板ID, 风险等级, 标签列表)，不是模板时返回None"""
+    match = _ID_PATTERN.search(text)
+    if match is None:
+        return None
+    severity = _SEVERITY_PATTERN.search(text)
+    tags = _TAGS_PATTERN.search(text)
+    return (
+        match.group(1),
+        severity.group(1).lower() if severity else "unknown",
+        [tag.strip().lower() for tag in tags.group(1).split(",") if tag.strip()] if tags else []
+    )
+
+
+def _walk_templates(template_dir: str):
+    """遍历模板目录下的模板文件（跳过 .git、.github 等隐藏目录），返回(路径, stat)"""
+    pending = [template_dir]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.name.endswith((".yaml", ".yml")):
+                    yield entry.path, entry.stat()
+            except OSError:
+                continue
+
+
+def signature(template_dir: str) -> Optional[Tuple]:
+    """
+    计算模板目录的签名，目录不存在时返回None
+
+    签名包含统计文件的修改时间和大小、校验和文件内容的摘要，以及全部模板文件的数量和最大修改时间，
+    nuclei -ut 更新模板或直接修改子目录中的模板后签名都会变化
+    """
+    if not os.path.isdir(template_dir):
+        return None
+    parts = [INDEX_VERSION, os.path.abspath(template_dir)]
+    try:
+        stat = os.stat(os.path.join(template_dir, STATS_FILE))
+        parts.append((STATS_FILE, stat.st_mtime_ns, stat.st_size))
+    except OSError:
+        parts.append((STATS_FILE, None, None))
+    digest = hashlib.sha1()
+    try:
+        with open(os.path.join(template_dir, CHECKSUM_FILE), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        parts.append((CHECKSUM_FILE, digest.hexdigest()))
+    except OSError:
+        parts.append((CHECKSUM_FILE, None))
+    count = 0
+    latest = 0
+    for _, stat in _walk_templates(template_dir):
+        count += 1
+        latest = max(latest, stat.st_mtime_ns)
+    parts.append(("templates", count, latest))
+    return tuple(parts)
+
+
+def stats_tags(template_dir: str) -> Set[str]:
+    """读取模板统计文件中的全部标签"""
+    try:
+        with open(os.path.join(template_dir, STATS_FILE), 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+        return {str(item["name"]).lower() for item in stats.get("tags", []) if item.get("name")}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+
+def build(template_dir: str) -> IndexData:
+    """
+    扫描模板目录，解析每个模板的ID、风险等级和标签
+    模板目录中没有模板文件（只有统计文件）时，至少保留统计文件中的标签
+    """
+    paths: Dict[str, str] = {}
+    tag_index: Dict[str, List[str]] = {}
+    severity_index: Dict[str, List[str]] = {}
+    for path, _ in sorted(_walk_templates(template_dir)):
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                header = parse_template_header(f.read(HEADER_BYTES))
+        except OSError:
+            continue
+        if header is None:
+            continue
+        template_id, severity, tags = header
+        paths[template_id] = os.path.relpath(path, template_dir)
+        severity_index.setdefault(severity, []).append(template_id)
+        for tag in tags:
+            tag_index.setdefault(tag, []).append(template_id)
+
+    if not paths:
+        for tag in stats_tags(template_dir):
+            tag_index.setdefault(tag, [])
+    return paths, tag_index, severity_index
+
+
+def load_cache(path: str, expected: Tuple) -> Optional[IndexData]:
+    """读取签名与expected一致的缓存文件，不存在、损坏或已过期时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            cached_signature, data = pickle.loads(zlib.decompress(f.read()))
+    except (OSError, ValueError, TypeError, zlib.error, pickle.UnpicklingError, EOFError):
+        return None
+    return data if cached_signature == expected else None
+
+
+def save_cache(path: str, current: Tuple, data: IndexData) -> None:
+    """写入缓存文件，先写临时文件再替换，避免其他进程读到不完整的文件；写入失败时抛出OSError"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.part"
+    with open(temp_path, 'wb') as f:
+        f.write(zlib.compress(pickle.dumps((current, data), protocol=pickle.HIGHEST_PROTOCOL)))
+    os.replace(temp_path, path)
+
+
+def load(template_dir: str, cache_path: str, current: Optional[Tuple] = None) -> Tuple[Tuple, IndexData]:
+    """
+    加载模板索引，缓存有效时直接读取，否则重新构建并写入缓存
+    :return: (签名, 索引数据)
+    """
+    if current is None:
+        current = signature(template_dir)
+    data = load_cache(cache_path, current)
+    if data is None:
+        data = build(template_dir)
+        try:
+            save_cache(cache_path, current, data)
+        except OSError as e:
+            print(f"写入模板索引缓存失败: {str(e)}")
+    return current, data